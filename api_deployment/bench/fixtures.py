@@ -0,0 +1,238 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+
+# Query parameters that carry credentials or per-visit noise; left out of keys and never written to fixtures
+SECRET_PARAMS = {"key", "api_key", "apikey", "access_token", "visitor_id", "_"}
+# JSON response fields replaced before a recording is written (Kroger OAuth tokens)
+SECRET_FIELDS = {"access_token", "refresh_token", "id_token"}
+# Recorded response headers worth keeping for replay
+KEPT_HEADERS = ("content-type", "content-range", "retry-after")
+
+
+class FixtureMiss(requests.ConnectionError):
+    """A replayed run made a call that was never recorded."""
+
+
+def _clean_url(url: str, keep_host: bool = True) -> str:
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in SECRET_PARAMS)
+    if not keep_host:
+        # Supabase project URLs differ between the recording and CI; only the REST path matters
+        return urlunsplit(("", "", parts.path, urlencode(query), ""))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _scrub(content: bytes) -> bytes:
+    """Blank out SECRET_FIELDS in a JSON object body; anything else is returned unchanged."""
+    if not any(field.encode() in content for field in SECRET_FIELDS):
+        return content
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(body, dict):
+        return content
+    return json.dumps({key: "recorded" if key in SECRET_FIELDS else value for key, value in body.items()}).encode("utf-8")
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+
+
+def _body_bytes(body: Any) -> bytes:
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    return json.dumps(body, sort_keys=True).encode("utf-8")
+
+
+class LatencyModel:
+    """
+    How long a replayed call takes.
+
+    By default each call sleeps for the latency measured when it was recorded, times
+    scale. fixed_ms overrides that per fixture kind ("http", "postgrest", "gemini_sdk",
+    "google_search"), and sigma adds seeded lognormal jitter so runs are repeatable.
+    """
+
+    def __init__(self, scale: float = 1.0, fixed_ms: Optional[Dict[str, float]] = None, sigma: float = 0.0, seed: int = 1):
+        self.scale = scale
+        self.fixed_ms = fixed_ms or {}
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, kind: str, recorded_ms: float) -> float:
+        milliseconds = self.fixed_ms.get(kind, recorded_ms * self.scale)
+        if self.sigma and milliseconds > 0:
+            with self._lock:
+                milliseconds *= self._random.lognormvariate(-self.sigma ** 2 / 2, self.sigma)
+        return max(0.0, milliseconds) / 1000
+
+    def sleep(self, kind: str, recorded_ms: float) -> None:
+        seconds = self.delay(kind, recorded_ms)
+        if seconds:
+            time.sleep(seconds)
+
+
+class FixtureStore:
+    """
+    Recorded responses for every external call the API makes, in one JSON file.
+
+    In "record" mode calls go out for real and their responses and latencies are
+    stored; in "replay" mode they are answered from the file after the latency the
+    LatencyModel prescribes, and a call with no recording raises FixtureMiss.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency: Optional[LatencyModel] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown fixture mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency or LatencyModel()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.misses: List[str] = []
+        self.hits = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f).get("entries", {})
+        elif mode == "replay":
+            raise FileNotFoundError(f"No fixtures at {path}; record them first with --mode record")
+
+    def call(self, kind: str, key: str, description: Dict[str, Any], live: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the recorded response for key, recording live() first in record mode."""
+        if self.mode == "replay":
+            entry = self.entries.get(key)
+            if entry is None:
+                with self._lock:
+                    self.misses.append(f"{kind} {description}")
+                raise FixtureMiss(f"No recorded {kind} response for {description}")
+            with self._lock:
+                self.hits += 1
+            self.latency.sleep(kind, entry["latency_ms"])
+            return entry["response"]
+
+        start = time.perf_counter()
+        response = live()
+        entry = {
+            "kind": kind,
+            "request": description,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "response": response,
+        }
+        with self._lock:
+            self.entries[key] = entry
+        return response
+
+    def save(self) -> None:
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(temporary_path, "w") as f:
+                json.dump({"version": 1, "entries": self.entries}, f, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    # requests (Gemini REST, Kroger, Target, recipe pages)
+
+    def requests_call(self, send: Callable, session, method: str, url: str, **kwargs) -> requests.Response:
+        prepared = requests.Request(method, url, params=kwargs.get("params"), data=kwargs.get("data"),
+                                    json=kwargs.get("json")).prepare()
+        clean_url = _clean_url(prepared.url)
+        key = _digest("http", method.upper(), clean_url, hashlib.sha256(_body_bytes(prepared.body)).hexdigest())
+
+        def live():
+            response = send(session, method, url, **kwargs)
+            return {
+                "status": response.status_code,
+                "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+                "body": base64.b64encode(_scrub(response.content)).decode("ascii"),
+            }
+
+        recorded = self.call("http", key, {"method": method.upper(), "url": clean_url}, live)
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers.update(recorded["headers"])
+        response._content = base64.b64decode(recorded["body"])
+        response._content_consumed = True
+        response.url = prepared.url
+        response.request = prepared
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    # httpx (the Supabase PostgREST client)
+
+    def httpx_transport(self, inner: httpx.BaseTransport) -> httpx.BaseTransport:
+        store = self
+
+        class FixtureTransport(httpx.BaseTransport):
+            def handle_request(self, request: httpx.Request) -> httpx.Response:
+                body = request.read()
+                clean_url = _clean_url(str(request.url), keep_host=False)
+                key = _digest("postgrest", request.method, clean_url, hashlib.sha256(body).hexdigest(),
+                              request.headers.get("prefer", ""))
+
+                def live():
+                    response = inner.handle_request(request)
+                    content = response.read()
+                    return {
+                        "status": response.status_code,
+                        "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+                        "body": base64.b64encode(content).decode("ascii"),
+                    }
+
+                recorded = store.call("postgrest", key, {"method": request.method, "url": clean_url}, live)
+                return httpx.Response(recorded["status"], headers=recorded["headers"],
+                                      content=base64.b64decode(recorded["body"]), request=request)
+
+            def close(self) -> None:
+                inner.close()
+
+        return FixtureTransport()
+
+    # Gemini SDK and Google search
+
+    def gemini_generate(self, send: Callable, model: str, prompt: str, timeout: float) -> str:
+        key = _digest("gemini_sdk", model, prompt)
+        recorded = self.call("gemini_sdk", key, {"model": model, "prompt": prompt[:120]},
+                             lambda: {"text": send(model, prompt, timeout)})
+        return recorded["text"]
+
+    def gemini_stream(self, open_stream: Callable, model: str, prompt: str, timeout: float):
+        key = _digest("gemini_sdk_stream", model, prompt)
+
+        def live():
+            first, stream = open_stream(model, prompt, timeout)
+            chunks = [first.text or ""] + [chunk.text or "" for chunk in stream]
+            return {"chunks": chunks}
+
+        chunks = [SimpleNamespace(text=text) for text in
+                  self.call("gemini_sdk", key, {"model": model, "prompt": prompt[:120], "stream": True}, live)["chunks"]]
+        return chunks[0], iter(chunks[1:])
+
+    def google_search(self, search: Callable, query: str, num_results: int = 10, **kwargs) -> List[str]:
+        key = _digest("google_search", query, num_results)
+        return self.call("google_search", key, {"query": query},
+                         lambda: {"links": list(search(query, num_results=num_results, **kwargs))})["links"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
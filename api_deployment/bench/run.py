@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Offline API benchmark with recorded upstream fixtures.
+
+Drives the FastAPI app in-process (httpx ASGI transport) at a fixed concurrency and
+reports throughput and p50/p95/p99 latency per scenario. Every external call goes
+through bench.fixtures.FixtureStore:
+
+    requests (PooledSession)   Gemini REST, api.kroger.com, redsky.target.com, recipe pages
+    httpx (PostgREST client)   Supabase, or a local Supabase/Postgres stack while recording
+    RecipeProvider             Gemini SDK generate and stream calls
+    googlesearch               Google search results
+
+Record once with real credentials (point SUPABASE_PROJECT_URL at a local stack to keep
+production data out of the fixtures), then replay anywhere without network or quota.
+Replayed calls sleep for their recorded latency times --latency-scale, or a fixed
+--latency-ms per fixture kind.
+
+Usage:
+    python -m bench.run --mode record
+    python -m bench.run                                         # replay
+    python -m bench.run --latency-ms gemini_sdk=800 --latency-ms http=150 --concurrency 16
+    python -m bench.run --save-baseline bench/baseline.json      # after a known-good run
+    python -m bench.run --baseline bench/baseline.json --max-regression 0.25   # CI gate
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fixtures import FixtureStore, LatencyModel, percentile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, "fixtures", "recorded.json")
+
+# (method, path, payloads); payloads are used in rotation
+SCENARIOS = {
+    "health": ("GET", "/health", [None]),
+    "recipes": ("GET", "/recipes", [{"limit": 10}, {"limit": 10, "sort_type": "popular", "comments": "count"}]),
+    "recipes_search": ("GET", "/recipes", [{"search": "chicken", "limit": 10, "comments": "none"},
+                                           {"search": "pasta", "limit": 10, "comments": "none"}]),
+    "featured_recipes": ("GET", "/featuredRecipes", [None]),
+    "generate_recipe": ("POST", "/generate-recipe", [{"query": "chicken tikka masala"}, {"query": "quick dinner ideas"},
+                                                     {"query": "banana bread"}, {"query": "spaghetti carbonara"}]),
+    "generate_recipe_stream": ("POST", "/generate-recipe/stream", [{"query": "pad thai"}, {"query": "healthy breakfast"}]),
+    "shopping_list": ("POST", "/shoppingList", [{"ingredients": [
+        {"name": "all-purpose flour", "amount": 2, "unit": "cups"}, {"name": "eggs", "amount": 3, "unit": ""},
+        {"name": "unsalted butter", "amount": 0.5, "unit": "cup"}, {"name": "gochujang", "amount": 2, "unit": "tbsp"},
+        {"name": "scallions", "amount": 4, "unit": ""}, {"name": "flour", "amount": 1, "unit": "cup"},
+    ]}]),
+    "ingredients": ("POST", "/ingredients", [{"ingredient": "carrots", "amount": 16, "unit": "ounces"},
+                                             {"ingredient": "milk", "amount": 1, "unit": "pounds"}]),
+    "ingredients_bulk": ("POST", "/ingredients/bulk", [{"zip_code": "47906", "ingredients": [
+        {"name": "carrots", "amount": 16, "unit": "ounces"}, {"name": "milk", "amount": 32, "unit": "ounces"},
+        {"name": "tofu", "amount": 14, "unit": "ounces"},
+    ]}]),
+    "scrape_ingredients": ("POST", "/scrapeIngredients", [{"product_name": "carrots", "zip_code": "47906"}]),
+}
+
+
+def configure_environment(mode: str, caches: bool) -> None:
+    """Settings that make runs repeatable; must happen before the app is imported."""
+    if not caches:
+        # Otherwise every repeated payload after the first is a cache hit
+        os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+        os.environ.setdefault("RECIPE_CACHE_ENABLED", "0")
+    # Start each run with no Kroger store locations, and keep background reloads out of the measured calls
+    os.environ.setdefault("KROGER_LOCATION_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "kroger_locations.json"))
+    os.environ.setdefault("PRODUCT_INDEX_REFRESH_SECONDS", "1e9")
+    os.environ.setdefault("PRODUCT_INDEX_FULL_RELOAD_SECONDS", "1e9")
+    os.environ.setdefault("RECIPE_CACHE_RELOAD_SECONDS", "1e9")
+    # Always wait for the query rewrite: whether the raw or rewritten search runs would
+    # otherwise depend on thread timing, and replays would ask for searches never recorded
+    os.environ.setdefault("QUERY_REWRITE_BUDGET_SECONDS", "60")
+    if mode == "replay":
+        # Nothing leaves the process, so the credentials only need to be well formed
+        os.environ.setdefault("GEMINI_API_KEY", "replay")
+        os.environ.setdefault("SUPABASE_PROJECT_URL", "http://supabase.replay")
+        os.environ.setdefault("SUPABASE_PROJECT_API", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.replay")
+        os.environ.setdefault("KROGER_CLIENT_ID", "replay")
+        os.environ.setdefault("KROGER_CLIENT_SECRET", "replay")
+        # Our own Gemini quota limiter would otherwise throttle replays that no longer cost quota
+        os.environ.setdefault("GEMINI_REQUESTS_PER_MINUTE", "1000000")
+        os.environ.setdefault("GEMINI_BURST", "1000000")
+
+
+def install(store: FixtureStore) -> None:
+    """Route every external call the app makes through store."""
+    import db.supabaseWrapper as supabaseWrapper
+    import src.recipe_scraper as recipe_scraper
+    from src.http_session import PooledSession
+    from src.recipe_provider import RecipeProvider
+
+    send_request = PooledSession.request
+    PooledSession.request = lambda session, method, url, **kwargs: store.requests_call(
+        send_request, session, method, url, **kwargs
+    )
+
+    send_generate = RecipeProvider._send_generate_content
+    RecipeProvider._send_generate_content = lambda provider, model, prompt, timeout: store.gemini_generate(
+        functools.partial(send_generate, provider), model, prompt, timeout
+    )
+    open_stream = RecipeProvider._open_stream
+    RecipeProvider._open_stream = lambda provider, model, prompt, timeout: store.gemini_stream(
+        functools.partial(open_stream, provider), model, prompt, timeout
+    )
+
+    search = recipe_scraper.search
+    recipe_scraper.search = lambda query, num_results=10, **kwargs: store.google_search(search, query, num_results, **kwargs)
+
+    session = supabaseWrapper.supabase.postgrest.session
+    session._transport = store.httpx_transport(session._transport)
+
+
+def has_error_event(content: bytes) -> bool:
+    """True if a Server-Sent Events body contains an error event (see server.sse_event)."""
+    return any(line.strip() == b"event: error" for line in content.splitlines())
+
+
+async def run_scenario(client, method, path, payloads, concurrency, total_requests, warmup):
+    async def one(index):
+        payload = payloads[index % len(payloads)]
+        start = time.perf_counter()
+        try:
+            if method == "GET":
+                response = await client.get(path, params=payload)
+            else:
+                response = await client.post(path, json=payload)
+            ok = response.status_code < 400 and not has_error_event(response.content)
+        except Exception as e:
+            print(f"{method} {path} failed: {type(e).__name__}: {e}")
+            ok = False
+        return time.perf_counter() - start, ok
+
+    for index in range(warmup):
+        await one(index)
+
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for index in range(total_requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            latency, ok = await one(queue.get_nowait())
+            latencies.append(latency)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def compare(results, baseline, max_regression, min_delta_ms):
+    """Return the regressions of results against baseline, as messages."""
+    failures = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if result["errors"]:
+            failures.append(f"{name}: {result['errors']} failed requests")
+        if reference is None:
+            continue
+        for field in ("p50_ms", "p95_ms", "p99_ms"):
+            # Sub-millisecond scenarios would otherwise fail on scheduler noise
+            if result[field] > reference[field] * (1 + max_regression) and result[field] - reference[field] > min_delta_ms:
+                failures.append(f"{name}: {field} {result[field]} > baseline {reference[field]} (+{max_regression:.0%})")
+        if (result["throughput_rps"] < reference["throughput_rps"] * (1 - max_regression)
+                and result["p50_ms"] - reference["p50_ms"] > min_delta_ms):
+            failures.append(f"{name}: throughput {result['throughput_rps']} rps < baseline {reference['throughput_rps']}")
+    return failures
+
+
+async def main_async(args, store):
+    import httpx
+    from server import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport doesn't send lifespan events, so run the app's startup (recipe cache load) directly
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+        print(f"{'scenario':24} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name in args.scenarios:
+            method, path, payloads = SCENARIOS[name]
+            result = await run_scenario(client, method, path, payloads, args.concurrency, args.requests, args.warmup)
+            results[name] = result
+            print(f"{name:24} {result['throughput_rps']:8.2f} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} "
+                  f"{result['p99_ms']:9.1f} {result['errors']:7}")
+    return results
+
+
+def parse_latency(values):
+    fixed = {}
+    for value in values or []:
+        kind, _, milliseconds = value.partition("=")
+        fixed[kind] = float(milliseconds)
+    return fixed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("replay", "record"), default="replay")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Fixture file to replay from or record into")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per scenario")
+    parser.add_argument("--requests", type=int, default=64, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=4, help="Unmeasured requests per scenario first")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded upstream latencies")
+    parser.add_argument("--latency-ms", action="append", metavar="KIND=MS",
+                        help="Fixed replay latency for a fixture kind (http, postgrest, gemini_sdk, google_search)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Lognormal sigma applied to replay latencies")
+    parser.add_argument("--caches", action="store_true", help="Keep the LLM and recipe caches on")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as the new baseline")
+    parser.add_argument("--baseline", help="Fail if results regress against this baseline")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore latency increases smaller than this")
+    args = parser.parse_args()
+
+    configure_environment(args.mode, args.caches)
+    latency = LatencyModel(scale=args.latency_scale, fixed_ms=parse_latency(args.latency_ms), sigma=args.jitter)
+    store = FixtureStore(args.fixtures, args.mode, latency)
+    install(store)
+
+    results = asyncio.run(main_async(args, store))
+    store.save()
+    if args.mode == "record":
+        print(f"Recorded {len(store.entries)} fixtures into {args.fixtures}")
+    else:
+        print(f"Replayed {store.hits} calls; {len(store.misses)} had no fixture")
+        for miss in sorted(set(store.misses))[:20]:
+            print(f"  missing: {miss}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        else:
+            # Failed requests and fixture misses still fail the run
+            print(f"No baseline at {args.baseline}; only checking for errors (save one with --save-baseline)")
+            baseline = {}
+        failures = compare(results, baseline, args.max_regression, args.min_delta_ms)
+        if store.misses:
+            failures.append(f"{len(store.misses)} calls had no recorded fixture")
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+-- Full-text and fuzzy search over recipes.
+--
+-- Adds a weighted tsvector (title > tags/cuisine > ingredient names) and a lowercase
+-- trigram text column, both maintained by a trigger so every insert through
+-- supabaseWrapper.create_recipe is searchable immediately, plus the RPC functions
+-- called by supabaseWrapper.get_recipes / count_recipes / search_recipe.
+--
+-- Apply with the Supabase SQL editor or: psql "$DATABASE_URL" -f db/migrations/001_recipe_search.sql
+
+create extension if not exists pg_trgm;
+
+alter table recipes add column if not exists search_document tsvector;
+alter table recipes add column if not exists search_text text;
+
+create or replace function recipes_search_document_refresh()
+returns trigger
+language plpgsql
+as $$
+declare
+    tag_text text;
+    ingredient_text text;
+begin
+    -- tags may be a text[] or a jsonb array; ingredients is a list of {"name": ...} objects
+    select coalesce(string_agg(tag, ' '), '') into tag_text
+    from jsonb_array_elements_text(
+        case when jsonb_typeof(to_jsonb(new.tags)) = 'array' then to_jsonb(new.tags) else '[]'::jsonb end
+    ) as tag;
+
+    select coalesce(string_agg(ingredient ->> 'name', ' '), '') into ingredient_text
+    from jsonb_array_elements(
+        case when jsonb_typeof(to_jsonb(new.ingredients)) = 'array' then to_jsonb(new.ingredients) else '[]'::jsonb end
+    ) as ingredient;
+
+    new.search_text := lower(concat_ws(' ', new.title, new.cuisine, tag_text, ingredient_text));
+    new.search_document :=
+        setweight(to_tsvector('english', coalesce(new.title, '')), 'A')
+        || setweight(to_tsvector('english', concat_ws(' ', tag_text, new.cuisine)), 'B')
+        || setweight(to_tsvector('english', ingredient_text), 'C');
+    return new;
+end;
+$$;
+
+drop trigger if exists recipes_search_document on recipes;
+create trigger recipes_search_document
+    before insert or update of title, cuisine, tags, ingredients on recipes
+    for each row execute function recipes_search_document_refresh();
+
+-- Backfill existing rows (fires the trigger)
+update recipes set title = title;
+
+create index if not exists recipes_search_document_idx on recipes using gin (search_document);
+create index if not exists recipes_search_text_trgm_idx on recipes using gin (search_text gin_trgm_ops);
+
+-- Ranked search. Rows match on the full-text query or, for typos and partial words, on
+-- trigram word similarity. Ranking combines cover-density rank (length normalized, so it
+-- behaves like a saturating BM25 term score) with the fuzzy similarity. sort_type breaks ties.
+create or replace function search_recipes(
+    search_term text,
+    result_limit integer default 10,
+    result_offset integer default 0,
+    sort_type text default 'newest'
+)
+returns setof recipes
+language sql
+stable
+as $$
+    with q as (
+        select websearch_to_tsquery('english', search_term) as ts_query,
+               lower(trim(search_term)) as term
+    )
+    select r.*
+    from recipes r, q
+    where r.search_document @@ q.ts_query
+       or q.term <% r.search_text
+    order by
+        ts_rank_cd(r.search_document, q.ts_query, 32) + word_similarity(q.term, r.search_text) desc,
+        case when sort_type = 'popular' then r.likes end desc nulls last,
+        case when sort_type = 'oldest' then r.created_at end asc,
+        case when sort_type = 'newest' then r.created_at end desc,
+        r.id desc
+    limit result_limit
+    offset result_offset;
+$$;
+
+create or replace function search_recipes_count(search_term text)
+returns bigint
+language sql
+stable
+as $$
+    select count(*)
+    from recipes r
+    where r.search_document @@ websearch_to_tsquery('english', search_term)
+       or lower(trim(search_term)) <% r.search_text;
+$$;
@@ -0,0 +1,21 @@
+-- One row per (provider, brand, itemName) so scrapes can be written with a single upsert.
+--
+-- supabaseWrapper.upsert_products relies on this constraint for
+-- on_conflict=provider,brand,itemName. Existing duplicates are collapsed onto the
+-- most recently inserted row first, since that carries the latest price.
+--
+-- Apply with the Supabase SQL editor or: psql "$DATABASE_URL" -f db/migrations/002_products_unique_key.sql
+
+begin;
+
+delete from products p
+using products newer
+where newer.provider = p.provider
+  and newer.brand = p.brand
+  and newer."itemName" = p."itemName"
+  and newer.id > p.id;
+
+alter table products
+    add constraint products_provider_brand_item_name_key unique (provider, brand, "itemName");
+
+commit;
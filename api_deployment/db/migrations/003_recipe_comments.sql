@@ -0,0 +1,47 @@
+-- Comment counts and per-recipe comment pages for a page of recipes.
+--
+-- supabaseWrapper.attach_comments used to fetch every comment row of the page with one
+-- unpaginated in() query, which PostgREST silently truncates at max-rows (1000 on
+-- Supabase), and then counted and limited the comments in Python. The counts are now
+-- grouped in the database, and recipe_comments_page applies the per-recipe limit and
+-- pages its result with result_limit/result_offset like search_recipes.
+--
+-- Apply with the Supabase SQL editor or: psql "$DATABASE_URL" -f db/migrations/003_recipe_comments.sql
+
+create index if not exists comments_recipe_id_id_idx on comments (recipe_id, id);
+
+create or replace function recipe_comment_counts(recipe_ids bigint[])
+returns table (recipe_id bigint, comment_count bigint)
+language sql
+stable
+as $$
+    select c.recipe_id, count(*)
+    from comments c
+    where c.recipe_id = any(recipe_ids)
+    group by c.recipe_id;
+$$;
+
+-- The first per_recipe comments (oldest first) of each recipe; a null per_recipe returns all of them
+create or replace function recipe_comments_page(
+    recipe_ids bigint[],
+    per_recipe integer default null,
+    result_limit integer default 1000,
+    result_offset integer default 0
+)
+returns setof comments
+language sql
+stable
+as $$
+    select c.*
+    from unnest(recipe_ids) as r(id)
+    cross join lateral (
+        select *
+        from comments
+        where comments.recipe_id = r.id
+        order by comments.id
+        limit per_recipe
+    ) c
+    order by c.recipe_id, c.id
+    limit result_limit
+    offset result_offset;
+$$;
@@ -0,0 +1,259 @@
+import bisect
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+# Seconds between incremental refreshes (rows with a higher id than we have seen)
+REFRESH_INTERVAL_SECONDS = float(os.environ.get("PRODUCT_INDEX_REFRESH_SECONDS", "30"))
+# Seconds between full reloads, which pick up edited and deleted rows
+FULL_RELOAD_INTERVAL_SECONDS = float(os.environ.get("PRODUCT_INDEX_FULL_RELOAD_SECONDS", "900"))
+# Number of distinct search terms whose per-provider lookup tables are kept
+TERM_CACHE_SIZE = int(os.environ.get("PRODUCT_INDEX_TERM_CACHE_SIZE", "1024"))
+PAGE_SIZE = 1000
+
+SEARCH_FIELDS = ("itemName", "category")
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text or "").lower()).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _ProviderLookup:
+    """
+    The products of one provider matching one term, sorted by unitAmountOz.
+
+    best_from[i] is the position of the cheapest product among sorted positions i..end,
+    so "cheapest with more than X oz" is one bisect and one list read.
+    """
+
+    __slots__ = ("amounts", "products", "best_from")
+
+    def __init__(self, products: List[dict]):
+        products = sorted(products, key=lambda product: product["unitAmountOz"])
+        self.products = products
+        self.amounts = [product["unitAmountOz"] for product in products]
+        self.best_from = [0] * len(products)
+        best = None
+        for position in range(len(products) - 1, -1, -1):
+            if best is None or products[position]["price"] < products[best]["price"]:
+                best = position
+            self.best_from[position] = best
+
+    def cheapest_above(self, minimum_amount: float) -> Optional[dict]:
+        position = bisect.bisect_right(self.amounts, minimum_amount)
+        if position == len(self.products):
+            return None
+        return self.products[self.best_from[position]]
+
+
+class ProductIndex:
+    """
+    Memory-resident index of the products table for /ingredients lookups.
+
+    A trigram index over itemName and category narrows a search term to candidate rows,
+    which are then checked with a plain substring match (the same semantics as ilike
+    '%term%'). The matches are grouped into one _ProviderLookup per provider and cached
+    per term until the next refresh, so repeat lookups never touch the database.
+
+    The index refreshes incrementally by id every REFRESH_INTERVAL_SECONDS and reloads
+    completely every FULL_RELOAD_INTERVAL_SECONDS. Refreshes run on the calling thread
+    while other threads keep answering from the current data.
+    """
+
+    def __init__(self, fetch_page: Callable[[int, int, int], List[dict]]):
+        """
+        Args:
+            fetch_page: fetch_page(after_id, start, end) returns the rows with id > after_id
+                        ordered by id, limited to the range start..end (inclusive)
+        """
+        self._fetch_page = fetch_page
+        self._products: Dict[int, dict] = {}
+        self._texts: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._terms: Dict[str, Dict[str, _ProviderLookup]] = {}
+        self._last_id = None
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def _fetch_since(self, after_id) -> Iterable[dict]:
+        start = 0
+        while True:
+            rows = self._fetch_page(after_id, start, start + PAGE_SIZE - 1)
+            yield from rows
+            if len(rows) < PAGE_SIZE:
+                return
+            start += PAGE_SIZE
+
+    def _index(self, product: dict) -> None:
+        product_id = product["id"]
+        if product_id in self._products:
+            self._unindex(product_id)
+        text = " | ".join(normalize(product.get(field)) for field in SEARCH_FIELDS)
+        self._products[product_id] = product
+        self._texts[product_id] = text
+        for gram in trigrams(text):
+            self._postings.setdefault(gram, set()).add(product_id)
+        if self._last_id is None or product_id > self._last_id:
+            self._last_id = product_id
+
+    def _unindex(self, product_id) -> None:
+        for gram in trigrams(self._texts.pop(product_id)):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(product_id)
+                if not postings:
+                    del self._postings[gram]
+        del self._products[product_id]
+
+    def add(self, products: Iterable[dict]) -> None:
+        """Index rows that were just written so they are visible before the next refresh."""
+        with self._lock:
+            for product in products:
+                if product.get("id") is not None:
+                    self._index(product)
+            self._terms.clear()
+
+    def reload(self) -> None:
+        """Rebuild the index from the whole table."""
+        rows = list(self._fetch_since(None))
+        # Build the new index off to the side so lookups aren't blocked during a reload
+        fresh = ProductIndex(self._fetch_page)
+        for row in rows:
+            fresh._index(row)
+        with self._lock:
+            self._products, self._texts, self._postings = fresh._products, fresh._texts, fresh._postings
+            self._last_id = fresh._last_id
+            self._terms.clear()
+            self._loaded_at = self._refreshed_at = time.monotonic()
+        print(f"Product index loaded {len(rows)} products")
+
+    def refresh(self) -> None:
+        """Index the rows added since the last refresh."""
+        rows = list(self._fetch_since(self._last_id))
+        with self._lock:
+            for row in rows:
+                self._index(row)
+            if rows:
+                self._terms.clear()
+            self._refreshed_at = time.monotonic()
+
+    def maybe_refresh(self) -> None:
+        now = time.monotonic()
+        if not self._loaded_at:
+            # Nothing to answer from yet, so every caller waits for the first load
+            with self._refresh_lock:
+                if not self._loaded_at:
+                    self.reload()
+            return
+        if now - self._refreshed_at < REFRESH_INTERVAL_SECONDS:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if now - self._loaded_at >= FULL_RELOAD_INTERVAL_SECONDS:
+                self.reload()
+            elif now - self._refreshed_at >= REFRESH_INTERVAL_SECONDS:
+                self.refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _lookups(self, term: str) -> Dict[str, _ProviderLookup]:
+        lookups = self._terms.get(term)
+        if lookups is not None:
+            return lookups
+        grams = trigrams(term)
+        if grams:
+            postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = self._products.keys()
+        by_provider: Dict[str, List[dict]] = {}
+        for product_id in candidates:
+            if term in self._texts[product_id]:
+                product = self._products[product_id]
+                by_provider.setdefault(product["provider"], []).append(product)
+        lookups = {provider: _ProviderLookup(products) for provider, products in by_provider.items()}
+        if len(self._terms) >= TERM_CACHE_SIZE:
+            self._terms.pop(next(iter(self._terms)))
+        self._terms[term] = lookups
+        return lookups
+
+    def cheapest_per_provider(self, ingredient: str, minimum_amount: float) -> Dict[str, dict]:
+        """Return the cheapest product per provider matching ingredient with more than minimum_amount oz."""
+        self.maybe_refresh()
+        term = normalize(ingredient)
+        with self._lock:
+            lookups = self._lookups(term)
+            result = {}
+            for provider, lookup in lookups.items():
+                product = lookup.cheapest_above(minimum_amount)
+                if product is not None:
+                    result[provider] = product
+            return result
+
+
+if __name__ == "__main__":
+    # Lookup benchmark against a synthetic catalog: python -m db.productIndex
+    import random
+
+    random.seed(7)
+    words = ["flour", "butter", "sugar", "brown sugar", "soy sauce", "garlic", "ginger", "eggs",
+             "olive oil", "sesame oil", "rice vinegar", "chicken thighs", "apples", "cinnamon"]
+    rows = [
+        {
+            "id": product_id,
+            "provider": random.choice(["Kroger", "Target"]),
+            "itemName": f"Brand{product_id % 97} {random.choice(words)} {random.randint(1, 64)} oz",
+            "category": random.choice(words),
+            "brand": f"Brand{product_id % 97}",
+            "price": round(random.uniform(0.5, 20), 2),
+            "unitAmountOz": float(random.randint(1, 128)),
+        }
+        for product_id in range(1, 20001)
+    ]
+
+    def fetch_page(after_id, start, end):
+        matching = [row for row in rows if after_id is None or row["id"] > after_id]
+        return matching[start:end + 1]
+
+    index = ProductIndex(fetch_page)
+    start = time.perf_counter()
+    index.maybe_refresh()
+    print(f"Load: {(time.perf_counter() - start) * 1000:.1f} ms for {len(index)} products")
+
+    def scan(ingredient, minimum_amount):
+        best = {}
+        for row in rows:
+            matches = ingredient in row["itemName"].lower() or ingredient in row["category"].lower()
+            if matches and row["unitAmountOz"] > minimum_amount:
+                if row["provider"] not in best or row["price"] < best[row["provider"]]["price"]:
+                    best[row["provider"]] = row
+        return best
+
+    queries = [(random.choice(words), random.uniform(0, 100)) for _ in range(2000)]
+    for ingredient, minimum_amount in queries[:50]:
+        expected = {provider: row["price"] for provider, row in scan(ingredient, minimum_amount).items()}
+        found = index.cheapest_per_provider(ingredient, minimum_amount)
+        assert {provider: row["price"] for provider, row in found.items()} == expected, ingredient
+
+    start = time.perf_counter()
+    for ingredient, minimum_amount in queries:
+        index.cheapest_per_provider(ingredient, minimum_amount)
+    indexed = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    for ingredient, minimum_amount in queries[:100]:
+        scan(ingredient, minimum_amount)
+    scanned = (time.perf_counter() - start) / 100
+    print(f"Indexed lookup: {indexed * 1e6:.1f} us, full scan: {scanned * 1e6:.1f} us")
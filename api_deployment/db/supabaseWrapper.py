@@ -1,8 +1,14 @@
 import os
 import json
+import base64
+import binascii
+import threading
+from cachetools import TTLCache
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from .pydanticTypes import Product, Recipe
+from .productIndex import ProductIndex
+from src.metrics import timed
 
 load_dotenv()
 
@@ -10,14 +16,31 @@ url: str = os.environ.get("SUPABASE_PROJECT_URL")
 key: str = os.environ.get("SUPABASE_PROJECT_API")
 supabase: Client = create_client(url, key)
 
+@timed("db.get_all_products")
 def get_all_products():
     response = supabase.table("products").select("*").execute()
     return response.data
 
+@timed("db.fetch_products_page")
+def _fetch_products_page(after_id, start: int, end: int):
+    query = supabase.table("products").select("*")
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    return query.order("id").range(start, end).execute().data
+
+# In-process index answering /ingredients lookups without a database round-trip
+PRODUCT_INDEX_ENABLED = os.environ.get("PRODUCT_INDEX_ENABLED", "1") != "0"
+product_index = ProductIndex(_fetch_products_page)
+
+@timed("db.get_products")
 def get_products(ingredient: str, minimum_amount: float):
-    # Use ilike on both category and itemName to find partial matches
+    """Return the cheapest product per provider whose name or category contains ingredient."""
+    if PRODUCT_INDEX_ENABLED:
+        product_list = product_index.cheapest_per_provider(ingredient, minimum_amount)
+        return product_list or {"error": "No products found", "data": []}
+
     response = supabase.table("products").select("*")\
-        .ilike("itemName", f"%{ingredient}%")\
+        .or_(f"itemName.ilike.{_quote('%' + ingredient + '%')},category.ilike.{_quote('%' + ingredient + '%')}")\
         .gt("unitAmountOz", minimum_amount).execute()
     if response.data:
         # Return one product with the lowest cost per provider
@@ -32,86 +55,364 @@ def get_products(ingredient: str, minimum_amount: float):
     else:
         return {"error": "No products found", "data": []}
 
-def get_recipes(sort_type: str, limit: int, offset: int, search: str = None):
+@timed("db.get_products_bulk")
+def get_products_bulk(minimum_amounts: dict):
+    """
+    Look up many ingredients at once.
+
+    Args:
+        minimum_amounts: ingredient name -> minimum unitAmountOz
+
+    Returns:
+        dict: ingredient name -> {provider: cheapest product}, empty for ingredients with no match
+    """
+    if PRODUCT_INDEX_ENABLED:
+        return {
+            ingredient: product_index.cheapest_per_provider(ingredient, minimum_amount)
+            for ingredient, minimum_amount in minimum_amounts.items()
+        }
+
+    # One query for every ingredient, then the same per-provider reduction as get_products
+    filters = ",".join(
+        f"{field}.ilike.{_quote('%' + ingredient + '%')}"
+        for ingredient in minimum_amounts for field in ("itemName", "category")
+    )
+    rows = supabase.table("products").select("*").or_(filters)\
+        .gt("unitAmountOz", min(minimum_amounts.values())).execute().data
+    results = {}
+    for ingredient, minimum_amount in minimum_amounts.items():
+        term = ingredient.lower()
+        product_list = {}
+        for product in rows:
+            if product["unitAmountOz"] <= minimum_amount:
+                continue
+            if term not in product["itemName"].lower() and term not in (product.get("category") or "").lower():
+                continue
+            if product["provider"] not in product_list or product["price"] < product_list[product["provider"]]["price"]:
+                product_list[product["provider"]] = product
+        results[ingredient] = product_list
+    return results
+
+# Column each sort is keyed on; ties are broken by id so every row has a unique position
+SORT_KEYS = {
+    "newest": ("created_at", True),
+    "oldest": ("created_at", False),
+    "popular": ("likes", True),
+}
+
+RECIPE_COUNT_MODE = os.environ.get("RECIPE_COUNT_MODE", "exact")  # or "estimated"
+_recipe_counts = TTLCache(maxsize=256, ttl=float(os.environ.get("RECIPE_COUNT_TTL_SECONDS", "60")))
+_recipe_counts_lock = threading.Lock()
+
+def encode_cursor(sort_type: str, row: dict) -> str:
+    """Build an opaque cursor pointing just after the given row."""
+    column, _ = SORT_KEYS[sort_type]
+    payload = json.dumps({"s": sort_type, "v": row.get(column), "id": row["id"]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def encode_search_cursor(sort_type: str, next_offset: int) -> str:
+    """Build a cursor for ranked search results, which are paged by position in the ranking."""
+    payload = json.dumps({"s": sort_type, "o": next_offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor created by encode_cursor or encode_search_cursor. Raises ValueError if it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload, dict) or "s" not in payload:
+            raise ValueError("missing fields")
+        if {"v", "id"} - payload.keys() and not isinstance(payload.get("o"), int):
+            raise ValueError("missing fields")
+        return payload
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def _quote(value) -> str:
+    # Quote values inside PostgREST or() filters so commas, dots and colons in timestamps survive
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+def _keyset_filter(sort_type: str, position: dict) -> str:
+    """Return a PostgREST or() filter selecting the rows after `position` in sort order."""
+    column, descending = SORT_KEYS[sort_type]
+    comparison = "lt" if descending else "gt"
+    value, row_id = position["v"], int(position["id"])
+    if value is None:
+        # NULLs are ordered last, so only later NULL rows remain
+        return f"and({column}.is.null,id.{comparison}.{row_id})"
+    return (
+        f"{column}.{comparison}.{_quote(value)},"
+        f"and({column}.eq.{_quote(value)},id.{comparison}.{row_id}),"
+        f"{column}.is.null"
+    )
+
+def _strip_search_columns(rows: list) -> list:
+    """Remove the search index columns, which are an implementation detail, from recipe rows."""
+    for row in rows:
+        row.pop("search_document", None)
+        row.pop("search_text", None)
+    return rows
+
+@timed("db.count_recipes")
+def count_recipes(search: str = None):
+    """
+    Count the recipes matching a search with one count query, cached for a short TTL.
+
+    Returns:
+        The number of matching recipes (exact or estimated depending on RECIPE_COUNT_MODE)
+    """
+    cache_key = (search or "").strip().lower()
+    with _recipe_counts_lock:
+        if cache_key in _recipe_counts:
+            return _recipe_counts[cache_key]
+    if cache_key:
+        total = supabase.rpc("search_recipes_count", {"search_term": search.strip()}).execute().data
+    else:
+        total = supabase.table("recipes").select("id", count=RECIPE_COUNT_MODE, head=True).execute().count
+    with _recipe_counts_lock:
+        _recipe_counts[cache_key] = total
+    return total
+
+@timed("db.get_recipes")
+def get_recipes(sort_type: str, limit: int, offset: int = 0, search: str = None,
+                comments: str = "all", comments_limit: int = None, cursor: str = None):
     """
     Get recipes from the database with optional pagination, sorting, and search.
     
+    Pages are addressed with keyset cursors on (created_at, id) or (likes, id), so deep
+    pages cost the same as the first one. Offsets still work for callers without a cursor.
+    
     Args:
         sort_type: How to sort the recipes (popular, newest, oldest)
         limit: Maximum number of recipes to return
-        offset: Offset for pagination
+        offset: Offset for pagination (ignored when a cursor is given)
         search: Optional search term to filter recipes
+        comments: "all" to attach comments, "count" for comment counts only, "none" to skip them
+        comments_limit: With "all", only attach the first comments_limit comments per recipe
+        cursor: Opaque next_cursor returned by a previous call
         
     Returns:
-        List of recipes or error message
+        Dict with the page of recipes ("data") and the cursor of the next page ("next_cursor",
+        None on the last page), or an error message
     """
+    if sort_type not in SORT_KEYS:
+        return {"error": "Invalid sort type"}
+    column, descending = SORT_KEYS[sort_type]
+
+    position = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError as e:
+            return {"error": str(e)}
+        if position["s"] != sort_type:
+            return {"error": "Cursor belongs to a different sort type"}
+
+    # Searches go through the ranked full-text/fuzzy index (db/migrations/001_recipe_search.sql)
+    if search and search.strip():
+        if position is not None:
+            if "o" not in position:
+                return {"error": "Cursor does not belong to a search"}
+            offset = position["o"]
+        response = supabase.rpc("search_recipes", {
+            "search_term": search.strip(),
+            "result_limit": limit + 1,
+            "result_offset": offset,
+            "sort_type": sort_type,
+        }).execute()
+        data = _strip_search_columns(response.data)
+        next_cursor = encode_search_cursor(sort_type, offset + limit) if len(data) > limit else None
+        data = data[:limit]
+        if comments != "none":
+            attach_comments(data, counts_only=(comments == "count"), limit_per_recipe=comments_limit)
+        return {"data": data, "next_cursor": next_cursor}
+
     # Start building the query
     query = supabase.table("recipes").select("*")
     
-    # Apply search filter if provided
-    if search and search.strip():
-        # Search in title (case-insensitive)
-        query = query.ilike("title", f"%{search}%")
-        # Note: For more advanced search across multiple fields or related tables,
-        # you would need to use a more complex query or a dedicated search service
-    
-    # Apply sorting
-    if sort_type == "popular":
-        query = query.order("likes", desc=True)
-    elif sort_type == "newest":
-        query = query.order("created_at", desc=True)
-    elif sort_type == "oldest":
-        query = query.order("created_at", desc=False)
-    else:
-        return {"error": "Invalid sort type"}
+    # Seek past the previous page instead of skipping rows with an offset
+    if position is not None:
+        if "o" in position:
+            return {"error": "Cursor belongs to a search"}
+        query = query.or_(_keyset_filter(sort_type, position))
+
+    # Apply sorting, with id as the tie-breaker
+    query = query.order(column, desc=descending, nullsfirst=False).order("id", desc=descending)
     
-    # Apply pagination
-    query = query.limit(limit).offset(offset)
+    # Fetch one extra row to learn whether there is a next page
+    query = query.limit(limit + 1)
+    if offset and not cursor:
+        query = query.offset(offset)
     
     # Execute the query
     response = query.execute()
-    data = response.data
+    data = _strip_search_columns(response.data)
+    next_cursor = encode_cursor(sort_type, data[limit - 1]) if len(data) > limit else None
+    data = data[:limit]
 
-    # Go through data and get the comments for each recipe
-    for recipe in data:
-        comments = get_comments(recipe["id"])
-        recipe["comments"] = comments
+    # Attach the comments for the whole page with one query instead of one per recipe
+    if comments != "none":
+        attach_comments(data, counts_only=(comments == "count"), limit_per_recipe=comments_limit)
 
-    return data
+    return {"data": data, "next_cursor": next_cursor}
 
+@timed("db.get_comments")
 def get_comments(recipe_id: str):
     recipe_id = int(recipe_id)
     response = supabase.table("comments").select("*").eq("recipe_id", recipe_id).execute()
     return response.data
 
+# Rows per request when paging comments; at most PostgREST's max-rows (1000 on Supabase)
+COMMENTS_PAGE_SIZE = int(os.environ.get("COMMENTS_PAGE_SIZE", "1000"))
+
+@timed("db.get_comment_counts")
+def get_comment_counts(recipe_ids: list):
+    """Count the comments of many recipes with one grouped query (db/migrations/003_recipe_comments.sql)."""
+    counts = {recipe_id: 0 for recipe_id in recipe_ids}
+    if not recipe_ids:
+        return counts
+    response = supabase.rpc("recipe_comment_counts", {"recipe_ids": recipe_ids}).execute()
+    for row in response.data:
+        counts[row["recipe_id"]] = row["comment_count"]
+    return counts
+
+@timed("db.get_comments_for_recipes")
+def get_comments_for_recipes(recipe_ids: list, limit_per_recipe: int = None):
+    """
+    Fetch the comments for many recipes, a page of COMMENTS_PAGE_SIZE rows at a time.
+
+    Args:
+        recipe_ids: The recipe ids to fetch comments for
+        limit_per_recipe: Only fetch the first limit_per_recipe comments of each recipe
+
+    Returns:
+        Dict mapping each recipe id to its list of comments (oldest first)
+    """
+    grouped = {recipe_id: [] for recipe_id in recipe_ids}
+    if not recipe_ids:
+        return grouped
+    offset = 0
+    while True:
+        # The per-recipe limit is applied in the database (db/migrations/003_recipe_comments.sql)
+        rows = supabase.rpc("recipe_comments_page", {
+            "recipe_ids": recipe_ids,
+            "per_recipe": limit_per_recipe,
+            "result_limit": COMMENTS_PAGE_SIZE,
+            "result_offset": offset,
+        }).execute().data
+        for comment in rows:
+            grouped.setdefault(comment["recipe_id"], []).append(comment)
+        # A short page is the last one
+        if len(rows) < COMMENTS_PAGE_SIZE:
+            return grouped
+        offset += len(rows)
+
+def attach_comments(recipes: list, counts_only: bool = False, limit_per_recipe: int = None):
+    """Add comment_count (and unless counts_only, comments) to each recipe in place."""
+    recipe_ids = [int(recipe["id"]) for recipe in recipes]
+    counts = get_comment_counts(recipe_ids)
+    grouped = {} if counts_only else get_comments_for_recipes(recipe_ids, limit_per_recipe)
+    for recipe in recipes:
+        recipe_id = int(recipe["id"])
+        recipe["comment_count"] = counts.get(recipe_id, 0)
+        if not counts_only:
+            recipe["comments"] = grouped.get(recipe_id, [])
+
+@timed("db.get_recipes_for_cache")
+def get_recipes_for_cache(limit: int = 5000):
+    """Return the most recent recipes for seeding src.recipe_cache.RecipeCache."""
+    response = supabase.table("recipes").select("*").order("created_at", desc=True).limit(limit).execute()
+    return _strip_search_columns(response.data)
+
+@timed("db.get_recipe_ingredient_counts")
+def get_recipe_ingredient_counts(recent: int = 1000):
+    """Count how often each ingredient name appears in the most recent recipes."""
+    response = supabase.table("recipes").select("ingredients")\
+        .order("created_at", desc=True).limit(recent).execute()
+    counts = {}
+    for recipe in response.data:
+        for ingredient in recipe.get("ingredients") or []:
+            name = str(ingredient.get("name") or "").strip().lower() if isinstance(ingredient, dict) else ""
+            if name:
+                counts[name] = counts.get(name, 0) + 1
+    return counts
+
+@timed("db.get_recipe")
 def get_recipe(recipe_id: str):
     response = supabase.table("recipes").select("*").eq("id", recipe_id).execute()
-    return response.data
+    return _strip_search_columns(response.data)
+
+# Columns that identify a product; backed by a unique constraint (db/migrations/002_products_unique_key.sql)
+PRODUCT_KEY = ("provider", "brand", "itemName")
+
+def _product_key(product: dict) -> tuple:
+    return tuple(product[column] for column in PRODUCT_KEY)
+
+@timed("db.upsert_products")
+def upsert_products(products: list):
+    """
+    Write many products with one read and one upsert.
+
+    Rows are matched on (provider, brand, itemName); a changed price, category or size
+    updates the stored row. Duplicates within the batch keep the last occurrence.
+
+    Args:
+        products: Product objects, e.g. everything from one scrape
+
+    Returns:
+        dict: {"error": None, "results": [{"product": dict, "status": "created" | "updated" | "unchanged"}]}
+              in input order (after removing duplicates), or {"error": str, "results": []}
+    """
+    batch = {}
+    for product in products:
+        row = product.model_dump()
+        batch[_product_key(row)] = row
+    if not batch:
+        return {"error": None, "results": []}
+
+    try:
+        existing_rows = supabase.table("products").select("*")\
+            .in_("itemName", sorted({row["itemName"] for row in batch.values()})).execute().data
+        existing = {_product_key(row): row for row in existing_rows}
+
+        results, changed = [], []
+        for key, row in batch.items():
+            stored = existing.get(key)
+            if stored is None:
+                status = "created"
+            elif any(stored.get(column) != value for column, value in row.items()):
+                status = "updated"
+            else:
+                status = "unchanged"
+            results.append({"product": row, "status": status})
+            if status != "unchanged":
+                changed.append(row)
+
+        if changed:
+            response = supabase.table("products").upsert(changed, on_conflict=",".join(PRODUCT_KEY)).execute()
+            product_index.add(response.data)
+        counts = {status: sum(result["status"] == status for result in results) for status in ("created", "updated", "unchanged")}
+        print(f"Products upserted: {counts}")
+        return {"error": None, "results": results}
+    except Exception as e:
+        return {"error": f"Failed to upsert products: {str(e)}", "results": []}
 
 def create_product(product: Product):
     """
-    Create a new product in the Supabase database.
+    Create a product in the Supabase database, or update it if its price or size changed.
     
     Args:
         product: A Product object containing all product data
         
     Returns:
-        The created product data or an error message
+        A dictionary with an error message (None on success) and the status
     """
-    try:
-        # Check to make sure the product.itemName is not already in the database for the given brand and provider
-        response = supabase.table("products").select("*").eq("itemName", product.itemName).eq("brand", product.brand).eq("provider", product.provider).execute()
-        if response.data:
-            return {"error": "Product already exists", "status": ""}
-        else:
-            response = supabase.table("products").insert(product.model_dump()).execute()
-            print(f"Product created: {product.itemName}")
-            # Return as a dictionary   
-            return {"error": None, "status": "Product created successfully"}
-    except Exception as e:
-        # Return a more helpful error message
-        return {"error": f"Failed to create product: {str(e)}", "status": ""}
+    result = upsert_products([product])
+    if result["error"]:
+        return {"error": result["error"], "status": ""}
+    return {"error": None, "status": f"Product {result['results'][0]['status']}"}
 
+@timed("db.create_recipe")
 def create_recipe(recipe: Recipe):
     """
     Create a new recipe in the Supabase database.
@@ -148,17 +449,22 @@ def create_recipe(recipe: Recipe):
         
     try:
         response = supabase.table("recipes").insert(recipe_data).execute()
-        return response.data
+        # Totals are cached, so forget them now that there is a new recipe
+        with _recipe_counts_lock:
+            _recipe_counts.clear()
+        return _strip_search_columns(response.data)
     except:
         return {"error": "Error inserting recipe"}
 
-def search_recipe(query: str):
-    response = supabase.table("recipes").select("*").ilike("title", f"%{query}%").execute()
-    return response.data
+@timed("db.search_recipe")
+def search_recipe(query: str, limit: int = 20):
+    response = supabase.rpc("search_recipes", {"search_term": query, "result_limit": limit}).execute()
+    return _strip_search_columns(response.data)
 
+@timed("db.get_featured_recipes")
 def get_featured_recipes():
     response = supabase.table("recipes").select("*").eq("featured", True).execute()
-    return response.data
+    return _strip_search_columns(response.data)
 
 if __name__ == "__main__":
     product = Product(
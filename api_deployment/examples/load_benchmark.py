@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the recipe API.
+
+Fires a fixed number of requests at an endpoint for several concurrency levels
+and reports throughput, while a side task keeps probing /health to show
+whether slow handlers are stalling the event loop.
+
+Usage:
+    python examples/load_benchmark.py --endpoint /generate-recipe --requests 32
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+DEFAULT_PAYLOADS = {
+    "/generate-recipe": {"query": "chicken curry"},
+    "/generate-shopping-list": {"ingredients": ["2 cups all-purpose flour", "1 cup milk", "2 large eggs"]},
+    "/scrapeIngredients": {"product_name": "carrots", "zip_code": "47906"},
+    "/ingredients": {"ingredient": "carrots", "amount": 1.0, "unit": "ounces"},
+}
+
+
+async def probe_health(client, base_url, stop, samples):
+    """Measure /health latency until told to stop."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get(f"{base_url}/health")
+            samples.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def run_level(base_url, endpoint, payload, concurrency, total_requests, timeout):
+    """Run total_requests calls with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    health_samples = []
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async def one_request():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if endpoint in ("/recipes", "/featuredRecipes", "/health"):
+                        response = await client.get(f"{base_url}{endpoint}")
+                    else:
+                        response = await client.post(f"{base_url}{endpoint}", json=payload)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        health_task = asyncio.create_task(probe_health(client, base_url, stop, health_samples))
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total_requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await health_task
+
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "health_max_s": round(max(health_samples), 3) if health_samples else None,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent-request throughput benchmark")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/generate-recipe")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma separated concurrency levels")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    payload = DEFAULT_PAYLOADS.get(args.endpoint, {})
+    results = []
+    for level in [int(level) for level in args.levels.split(",")]:
+        result = await run_level(args.base_url, args.endpoint, payload, level, args.requests, args.timeout)
+        print(
+            f"concurrency={result['concurrency']:>3}  rps={result['throughput_rps']:>8}  "
+            f"p50={result['latency_p50_s']}s  errors={result['errors']}  "
+            f"worst /health={result['health_max_s']}s"
+        )
+        results.append(result)
+
+    with open("load_benchmark.json", "w") as f:
+        json.dump(results, f, indent=4)
+    print("Results saved to 'load_benchmark.json'")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Query rewrite latency benchmark.
+
+Runs RecipeProvider._plan_search (classifier + speculative rewrite) against the
+old always-rewrite-then-search path for a sample of queries, with the Gemini
+rewrite and the Google search replaced by sleeps drawn from lognormal latency
+distributions. Reports p50/p95 of the time from request to having search
+results, which is the part of /generate-recipe this change affects.
+
+Usage:
+    python examples/query_rewrite_benchmark.py --rewrite-ms 700 --search-ms 600
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import src.recipe_provider as recipe_provider_module
+from src.query_classifier import QueryClassifier
+from src.recipe_provider import RecipeProvider
+
+SAMPLE_QUERIES = [
+    "chicken curry", "Chicken Curry!", "easy lasagna", "spaghetti carbonara", "pasta", "chicken pasta",
+    "quick dinner ideas", "beef stew", "tofu stir fry", "something with leftover rice", "banana bread",
+    "cake", "lemon drizzle cake", "thai green curry", "healthy breakfast", "pad thai", "soup",
+    "shrimp scampi", "vegan chili", "salmon", "mushroom risotto", "dessert", "fish tacos", "pancakes",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rewrite-ms", type=float, default=700, help="Median Gemini rewrite latency")
+    parser.add_argument("--search-ms", type=float, default=600, help="Median Google search latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal spread of both latencies")
+    parser.add_argument("--rounds", type=int, default=4, help="Passes over the sample queries")
+    parser.add_argument("--scale", type=float, default=0.1, help="Sleep for this fraction of each latency")
+    args = parser.parse_args()
+
+    def sleep_ms(median):
+        time.sleep(random.lognormvariate(math.log(median), args.sigma) * args.scale / 1000)
+
+    class FakeScraper:
+        def _find_recipe_links(self, query):
+            sleep_ms(args.search_ms)
+            return [f"https://example.com/{query}"]
+
+    provider = RecipeProvider.__new__(RecipeProvider)
+    provider.scraper = FakeScraper()
+    provider.query_classifier = QueryClassifier()
+
+    def rewrite(query):
+        sleep_ms(args.rewrite_ms)
+        return f"{query} recipe" if len(query.split()) > 1 else f"classic {query} bake"
+
+    provider._generate_search_query = rewrite
+    recipe_provider_module.REWRITE_BUDGET_SECONDS *= args.scale
+
+    old, new = [], []
+    skipped = 0
+    random.seed(1)
+    for _ in range(args.rounds):
+        for query in SAMPLE_QUERIES:
+            start = time.perf_counter()
+            provider.scraper._find_recipe_links(provider._generate_search_query(query))
+            old.append((time.perf_counter() - start) / args.scale)
+
+            start = time.perf_counter()
+            timings = {}
+            search_query, links = provider._plan_search(query, timings)
+            if links is None:
+                provider.scraper._find_recipe_links(search_query)
+            new.append((time.perf_counter() - start) / args.scale)
+            skipped += timings["rewrite"] == "skipped"
+
+    print(f"{len(old)} requests; rewrite skipped for {skipped} ({skipped / len(old):.0%})")
+    print(f"{'':12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for label, values in (("always", old), ("classified", new)):
+        print(f"{label:12} {percentile(values, 0.5) * 1000:8.0f} {percentile(values, 0.95) * 1000:8.0f} "
+              f"{statistics.mean(values) * 1000:8.0f}")
+    print(f"Saved: p50 {(percentile(old, 0.5) - percentile(new, 0.5)) * 1000:.0f} ms, "
+          f"p95 {(percentile(old, 0.95) - percentile(new, 0.95)) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Recipe page extraction benchmark.
+
+Compares the original extraction (a full BeautifulSoup html.parser tree searched
+with class-name regexes) with src.recipe_extractor (streaming JSON-LD / microdata
+first, heuristics only as a fallback) over a directory of saved recipe pages, and
+reports parse time and how many pages yielded both ingredients and steps.
+
+Usage:
+    python examples/recipe_extraction_benchmark.py
+    python examples/recipe_extraction_benchmark.py --save https://example.com/recipe ...  # grow the corpus
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from src.recipe_extractor import FALLBACK_PARSER, extract_recipe
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe_pages")
+CHUNK_SIZE = 16384
+
+
+def extract_original(html):
+    """The extraction RecipeScraper used before src.recipe_extractor."""
+    soup = BeautifulSoup(html, 'html.parser')
+    ingredients = []
+    for ul in soup.find_all(['ul', 'div'], class_=re.compile("ingredient", re.I)):
+        for li in ul.find_all(['li', 'span']):
+            text = li.get_text(strip=True)
+            if text and len(text) > 3:
+                ingredients.append(text)
+        if ingredients:
+            break
+    steps = []
+    for ol in soup.find_all(['ol', 'div'], class_=re.compile("instruction|step|direction", re.I)):
+        for li in ol.find_all(['li', 'p']):
+            text = li.get_text(strip=True)
+            if text and len(text) > 5:
+                steps.append(text)
+        if steps:
+            break
+    return {"ingredients": ingredients, "steps": steps}
+
+
+def extract_streaming(html):
+    data = html.encode("utf-8")
+    return extract_recipe(data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+
+
+def save_pages(urls, corpus):
+    from src.http_session import get_session
+
+    os.makedirs(corpus, exist_ok=True)
+    for url in urls:
+        response = get_session().get(url, headers={'User-Agent': 'Mozilla/5.0'})
+        name = re.sub(r"[^a-z0-9]+", "_", url.lower().split("//", 1)[-1]).strip("_")[:80] + ".html"
+        with open(os.path.join(corpus, name), "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"Saved {url} -> {name}")
+
+
+def run(corpus, repeat):
+    pages = {}
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus, name), encoding="utf-8", errors="replace") as f:
+                pages[name] = f.read()
+    if not pages:
+        print(f"No .html pages in {corpus}")
+        return
+
+    print(f"{len(pages)} pages, {repeat} runs each, fallback parser: {FALLBACK_PARSER}\n")
+    print(f"{'page':40} {'original ms':>12} {'hit':>4} {'new ms':>8} {'hit':>4}  method")
+    totals = {"original": [], "new": []}
+    hits = {"original": 0, "new": 0}
+    for name, html in pages.items():
+        row = {}
+        for label, extract in (("original", extract_original), ("new", extract_streaming)):
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = extract(html)
+                samples.append(time.perf_counter() - start)
+            hit = bool(result["ingredients"]) and bool(result["steps"])
+            hits[label] += hit
+            totals[label].append(statistics.median(samples))
+            row[label] = (statistics.median(samples) * 1000, "yes" if hit else "no", result.get("method", ""))
+        print(f"{name[:40]:40} {row['original'][0]:12.2f} {row['original'][1]:>4} "
+              f"{row['new'][0]:8.2f} {row['new'][1]:>4}  {row['new'][2]}")
+
+    original, new = sum(totals["original"]), sum(totals["new"])
+    print(f"\nTotal parse time: original {original * 1000:.1f} ms, new {new * 1000:.1f} ms "
+          f"({original / new:.1f}x faster)" if new else "")
+    print(f"Pages with ingredients and steps: original {hits['original']}/{len(pages)}, new {hits['new']}/{len(pages)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of saved .html recipe pages")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per page (the median is reported)")
+    parser.add_argument("--save", nargs="+", metavar="URL", help="Download pages into the corpus instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.save, args.corpus)
+    else:
+        run(args.corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
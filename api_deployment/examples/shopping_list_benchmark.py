@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Shopping list aggregation benchmark.
+
+Times src.shopping_list.ShoppingListEngine (local parsing, synonyms, density
+tables) on sample recipe ingredient lists and prints the merged lists. With
+--live, also times the previous path that sends the whole list to Gemini
+(RecipeProvider._generate_shopping_list_with_llm, bypassing the LLM cache), which
+needs GEMINI_API_KEY.
+
+Usage:
+    python examples/shopping_list_benchmark.py
+    python examples/shopping_list_benchmark.py --live --live-runs 3
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.shopping_list import ShoppingListEngine
+
+SAMPLE_LISTS = {
+    "apple pie + orange chicken": [
+        "2 1/4 cups all-purpose flour", "1 teaspoon salt", "1 cup unsalted butter, softened", "1/4 cup ice water",
+        "6 apples, peeled and sliced", "3/4 cup granulated sugar", "1/2 cup packed brown sugar",
+        "1 tsp ground cinnamon", "1/4 tsp nutmeg", "2 tablespoons lemon juice", "1 large egg",
+        "1 1/2 pounds boneless skinless chicken thighs, cubed", "2 large eggs", "1/2 cup cornstarch",
+        "1/4 cup vegetable oil", "1/2 cup orange juice", "1 tbsp orange zest", "1/3 cup granulated sugar",
+        "2 tbsp rice vinegar", "3 tbsp soy sauce", "1 tablespoon grated fresh ginger", "3 cloves garlic, minced",
+        "4 green onions, sliced", "1 tbsp sesame seeds", "Salt to taste",
+    ],
+    "thai curry": [
+        "1 (14 ounce) can coconut milk", "2 tbsp red curry paste", "1 lb chicken breast, sliced",
+        "1 red bell pepper, sliced", "1 cup broccoli florets", "2 tbsp fish sauce", "1 tbsp brown sugar",
+        "1/4 cup fresh basil leaves", "1 lime, juiced", "2 cups jasmine rice", "1 tbsp vegetable oil",
+        "2 cloves garlic", "1 tsp grated ginger",
+    ],
+    "pancakes": [
+        "1 1/2 cups all purpose flour", "3 1/2 tsp baking powder", "1/4 tsp salt", "1 tbsp white sugar",
+        "1 1/4 cups milk", "1 egg", "3 tbsp butter, melted", "1 tsp vanilla extract", "½ cup blueberries",
+        "2 tbsp maple syrup",
+    ],
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200, help="Local runs per list")
+    parser.add_argument("--live", action="store_true", help="Also time the all-Gemini path")
+    parser.add_argument("--live-runs", type=int, default=3, help="Gemini runs per list")
+    parser.add_argument("--quiet", action="store_true", help="Don't print the merged lists")
+    args = parser.parse_args()
+
+    engine = ShoppingListEngine()
+    provider = None
+    if args.live:
+        from src.recipe_provider import RecipeProvider
+
+        provider = RecipeProvider()
+        provider.cache.get = lambda model, prompt, validate=None: None
+
+    print(f"{'list':28} {'lines':>5} {'items':>5} {'local p50 ms':>13} {'local p95 ms':>13} {'gemini p50 ms':>14}")
+    for name, ingredients in SAMPLE_LISTS.items():
+        result = engine.build(ingredients)
+        local = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            engine.build(ingredients)
+            local.append(time.perf_counter() - start)
+
+        live = ""
+        if provider is not None:
+            samples = []
+            for _ in range(args.live_runs):
+                start = time.perf_counter()
+                provider._generate_shopping_list_with_llm(ingredients)
+                samples.append(time.perf_counter() - start)
+            live = f"{statistics.median(samples) * 1000:14.0f}"
+
+        print(f"{name:28} {len(ingredients):5} {len(result['shopping_list']):5} "
+              f"{percentile(local, 0.5) * 1000:13.2f} {percentile(local, 0.95) * 1000:13.2f} {live or '-':>14}")
+        if not args.quiet:
+            for row in result["shopping_list"]:
+                print(f"    {row['category']:18} {row['ingredient']:22} {row['quantity']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import os
 import base64
-import requests
 import json
+import threading
+import time
 from dotenv import load_dotenv
+from scrapers.units import parseQuantity, pricePerOunce
+from src.http_session import get_session
 
 # Load environment variables
 load_dotenv()
@@ -11,10 +14,27 @@ client_secret = os.environ.get('KROGER_CLIENT_SECRET')
 # Kroger API integration example
 coded_auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode('utf-8')
 
-def getKrogerProductToken():
+# Refresh the OAuth token this many seconds before Kroger says it expires
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.environ.get('KROGER_TOKEN_REFRESH_MARGIN', '120'))
+# A zip code's nearest store rarely changes, so location ids are cached on disk
+LOCATION_CACHE_TTL_SECONDS = float(os.environ.get('KROGER_LOCATION_CACHE_TTL', str(7 * 24 * 3600)))
+LOCATION_CACHE_PATH = os.environ.get(
+    'KROGER_LOCATION_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.cache', 'kroger_locations.json')
+)
+
+_token = None
+_token_expires_at = 0.0
+_token_lock = threading.Lock()
+
+_location_cache = None
+_location_cache_lock = threading.Lock()
+
+def fetchKrogerProductToken():
+    """Request a new client-credentials token. Returns (access_token, expires_in seconds)."""
     try:
         request_body = "grant_type=client_credentials&scope=product.compact"
-        response = requests.post(
+        response = get_session().post(
             'https://api.kroger.com/v1/connect/oauth2/token', 
             data=request_body,
             headers={
@@ -24,15 +44,59 @@ def getKrogerProductToken():
             }
         )
         response.raise_for_status()
-        return response.json()['access_token']
+        data = response.json()
+        return data['access_token'], float(data.get('expires_in', 1800))
     except Exception as error:
         error_message = error.response.json() if hasattr(error, 'response') else str(error)
         print(f'Error fetching access token: {error_message}')
         raise
 
-def getKrogerLocationToken(zipcode, token):
+def getKrogerProductToken(force_refresh=False):
+    """
+    Return a valid Kroger access token, shared by every caller in the process.
+
+    The token is refreshed shortly before it expires. Concurrent callers wait on a single
+    in-flight refresh instead of each requesting their own token.
+    """
+    global _token, _token_expires_at
+    if not force_refresh and _token and time.time() < _token_expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+        return _token
+    with _token_lock:
+        # Another thread may have refreshed while we waited for the lock
+        if not force_refresh and _token and time.time() < _token_expires_at - TOKEN_REFRESH_MARGIN_SECONDS:
+            return _token
+        token, expires_in = fetchKrogerProductToken()
+        _token, _token_expires_at = token, time.time() + expires_in
+        return _token
+
+def invalidateKrogerProductToken(token):
+    """Drop a token Kroger rejected so the next caller fetches a fresh one."""
+    global _token, _token_expires_at
+    with _token_lock:
+        if _token == token:
+            _token, _token_expires_at = None, 0.0
+
+def loadLocationCache():
+    global _location_cache
+    if _location_cache is None:
+        try:
+            with open(LOCATION_CACHE_PATH, 'r') as f:
+                _location_cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _location_cache = {}
+    return _location_cache
+
+def saveLocationCache():
+    # Write to a temporary file first so a crash never leaves a truncated cache behind
+    os.makedirs(os.path.dirname(LOCATION_CACHE_PATH), exist_ok=True)
+    temporary_path = f"{LOCATION_CACHE_PATH}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump(_location_cache, f)
+    os.replace(temporary_path, LOCATION_CACHE_PATH)
+
+def fetchKrogerLocationId(zipcode, token):
     try:
-        response = requests.get(
+        response = get_session().get(
             f'https://api.kroger.com/v1/locations?filter.zipcode.near={zipcode}&filter.radiusinMiles=50',
             headers={
                 'Content-Type': 'application/x-www-form-urlencoded',
@@ -44,10 +108,36 @@ def getKrogerLocationToken(zipcode, token):
 
         return response.json()['data'][0]['locationId']
     except Exception as error:
+        if getattr(getattr(error, 'response', None), 'status_code', None) == 401:
+            # The shared token was revoked early; make the next call fetch a new one
+            invalidateKrogerProductToken(token)
         error_message = error.response.json() if hasattr(error, 'response') else str(error)
         print(f'Error fetching location data: {error_message}')
         raise
 
+def getKrogerLocationToken(zipcode, token):
+    """Return the nearest store's locationId for a zip code, using the persistent cache when fresh."""
+    zipcode = str(zipcode).strip()
+    with _location_cache_lock:
+        entry = loadLocationCache().get(zipcode)
+        if entry and time.time() - entry['fetched_at'] < LOCATION_CACHE_TTL_SECONDS:
+            return entry['locationId']
+
+    try:
+        location_id = fetchKrogerLocationId(zipcode, token)
+    except Exception as error:
+        if getattr(getattr(error, 'response', None), 'status_code', None) != 401:
+            raise
+        # fetchKrogerLocationId dropped the rejected token; retry once with a fresh one
+        location_id = fetchKrogerLocationId(zipcode, getKrogerProductToken())
+    with _location_cache_lock:
+        loadLocationCache()[zipcode] = {'locationId': location_id, 'fetched_at': time.time()}
+        try:
+            saveLocationCache()
+        except OSError as e:
+            print(f'Could not persist Kroger location cache: {e}')
+    return location_id
+
 def getKrogerProductDetails(search_term, location_id, token, brand=''):
     try:
         params = {
@@ -59,7 +149,7 @@ def getKrogerProductDetails(search_term, location_id, token, brand=''):
         if brand:
             params["filter.brand"] = brand
             
-        response = requests.get(
+        response = get_session().get(
             'https://api.kroger.com/v1/products',
             params=params,
             headers={
@@ -89,6 +179,9 @@ def getKrogerProductDetails(search_term, location_id, token, brand=''):
         return available_products
     
     except Exception as error:
+        if getattr(getattr(error, 'response', None), 'status_code', None) == 401:
+            # The shared token was revoked early; make the next call fetch a new one
+            invalidateKrogerProductToken(token)
         error_message = error.response.json() if hasattr(error, 'response') else str(error)
         print(f'Error fetching product details: {error_message}')
         raise 
@@ -114,34 +207,17 @@ def refineKrogerProducts(products):
         price = price_info.get('regular', 0.0)
         price_formatted = f"${price:.2f}" if price else ""
         
-        # Extract size information to calculate unit price
+        # Extract size information to calculate unit price (e.g., "14 oz", "1 lb", "6 ct / 12 fl oz")
         size_info = item.get('size', "")
-        unit_quantity = None
-        unit_of_measure = None
-        
-        # Try to parse size information (e.g., "14 oz", "1 lb", etc.)
-        if size_info:
-            size_parts = size_info.split()
-            if len(size_parts) >= 2:
-                try:
-                    unit_quantity = float(size_parts[0])
-                    unit_of_measure = " ".join(size_parts[1:])
-                except ValueError:
-                    pass
-        
+        parsed_size = parseQuantity(size_info)
+
         # Calculate unit price if possible
         unit_price = ""
         unit_price_suffix = ""
-        if unit_quantity and price:
-            # Convert to ounces if needed
-            if "lb" in unit_of_measure.lower():
-                unit_quantity *= 16  # 1 lb = 16 oz
-                unit_of_measure = "oz"
-            
-            if unit_quantity > 0:
-                unit_price_value = price / unit_quantity
-                unit_price = f"${unit_price_value:.2f}"
-                unit_price_suffix = f"/oz"
+        unit_price_value = pricePerOunce(price, parsed_size["ounces"])
+        if unit_price_value is not None:
+            unit_price = f"${unit_price_value:.2f}"
+            unit_price_suffix = f"/oz"
         
         # Create refined product dictionary
         refined_product = {
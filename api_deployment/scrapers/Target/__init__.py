@@ -1,9 +1,9 @@
 # Example url
 # https://redsky.target.com/redsky_aggregations/v1/web/plp_search_v2?key=9f36aeafbe60771e321a7cc95a78140772ab3e96&channel=WEB&count=24&default_purchasability_filter=true&include_dmc_dmr=true&include_sponsored=true&include_review_summarization=false&keyword=carrots&new_search=true&offset=0&page=%2Fs%2Fcarrots&platform=desktop&pricing_store_id=3309&scheduled_delivery_store_id=3309&spellcheck=true&store_ids=3309%2C1762%2C111%2C1366%2C1063&useragent=Mozilla%2F5.0+%28Macintosh%3B+Intel+Mac+OS+X+10_15_7%29+AppleWebKit%2F537.36+%28KHTML%2C+like+Gecko%29+Chrome%2F135.0.0.0+Safari%2F537.36&visitor_id=019603CB251B020186DC9640FEF301B9&zip=47906
 
-import requests
 import json
-from scrapers.gemini import queryGemini, json_format
+from scrapers.gemini import queryGemini
+from src.http_session import get_session
 import time
 
 def getTargetProducts(keyword, zip_code):
@@ -44,7 +44,7 @@ def getTargetProducts(keyword, zip_code):
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36"
     }
     
-    response = requests.get(base_url, params=params, headers=headers)
+    response = get_session().get(base_url, params=params, headers=headers)
     products = response.json()["data"]["search"]["products"]
     cleaned_products = []
     for product in products:
@@ -2,6 +2,9 @@ import argparse
 import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # Add the parent directory to sys.path to allow imports from the project root
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -9,130 +12,365 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Now import from Target
 from scrapers.Target import getTargetProducts
 from scrapers.Kroger import getKrogerProductToken, getKrogerLocationToken, getKrogerProductDetails
-from scrapers.gemini import queryGemini, json_format
+from scrapers.gemini import queryGemini
+from scrapers.units import normalizeProduct
+from src.llm_client import LLMError, LLMResponseError
+from src.templates import get_templates
+from db.pydanticTypes import Product
+from pydantic import ValidationError
 
 def determineRelevantProducts(products, query):
     prompt = f"Determine which 5 of the following products are most relevant to the query: {query}. The products are: {products}. Return your response in the strict json format: {{'products': ['product1', 'product2', 'product3', 'product4', 'product5']}}"
-    response = queryGemini(prompt, returnAsJson=True)
+    response = queryGemini(prompt, returnAsJson=True,
+                           validate=lambda response: isinstance(response, dict) and 'products' in response)
+    if not isinstance(response, dict) or 'products' not in response:
+        raise LLMResponseError(f"Unexpected relevance response: {str(response)[:200]}")
     return response['products']
 
 def refineProduct(product, query):
-    import time
-    prompt = f"Extract the product name, price, and image URL from the following JSON: {product}. The original query was: {query}. Return your response in the strict json format: {json_format}"
-    response = queryGemini(prompt, returnAsJson=True)
-    if 'error' in response:
-        print(f"Rate limit hit, waiting 1 second before retrying")
-        time.sleep(1)
-        return refineProduct(product)
-    else:
-        print(f"Refined product: {response['itemName']}")
-        return response
+    prompt = f"Extract the product name, price, and image URL from the following JSON: {product}. The original query was: {query}. Return your response in the strict json format: {get_templates().text('scraping_interface')}"
+    # Rate limits and transient errors are retried (boundedly) inside queryGemini
+    response = queryGemini(prompt, returnAsJson=True,
+                           validate=lambda response: isinstance(response, dict) and 'itemName' in response)
+    if not isinstance(response, dict) or 'itemName' not in response:
+        raise LLMResponseError(f"Unexpected refinement response: {str(response)[:200]}")
+    print(f"Refined product: {response['itemName']}")
+    return response
+
+# Maximum number of Gemini refinement calls in flight per provider
+REFINE_CONCURRENCY = int(os.getenv("REFINE_CONCURRENCY", "4"))
+# Refine all of a provider's products with a single Gemini call (set to 0 to refine one by one)
+BATCH_REFINEMENT = os.getenv("BATCH_REFINEMENT", "1") != "0"
+# Products the local size parser is less sure about than this are refined by Gemini
+PARSER_CONFIDENCE_THRESHOLD = float(os.getenv("PARSER_CONFIDENCE_THRESHOLD", "0.75"))
+
+@contextmanager
+def timedStage(timings, stage):
+    """Record the wall-clock time spent in a pipeline stage (in seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 3)
+
+def finishRefinedProduct(refined_product, product):
+    refined_product["provider"] = product["provider"]
+    # If there is no brand, set it to the provider
+    if not refined_product.get("brand"):
+        refined_product["brand"] = refined_product["provider"]
+    return refined_product
+
+def validateRefinedProduct(refined_product, product):
+    """
+    Check a refined product against db.pydanticTypes.Product.
+
+    Raises:
+        ValidationError, KeyError, TypeError: If the LLM output is unusable
+    """
+    refined_product = finishRefinedProduct(dict(refined_product), product)
+    refined_product.pop("index", None)
+    Product(
+        provider=refined_product["provider"],
+        itemName=refined_product["itemName"],
+        category=refined_product["category"],
+        brand=refined_product["brand"],
+        price=refined_product["price"],
+        unitAmountOz=refined_product["unitAmountInOunces"],
+    )
+    return refined_product
+
+def refineProductsBatch(products, query):
+    """
+    Refine many raw products with one Gemini call.
+
+    Args:
+        products (list): Raw provider product dictionaries
+        query (str): The original search query
+
+    Returns:
+        tuple: (dict of input index -> validated refined product, list of indices that failed)
+    """
+    indexed_products = [{"index": index, "product": product} for index, product in enumerate(products)]
+    prompt = (
+        f"Extract the product name, price, and unit amount for each of the following {len(products)} products: "
+        f"{json.dumps(indexed_products)}. The original query was: {query}. "
+        f"Return your response as a strict json array with exactly one object per product. "
+        f"Each object must contain the \"index\" of the product it describes and otherwise follow this json format: {get_templates().text('scraping_interface')}"
+    )
+    response = queryGemini(prompt, returnAsJson=True, validate=lambda response: isinstance(response, (list, dict)))
+    if isinstance(response, dict):
+        # Some responses wrap the array in an object
+        response = next((value for value in response.values() if isinstance(value, list)), [])
+    if not isinstance(response, list):
+        return {}, list(range(len(products)))
+
+    refined = {}
+    for item in response:
+        try:
+            index = int(item["index"])
+            if index in refined or not 0 <= index < len(products):
+                continue
+            refined[index] = validateRefinedProduct(item, products[index])
+        except (ValidationError, KeyError, TypeError, ValueError) as e:
+            print(f"Discarding invalid batch refinement {item}: {e}")
+    failed = [index for index in range(len(products)) if index not in refined]
+    print(f"Batch refined {len(refined)}/{len(products)} products")
+    return refined, failed
+
+def refineProductsLocally(products, query):
+    """
+    Normalize products with the deterministic size parser.
+
+    Returns:
+        tuple: (dict of input index -> refined product, list of indices that need the LLM)
+    """
+    refined = {}
+    for index, product in enumerate(products):
+        normalized = normalizeProduct(product, query)
+        if normalized["confidence"] < PARSER_CONFIDENCE_THRESHOLD:
+            continue
+        del normalized["confidence"], normalized["pricePerOunce"]
+        try:
+            refined[index] = validateRefinedProduct(normalized, product)
+        except (ValidationError, KeyError, TypeError, ValueError):
+            continue
+    unresolved = [index for index in range(len(products)) if index not in refined]
+    print(f"Parsed {len(refined)}/{len(products)} products locally")
+    return refined, unresolved
+
+class PartialRefinementError(Exception):
+    """Gemini failed while refining; products holds what was refined anyway (locally parsed or by the LLM)."""
+
+    def __init__(self, products, cause):
+        super().__init__(f"{len(products)} products kept after {type(cause).__name__}: {cause}")
+        self.products = products
 
 def refineProducts(products, query):
-    refined_products = []
-    for product in products:
-        refined_product = refineProduct(product, query)
-        refined_product["provider"] = product["provider"]
-        # If there is no brand, set it to the provider
-        if not refined_product["brand"]:
-            refined_product["brand"] = refined_product["provider"]
-        refined_products.append(refined_product)
+    """
+    Refine raw provider products, parsing locally first and asking Gemini about the rest.
+
+    Raises:
+        PartialRefinementError: If Gemini was rate limited or unavailable, so some products were dropped
+    """
+    if not products:
+        return []
+    refined, unresolved = refineProductsLocally(products, query)
+
+    # Only the products the parser was unsure about are sent to Gemini
+    failed = []
+    llm_error = None
+    if unresolved and BATCH_REFINEMENT:
+        try:
+            batch_refined, batch_failed = refineProductsBatch([products[index] for index in unresolved], query)
+        except LLMResponseError as e:
+            print(f"Batch refinement returned an unusable response, refining individually: {e}")
+            batch_refined, batch_failed = {}, list(range(len(unresolved)))
+        except LLMError as e:
+            # Rate limited or unavailable: individual calls would fail the same way, keep what we parsed
+            print(f"Batch refinement failed, keeping {len(refined)} locally parsed products: {e}")
+            batch_refined, batch_failed = {}, []
+            llm_error = e
+        refined.update({unresolved[index]: product for index, product in batch_refined.items()})
+        failed = [unresolved[index] for index in batch_failed]
+    elif unresolved:
+        failed = unresolved
+
+    # Only the products the batch could not handle are refined individually, concurrently,
+    # but never with more than REFINE_CONCURRENCY requests at once
+    if failed:
+        with ThreadPoolExecutor(max_workers=min(REFINE_CONCURRENCY, len(failed))) as pool:
+            futures = {index: pool.submit(refineProduct, products[index], query) for index in failed}
+            for index, future in futures.items():
+                try:
+                    refined[index] = finishRefinedProduct(future.result(), products[index])
+                except Exception as e:
+                    print(f"Error refining product {products[index].get('title')}: {e}")
+                    if isinstance(e, LLMError) and not isinstance(e, LLMResponseError):
+                        llm_error = llm_error or e
+    refined_products = [refined[index] for index in sorted(refined)]
+    if llm_error is not None:
+        raise PartialRefinementError(refined_products, llm_error)
     return refined_products
 
-def getProducts(product_name, zip_code):
-    # Get products from Target
-    rawTargetProducts = getTargetProducts(product_name, zip_code)
-    # Determine which products are most relevant to the query based on the names key of the products
-    relevantProductNames = determineRelevantProducts([product['title'] for product in rawTargetProducts], product_name)
+def toProduct(product):
+    """
+    Convert a refined product from getProducts into a db.pydanticTypes.Product.
+
+    Raises:
+        ValidationError, KeyError, TypeError, ValueError: If the product is incomplete
+    """
+    return Product(
+        provider=product["provider"].strip(),
+        itemName=product["itemName"].strip(),
+        category=product["category"].strip(),
+        brand=product["brand"].strip(),
+        price=float(product["price"]),
+        unitAmountOz=float(product["unitAmountInOunces"]),
+    )
+
+def storeProducts(products):
+    """
+    Validate refined products with toProduct and upsert the valid ones in one call.
+
+    Returns:
+        dict: The result of db.supabaseWrapper.upsert_products ({"results": [...], "error": ...})
+    """
+    # Imported here so the scrapers can run on their own without Supabase credentials
+    import db.supabaseWrapper as supabaseWrapper
 
+    valid_products = []
+    for product in products:
+        try:
+            valid_products.append(toProduct(product))
+        except Exception as e:
+            print(f"Skipping invalid product {product.get('itemName', '')!r}: {e}")
+    return supabaseWrapper.upsert_products(valid_products)
+
+def selectRelevantProducts(rawProducts, product_name):
+    # Determine which products are most relevant to the query based on the names key of the products
+    relevantProductNames = determineRelevantProducts([product['title'] for product in rawProducts], product_name)
     # Get the products that match the relevant product names
-    relevantProducts = [product for product in rawTargetProducts if product['title'] in relevantProductNames]
-    refinedTargetProducts = refineProducts(relevantProducts, product_name)
+    return [product for product in rawProducts if product['title'] in relevantProductNames]
+
+def scrapeTarget(product_name, zip_code, timings):
+    with timedStage(timings, "target_search"):
+        rawTargetProducts = getTargetProducts(product_name, zip_code)
+    with timedStage(timings, "target_relevance"):
+        relevantProducts = selectRelevantProducts(rawTargetProducts, product_name)
+    with timedStage(timings, "target_refine"):
+        return refineProducts(relevantProducts, product_name)
 
+def scrapeKroger(product_name, zip_code, timings):
+    with timedStage(timings, "kroger_token"):
+        krogerToken = getKrogerProductToken()
+    with timedStage(timings, "kroger_location"):
+        krogerLocation = getKrogerLocationToken(zip_code, krogerToken)
+    with timedStage(timings, "kroger_search"):
+        # The location lookup may have replaced a rejected token, so read the shared one again
+        rawKrogerProducts = getKrogerProductDetails(product_name, krogerLocation, getKrogerProductToken())
+    with timedStage(timings, "kroger_relevance"):
+        relevantKrogerProducts = selectRelevantProducts(rawKrogerProducts, product_name)
+    with timedStage(timings, "kroger_refine"):
+        return refineProducts(relevantKrogerProducts, product_name)
 
-    # Get products from Kroger
-    krogerToken = getKrogerProductToken()
-    krogerLocation = getKrogerLocationToken(zip_code, krogerToken)
-    rawKrogerProducts = getKrogerProductDetails(product_name, krogerLocation, krogerToken)
+PROVIDER_PIPELINES = {
+    "Target": scrapeTarget,
+    "Kroger": scrapeKroger,
+}
 
-    relevantKrogerProductNames = determineRelevantProducts([product['title'] for product in rawKrogerProducts], product_name)
-    relevantKrogerProducts = [product for product in rawKrogerProducts if product['title'] in relevantKrogerProductNames]
-    refinedKrogerProducts = refineProducts(relevantKrogerProducts, product_name)
+def getProducts(product_name, zip_code, timings=None, errors=None):
+    """
+    Scrape every provider concurrently and return the refined products.
 
-    totalProducts = refinedTargetProducts + refinedKrogerProducts
+    A failure in one provider is logged and only drops that provider's products; if
+    Gemini fails partway through refining, the products refined so far are kept but the
+    provider is still reported in errors.
 
+    Args:
+        product_name (str): The ingredient to search for
+        zip_code (str): ZIP code used for store-specific results
+        timings (dict, optional): Filled with the wall-clock seconds spent in each stage
+        errors (dict, optional): Filled with provider name -> error message for providers that failed
+
+    Returns:
+        list: Refined product dictionaries from all providers that succeeded
+    """
+    timings = {} if timings is None else timings
+    totalProducts = []
+    with timedStage(timings, "total"):
+        with ThreadPoolExecutor(max_workers=len(PROVIDER_PIPELINES)) as pool:
+            futures = {
+                provider: pool.submit(pipeline, product_name, zip_code, timings)
+                for provider, pipeline in PROVIDER_PIPELINES.items()
+            }
+            for provider, future in futures.items():
+                try:
+                    totalProducts += future.result()
+                except PartialRefinementError as e:
+                    # Keep what was refined, but report the provider as failed so callers can retry it
+                    print(f"Incomplete refinement of {provider} products for {product_name}: {e}")
+                    totalProducts += e.products
+                    if errors is not None:
+                        errors[provider] = f"{type(e).__name__}: {e}"
+                except Exception as e:
+                    print(f"Error scraping {provider} for {product_name}: {e}")
+                    if errors is not None:
+                        errors[provider] = f"{type(e).__name__}: {e}"
+    print(f"Scrape timings for {product_name}: {timings}")
     return totalProducts
 
-if __name__ == "__main__":
-    product_to_scrape = [
-        "carrots",
-        "bell peppers",
-        "onions",
-        "garlic",
-        "chicken breasts",
-        "brocolli",
-        "spinach",
-        "tomatoes",
-        "cucumbers",
-        "zucchini",
-        "eggplant",
-        "potatoes",
-        "sweet potatoes",
-        "corn",
-        "cauliflower",
-        "peas",
-        "green beans",
-        "apples",
-        "bananas",
-        "oranges",
-        "lemons",
-        "limes",
-        "strawberries",
-        "blueberries",
-        "raspberries",
-        "pineapple",
-        "mangoes",
-        "beef steak",
-        "pork chops",
-        "salmon fillet",
-        "shrimp",
-        "tuna",
-        "tofu",
-        "eggs",
-        "rice",
-        "pasta",
-        "quinoa",
-        "couscous",
-        "lentils",
-        "chickpeas",
-        "black beans",
-        "white beans",
-        "oats",
-        "flour",
-        "milk",
-        "butter",
-        "cheddar cheese",
-        "parmesan",
-        "yogurt",
-        "cream",
-        "olive oil",
-        "canola oil",
-        "basil",
-        "oregano",
-        "thyme",
-        "rosemary",
-        "cumin",
-        "paprika",
-        "black pepper",
-        "salt",
-        "sugar",
-        "honey",
-        "soy sauce",
-        "vinegar",
-        "mustard",
-        "ketchup"
-    ]
+# Pantry staples kept warm in the products table by scrapers/prewarm.py
+STAPLE_INGREDIENTS = [
+    "carrots",
+    "bell peppers",
+    "onions",
+    "garlic",
+    "chicken breasts",
+    "brocolli",
+    "spinach",
+    "tomatoes",
+    "cucumbers",
+    "zucchini",
+    "eggplant",
+    "potatoes",
+    "sweet potatoes",
+    "corn",
+    "cauliflower",
+    "peas",
+    "green beans",
+    "apples",
+    "bananas",
+    "oranges",
+    "lemons",
+    "limes",
+    "strawberries",
+    "blueberries",
+    "raspberries",
+    "pineapple",
+    "mangoes",
+    "beef steak",
+    "pork chops",
+    "salmon fillet",
+    "shrimp",
+    "tuna",
+    "tofu",
+    "eggs",
+    "rice",
+    "pasta",
+    "quinoa",
+    "couscous",
+    "lentils",
+    "chickpeas",
+    "black beans",
+    "white beans",
+    "oats",
+    "flour",
+    "milk",
+    "butter",
+    "cheddar cheese",
+    "parmesan",
+    "yogurt",
+    "cream",
+    "olive oil",
+    "canola oil",
+    "basil",
+    "oregano",
+    "thyme",
+    "rosemary",
+    "cumin",
+    "paprika",
+    "black pepper",
+    "salt",
+    "sugar",
+    "honey",
+    "soy sauce",
+    "vinegar",
+    "mustard",
+    "ketchup",
+]
 
+if __name__ == "__main__":
+    # Refresh the whole list with: python -m scrapers.prewarm
     enriched_products = {}
     for product in ["tofu"]:
         products = getProducts(product, "47906")
@@ -3,15 +3,62 @@ import requests
 import json
 import time
 from dotenv import load_dotenv
+from src.llm_cache import get_llm_cache
+from src.http_session import get_session
+from src.llm_capture import get_llm_capture
+from src.metrics import stage
+from src.llm_client import call_llm, error_from_status, LLMError, LLMResponseError, LLMUnavailableError
 
 # Import ../../.env
 load_dotenv()
 
-# Import scrapingInterface.json as a string 
-with open('scrapers/scrapingInterface.json', 'r') as f:
-    json_format = f.read()
+def postGemini(url, headers, data, timeout):
+    """Send one generateContent request and return the response text, raising an LLMError on failure."""
+    try:
+        response = get_session().post(url, headers=headers, data=json.dumps(data), timeout=timeout)
+    except requests.Timeout as e:
+        raise LLMUnavailableError(f"Gemini request timed out: {e}")
+    except requests.RequestException as e:
+        raise LLMUnavailableError(f"Gemini request failed: {e}")
+
+    try:
+        response_json = response.json()
+    except ValueError:
+        raise error_from_status(response.status_code, f"Non-JSON response from Gemini ({response.status_code})")
+
+    if "error" in response_json or response.status_code >= 400:
+        message = response_json.get("error", {}).get("message", response.text[:200])
+        retry_after = response.headers.get("Retry-After")
+        raise error_from_status(
+            response.status_code,
+            f"Gemini error {response.status_code}: {message}",
+            retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+        )
+
+    # Extract the text from the response
+    try:
+        return response_json['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError):
+        # Handle potential errors in the response structure (e.g. blocked prompts)
+        raise LLMResponseError(f"Error processing response: {response_json}")
+
+def parseGeminiJson(text):
+    """Parse a JSON reply, optionally wrapped in a ```json fence; raises ValueError if it isn't JSON."""
+    if "```json" in text and "```" in text:
+        text = text.replace("```json", "").replace("```", "")
+    return json.loads(text)
+
+def queryGemini(prompt, model="gemini-2.0-flash", returnAsJson=False, deadline_seconds=None, validate=None):
+    """
+    Query Gemini over REST through the shared rate limiter and response cache.
+
+    A reply is only cached once it is usable: with returnAsJson it must parse, and
+    validate (if given) must accept the parsed response. Unusable replies are returned
+    as before (the raw text when it isn't JSON) but are asked for again next time.
 
-def queryGemini(prompt, model="gemini-2.0-flash", returnAsJson=False):
+    Raises:
+        LLMError: If Gemini can't answer within the retry budget and deadline
+    """
     api_key = os.getenv("GEMINI_API_KEY")
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
     
@@ -21,45 +68,73 @@ def queryGemini(prompt, model="gemini-2.0-flash", returnAsJson=False):
 
     if returnAsJson:
         prompt = f"Return your response in the strict json format that is specified: {prompt}"
-    
+
+    def decode(text):
+        """Return (response, usable) for a reply."""
+        if not returnAsJson:
+            return text, validate is None or bool(validate(text))
+        try:
+            response = parseGeminiJson(text)
+        except ValueError:
+            return text, False
+        return response, validate is None or bool(validate(response))
+
+    # Identical prompts are answered from the shared LLM cache
+    cache = get_llm_cache()
+    capture = get_llm_capture()
+    text = cache.get(model, prompt, validate=lambda cached: decode(cached)[1])
+    if text is not None:
+        capture.record("rest", model, prompt, text, cached=True)
+        return decode(text)[0]
+
     data = {
         "contents": [{
             "parts": [{"text": prompt}]
         }]
     }
-    
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    response_json = response.json()
-    
-    # If there is an error in the response, wait 1 second and try again
-    if "error" in response_json:
-        print(f"Error in response: {response_json['error']['message']}")
-        time.sleep(1)
-        return queryGemini(prompt, model, returnAsJson)
-
-    # Extract the text from the response
+    # Rate limited, retried with jittered exponential backoff and bounded by a deadline
+    start = time.perf_counter()
     try:
-        if returnAsJson:
-            # First check if there are any ```json and ``` in the response
-            if "```json" in response_json['candidates'][0]['content']['parts'][0]['text'] and "```" in response_json['candidates'][0]['content']['parts'][0]['text']:
-                # Remove ```json and ``` from the response 
-                response_json['candidates'][0]['content']['parts'][0]['text'] = response_json['candidates'][0]['content']['parts'][0]['text'].replace("```json", "").replace("```", "")
-                try:
-                    return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
-                except:
-                    print(f"Error parsing json! for prompt: {prompt}")
-                    return response_json['candidates'][0]['content']['parts'][0]['text']
-            else:
-                # Try to parse the response as json
-                try:
-                    return json.loads(response_json['candidates'][0]['content']['parts'][0]['text'])
-                except:
-                    print(f"Error parsing json! for prompt: {prompt}")
-                    return response_json['candidates'][0]['content']['parts'][0]['text']
-        else:
-            return response_json['candidates'][0]['content']['parts'][0]['text']
-    except (KeyError, IndexError):
-        # Handle potential errors in the response structure
-        return f"Error processing response: {response_json}"
+        with stage("llm.rest"):
+            text = call_llm(lambda timeout: postGemini(url, headers, data, timeout), deadline_seconds=deadline_seconds)
+    except LLMError as e:
+        capture.record("rest", model, prompt, error=e, duration_seconds=time.perf_counter() - start)
+        raise
+    capture.record("rest", model, prompt, text, duration_seconds=time.perf_counter() - start)
+
+    response, usable = decode(text)
+    if usable:
+        cache.set(model, prompt, text)
+    elif isinstance(response, str) and returnAsJson:
+        print(f"Error parsing json! for prompt: {prompt}")
+    return response
+
+
+if __name__ == "__main__":
+    # Offline check that unusable replies are never served from the cache: python -m scrapers.gemini
+    import src.llm_cache as llm_cache
+
+    llm_cache._cache = llm_cache.LLMCache(":memory:")
+    replies = []
+
+    def call_llm(send, deadline_seconds=None):
+        return replies.pop(0)
+
+    has_products = lambda response: isinstance(response, dict) and "products" in response
+
+    replies[:] = ["```json {'products': [", '{"products": ["carrots"]}']
+    assert queryGemini("malformed", returnAsJson=True, validate=has_products) == "```json {'products': ["
+    assert queryGemini("malformed", returnAsJson=True, validate=has_products) == {"products": ["carrots"]}
+    assert queryGemini("malformed", returnAsJson=True, validate=has_products) == {"products": ["carrots"]}
 
+    replies[:] = ['{"items": []}', '{"products": []}']
+    assert queryGemini("wrong shape", returnAsJson=True, validate=has_products) == {"items": []}
+    assert queryGemini("wrong shape", returnAsJson=True, validate=has_products) == {"products": []}
 
+    # Entries cached before validation existed are dropped and regenerated
+    wrapped = "Return your response in the strict json format that is specified: legacy"
+    llm_cache._cache.set("gemini-2.0-flash", wrapped, "not json")
+    replies[:] = ['{"products": ["milk"]}']
+    assert queryGemini("legacy", returnAsJson=True, validate=has_products) == {"products": ["milk"]}
+    assert not replies
+    print("Unusable replies are not cached")
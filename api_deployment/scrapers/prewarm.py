@@ -0,0 +1,260 @@
+"""
+Background catalogue refresher.
+
+Walks an ingredient x zip-code matrix, scrapes every pair through getProducts and
+upserts the results, so /ingredients lookups are answered from the products table
+instead of falling through to live scraping.
+
+    python -m scrapers.prewarm --zips 47906,10001
+    python -m scrapers.prewarm --loop --interval-hours 12
+
+Progress is checkpointed after every pair, so a crashed or interrupted run resumes
+where it stopped: pairs refreshed within --max-age-hours are skipped. A pair only
+counts as refreshed when every provider answered and products were stored; failed
+or empty scrapes are retried with exponential backoff instead of waiting a day.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapers import STAPLE_INGREDIENTS, getProducts, storeProducts
+from src.llm_client import TokenBucket, metrics as llm_metrics
+import db.supabaseWrapper as supabaseWrapper
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache', 'prewarm_checkpoint.json'
+)
+# Wait before retrying a failed pair; doubles with each consecutive failure, capped at the max age
+RETRY_BACKOFF_SECONDS = float(os.getenv("PREWARM_RETRY_BACKOFF_SECONDS", "900"))
+
+
+def pairKey(ingredient, zip_code):
+    return f"{ingredient}|{zip_code}"
+
+
+class Checkpoint:
+    """Per-pair refresh history, written atomically after every update."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, 'r') as f:
+                self.pairs = json.load(f).get("pairs", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.pairs = {}
+
+    def get(self, ingredient, zip_code):
+        return self.pairs.get(pairKey(ingredient, zip_code), {})
+
+    def record(self, ingredient, zip_code, **fields):
+        with self._lock:
+            entry = self.pairs.setdefault(pairKey(ingredient, zip_code), {})
+            entry.update(fields)
+            self._save()
+
+    def _save(self):
+        # Write to a temporary file first so a crash never leaves a truncated checkpoint behind
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            json.dump({"pairs": self.pairs}, f)
+        os.replace(temporary_path, self.path)
+
+
+def planWork(ingredients, zip_codes, checkpoint, popularity, max_age_seconds, now=None):
+    """
+    Order the pairs that need refreshing.
+
+    Pairs never scraped come first, then the stalest; among equally stale pairs the
+    ingredients used by more recipes go first. Pairs refreshed within max_age_seconds
+    are skipped, and so are pairs still backing off after a failure.
+    """
+    now = now or time.time()
+    work = []
+    for ingredient in ingredients:
+        for zip_code in zip_codes:
+            entry = checkpoint.get(ingredient, zip_code)
+            last_success = entry.get("last_success", 0)
+            age = now - last_success
+            if last_success and age < max_age_seconds:
+                continue
+            failures = entry.get("failures", 0)
+            if failures:
+                backoff = min(max_age_seconds, RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+                if now - entry.get("last_attempt", 0) < backoff:
+                    continue
+            # Bucket ages by hour so popularity decides between pairs of similar staleness
+            work.append((-int(age // 3600), -popularity.get(ingredient, 0), ingredient, zip_code))
+    work.sort()
+    return [(ingredient, zip_code) for _, _, ingredient, zip_code in work]
+
+
+def ingredientPopularity(ingredients):
+    """Number of recent recipes using each ingredient (substring match on the recipe's ingredient names)."""
+    try:
+        counts = supabaseWrapper.get_recipe_ingredient_counts()
+    except Exception as e:
+        print(f"Could not load ingredient popularity, using list order: {e}")
+        return {}
+    return {
+        ingredient: sum(count for name, count in counts.items() if ingredient.lower() in name)
+        for ingredient in ingredients
+    }
+
+
+class Progress:
+    """Counters printed as the run goes and returned at the end."""
+
+    def __init__(self, total):
+        self.total = total
+        self.started_at = time.monotonic()
+        self.values = {"done": 0, "failed": 0, "empty": 0, "created": 0, "updated": 0, "unchanged": 0}
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for field, amount in amounts.items():
+                self.values[field] += amount
+            return dict(self.values)
+
+    def line(self, values, label):
+        elapsed = time.monotonic() - self.started_at
+        finished = values["done"] + values["failed"]
+        rate = finished / elapsed if elapsed else 0.0
+        eta = (self.total - finished) / rate if rate else 0.0
+        llm = llm_metrics.snapshot()
+        return (
+            f"[{finished}/{self.total}] {label} | {rate * 60:.1f} pairs/min, eta {eta / 60:.1f} min | "
+            f"products created {values['created']} updated {values['updated']} unchanged {values['unchanged']} | "
+            f"failed {values['failed']} empty {values['empty']} | "
+            f"gemini calls {llm['calls']} throttled {llm['throttled']} rate-limited {llm['rate_limited']}"
+        )
+
+    def summary(self):
+        values = dict(self.values)
+        values["total"] = self.total
+        values["elapsed_seconds"] = round(time.monotonic() - self.started_at, 1)
+        values["llm"] = llm_metrics.snapshot()
+        return values
+
+
+def warmPair(ingredient, zip_code, checkpoint, progress, budget):
+    # Provider-level budget on top of the Gemini limiter the scrape itself goes through
+    wait = budget.reserve()
+    if wait > 0:
+        time.sleep(wait)
+
+    checkpoint.record(ingredient, zip_code, last_attempt=time.time())
+    timings = {}
+    errors = {}
+    statuses = []
+    try:
+        products = getProducts(ingredient, zip_code, timings, errors)
+        # Whatever did come back is still worth storing, even if the pair is retried
+        if products:
+            result = storeProducts(products)
+            if result["error"]:
+                raise RuntimeError(result["error"])
+            statuses = [row["status"] for row in result["results"]]
+        if errors:
+            raise RuntimeError("; ".join(f"{provider}: {error}" for provider, error in errors.items()))
+        if not statuses:
+            raise RuntimeError("no products found")
+    except Exception as e:
+        # No last_success: an outage or empty scrape must not mark the pair fresh
+        entry = checkpoint.get(ingredient, zip_code)
+        checkpoint.record(ingredient, zip_code, failures=entry.get("failures", 0) + 1, last_error=str(e)[:200])
+        values = progress.add(
+            failed=1,
+            empty=int(not statuses and not errors),
+            created=statuses.count("created"),
+            updated=statuses.count("updated"),
+            unchanged=statuses.count("unchanged"),
+        )
+        print(progress.line(values, f"FAILED {ingredient} @ {zip_code}: {e}"))
+        return
+
+    checkpoint.record(
+        ingredient, zip_code,
+        last_success=time.time(), products=len(statuses), failures=0, last_error=None, timings=timings,
+    )
+    values = progress.add(
+        done=1,
+        created=statuses.count("created"),
+        updated=statuses.count("updated"),
+        unchanged=statuses.count("unchanged"),
+    )
+    print(progress.line(values, f"{ingredient} @ {zip_code}: {len(statuses)} products in {timings.get('total', 0)}s"))
+
+
+def prewarm(ingredients, zip_codes, checkpoint_path=DEFAULT_CHECKPOINT_PATH, concurrency=2,
+            scrapes_per_minute=20, max_age_seconds=24 * 3600, limit=None):
+    """
+    Refresh every stale ingredient/zip pair once.
+
+    Returns:
+        dict: Run summary (pairs done, failed, product statuses, elapsed time, Gemini metrics)
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    work = planWork(ingredients, zip_codes, checkpoint, ingredientPopularity(ingredients), max_age_seconds)
+    if limit is not None:
+        work = work[:limit]
+    print(f"Pre-warming {len(work)} of {len(ingredients) * len(zip_codes)} ingredient/zip pairs with {concurrency} workers")
+
+    progress = Progress(len(work))
+    budget = TokenBucket(scrapes_per_minute, max(1, concurrency))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(warmPair, ingredient, zip_code, checkpoint, progress, budget) for ingredient, zip_code in work]
+        for future in as_completed(futures):
+            future.result()
+    summary = progress.summary()
+    print(f"Pre-warm finished: {json.dumps(summary)}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the products table warm for common ingredients")
+    parser.add_argument("--ingredients", help="Comma-separated ingredients, or @file with one per line (default: STAPLE_INGREDIENTS)")
+    parser.add_argument("--zips", default=os.getenv("PREWARM_ZIP_CODES", "47906"), help="Comma-separated zip codes")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("PREWARM_CONCURRENCY", "2")))
+    parser.add_argument("--scrapes-per-minute", type=float, default=float(os.getenv("PREWARM_SCRAPES_PER_MINUTE", "20")),
+                        help="Upper bound on pairs started per minute across all workers")
+    parser.add_argument("--max-age-hours", type=float, default=24, help="Skip pairs refreshed more recently than this")
+    parser.add_argument("--limit", type=int, help="Refresh at most this many pairs per pass")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--loop", action="store_true", help="Keep running, starting a new pass every --interval-hours")
+    parser.add_argument("--interval-hours", type=float, default=6)
+    args = parser.parse_args()
+
+    if not args.ingredients:
+        ingredients = STAPLE_INGREDIENTS
+    elif args.ingredients.startswith("@"):
+        with open(args.ingredients[1:], 'r') as f:
+            ingredients = [line.strip() for line in f if line.strip()]
+    else:
+        ingredients = [name.strip() for name in args.ingredients.split(",") if name.strip()]
+    zip_codes = [zip_code.strip() for zip_code in args.zips.split(",") if zip_code.strip()]
+
+    while True:
+        prewarm(
+            ingredients, zip_codes,
+            checkpoint_path=args.checkpoint,
+            concurrency=args.concurrency,
+            scrapes_per_minute=args.scrapes_per_minute,
+            max_age_seconds=args.max_age_hours * 3600,
+            limit=args.limit,
+        )
+        if not args.loop:
+            break
+        time.sleep(args.interval_hours * 3600)
+
+
+if __name__ == "__main__":
+    main()
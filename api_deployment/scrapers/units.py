@@ -0,0 +1,319 @@
+import re
+
+# Conversion factors to ounces. Weights convert to avoirdupois ounces and volumes to fluid ounces,
+# which is how products are compared in the products table (Product.unitAmountOz).
+WEIGHT_UNITS = {
+    "oz": 1.0,
+    "ounce": 1.0,
+    "ounces": 1.0,
+    "lb": 16.0,
+    "lbs": 16.0,
+    "pound": 16.0,
+    "pounds": 16.0,
+    "mg": 0.001 / 28.349523125,
+    "g": 1 / 28.349523125,
+    "gr": 1 / 28.349523125,
+    "gram": 1 / 28.349523125,
+    "grams": 1 / 28.349523125,
+    "kg": 35.27396195,
+    "kilogram": 35.27396195,
+    "kilograms": 35.27396195,
+}
+
+VOLUME_UNITS = {
+    "fl oz": 1.0,
+    "floz": 1.0,
+    "fluid ounce": 1.0,
+    "fluid ounces": 1.0,
+    "ml": 0.033814022,
+    "milliliter": 0.033814022,
+    "milliliters": 0.033814022,
+    "l": 33.814022,
+    "liter": 33.814022,
+    "liters": 33.814022,
+    "litre": 33.814022,
+    "litres": 33.814022,
+    "gal": 128.0,
+    "gallon": 128.0,
+    "gallons": 128.0,
+    "qt": 32.0,
+    "quart": 32.0,
+    "quarts": 32.0,
+    "pt": 16.0,
+    "pint": 16.0,
+    "pints": 16.0,
+    "cup": 8.0,
+    "cups": 8.0,
+    "tbsp": 0.5,
+    "tablespoon": 0.5,
+    "tablespoons": 0.5,
+    "tsp": 1 / 6,
+    "teaspoon": 1 / 6,
+    "teaspoons": 1 / 6,
+}
+
+COUNT_UNITS = {
+    "ct": 1,
+    "count": 1,
+    "pk": 1,
+    "pack": 1,
+    "pc": 1,
+    "pcs": 1,
+    "piece": 1,
+    "pieces": 1,
+    "each": 1,
+    "ea": 1,
+    "dozen": 12,
+    "doz": 12,
+}
+
+# Confidence assigned to each kind of match. Anything below PARSER_CONFIDENCE_THRESHOLD in
+# scrapers/__init__.py is handed to Gemini instead.
+CONFIDENCE = {
+    "multipack": 0.95,
+    "single": 0.95,
+    "range": 0.8,
+    "unit_price": 0.85,
+    "conflict": 0.6,
+    "count": 0.6,
+    "none": 0.0,
+}
+
+UNICODE_FRACTIONS = {
+    "½": " 1/2", "¼": " 1/4", "¾": " 3/4", "⅓": " 1/3", "⅔": " 2/3",
+    "⅛": " 1/8", "⅜": " 3/8", "⅝": " 5/8", "⅞": " 7/8",
+}
+
+NUMBER = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)"
+# Longest alternatives first so "fl oz" wins over "oz" and "lbs" over "lb"
+_unit_names = sorted(set(WEIGHT_UNITS) | set(VOLUME_UNITS) | set(COUNT_UNITS), key=len, reverse=True)
+UNIT = r"(?:" + "|".join(re.escape(name).replace(r"\ ", r"\s*") for name in _unit_names) + r")"
+
+# "12pk/12 fl oz", "6 ct / 16.9 fl oz", "6 x 12 fl oz" and "2-pack 32 oz", but never a fraction like "1/2 gal"
+MULTIPACK_PATTERN = re.compile(
+    rf"(?<![\d./])(?P<count>\d+)\s*(?:(?:pk|pack|ct|count|cans?|bottles?|boxes?|bags?)\s*(?:x|/)|x|\s/\s|-\s*(?:pk|pack)s?[\s,]*(?:x|/)?)\s*(?P<amount>{NUMBER})\s*(?P<unit>{UNIT})(?![a-z])"
+)
+RANGE_PATTERN = re.compile(
+    rf"(?P<low>{NUMBER})\s*(?:-|to)\s*(?P<high>{NUMBER})\s*(?P<unit>{UNIT})(?![a-z])"
+)
+SINGLE_PATTERN = re.compile(rf"(?<![\d./])(?P<amount>{NUMBER})\s*(?P<unit>{UNIT})(?![a-z])")
+BARE_COUNT_PATTERN = re.compile(r"(?<![a-z])(?:each|ea|dozen)(?![a-z])")
+PRICE_PATTERN = re.compile(r"\d*\.?\d+")
+
+
+def parseNumber(text):
+    """Parse "2", "1.5", "1/2" or "1 1/2" into a float."""
+    text = text.strip()
+    if " " in text:
+        whole, fraction = text.split(None, 1)
+        return float(whole) + parseNumber(fraction)
+    if "/" in text:
+        numerator, denominator = text.split("/", 1)
+        return float(numerator) / float(denominator)
+    return float(text)
+
+
+def normalizeUnit(unit):
+    """Lowercase a unit and collapse "fl. oz" style spellings to the table keys."""
+    unit = unit.lower().replace(".", "").strip()
+    return re.sub(r"\s+", " ", unit)
+
+
+def unitKind(unit):
+    unit = normalizeUnit(unit)
+    if unit in VOLUME_UNITS:
+        return "volume"
+    if unit in WEIGHT_UNITS:
+        return "weight"
+    if unit in COUNT_UNITS:
+        return "count"
+    return None
+
+
+def toOunces(amount, unit):
+    """
+    Convert an amount in a weight or volume unit to ounces.
+
+    Args:
+        amount (float): The amount to convert
+        unit (str): Unit name or abbreviation, e.g. "lb", "grams", "fl oz"
+
+    Returns:
+        float or None: The amount in ounces, or None for counts and unknown units
+    """
+    unit = normalizeUnit(unit)
+    if unit in VOLUME_UNITS:
+        return amount * VOLUME_UNITS[unit]
+    if unit in WEIGHT_UNITS:
+        return amount * WEIGHT_UNITS[unit]
+    return None
+
+
+def _result(ounces=None, count=None, kind=None, match="none", text=""):
+    return {
+        "ounces": round(ounces, 4) if ounces is not None else None,
+        "count": count,
+        "kind": kind,
+        "confidence": CONFIDENCE[match],
+        "match": match,
+        "source": text,
+    }
+
+
+def _cleanText(text):
+    text = str(text or "").lower()
+    for fraction, replacement in UNICODE_FRACTIONS.items():
+        text = text.replace(fraction, replacement)
+    text = text.replace("×", "x").replace("–", "-").replace("fl.", "fl").replace("oz.", "oz")
+    return text
+
+
+def parseQuantity(text):
+    """
+    Parse a package size such as "14 oz", "1 1/2 lb", "6 x 12 fl oz", "1.12-2.25 lbs" or "12 ct".
+
+    Weights and volumes are converted to ounces. Multipacks are multiplied out and ranges
+    resolve to their midpoint.
+
+    Args:
+        text (str): A size string or a product title containing one
+
+    Returns:
+        dict: ounces, count, kind ("weight", "volume" or "count"), confidence (0-1),
+              match (which rule matched) and source (the matched text)
+    """
+    text = _cleanText(text)
+
+    multipack = MULTIPACK_PATTERN.search(text)
+    if multipack and unitKind(multipack.group("unit")) in ("weight", "volume"):
+        count = int(multipack.group("count"))
+        per_item = toOunces(parseNumber(multipack.group("amount")), multipack.group("unit"))
+        return _result(count * per_item, count, unitKind(multipack.group("unit")), "multipack", multipack.group(0))
+
+    ranged = RANGE_PATTERN.search(text)
+    if ranged and unitKind(ranged.group("unit")) in ("weight", "volume"):
+        low = parseNumber(ranged.group("low"))
+        high = parseNumber(ranged.group("high"))
+        if high >= low:
+            ounces = toOunces((low + high) / 2, ranged.group("unit"))
+            return _result(ounces, None, unitKind(ranged.group("unit")), "range", ranged.group(0))
+
+    measures = []
+    counts = []
+    for match in SINGLE_PATTERN.finditer(text):
+        kind = unitKind(match.group("unit"))
+        amount = parseNumber(match.group("amount"))
+        if kind == "count":
+            counts.append((amount * COUNT_UNITS[normalizeUnit(match.group("unit"))], match.group(0)))
+        elif kind and amount > 0:
+            measures.append((toOunces(amount, match.group("unit")), kind, match.group(0)))
+
+    if measures:
+        ounces, kind, source = measures[0]
+        count = int(counts[0][0]) if counts else None
+        distinct = {round(measure[0], 2) for measure in measures}
+        # "4ct 5.3oz" could be the total or a per-item size, so let the LLM decide
+        ambiguous = len(distinct) > 1 or (count is not None and count > 1)
+        return _result(ounces, count, kind, "conflict" if ambiguous else "single", source)
+
+    if counts:
+        return _result(None, int(counts[0][0]), "count", "count", counts[0][1])
+
+    bare = BARE_COUNT_PATTERN.search(text)
+    if bare:
+        return _result(None, 12 if bare.group(0) == "dozen" else 1, "count", "count", bare.group(0))
+
+    return _result(text=text)
+
+
+def parsePrice(value):
+    """Parse 3.99, "3.99" or "$3.99" into a float, or None."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = PRICE_PATTERN.search(str(value or "").replace(",", ""))
+    return float(match.group(0)) if match else None
+
+
+def pricePerOunce(price, ounces):
+    """Price per ounce, or None when either side is unknown."""
+    if price is None or not ounces:
+        return None
+    return round(price / ounces, 4)
+
+
+def normalizeProduct(product, query):
+    """
+    Build a refined product (the scrapingInterface.json shape) from a raw Target or Kroger
+    product without calling an LLM.
+
+    Args:
+        product (dict): Raw product from getTargetProducts or getKrogerProductDetails
+        query (str): The original search query, used as the category
+
+    Returns:
+        dict: itemName, category, brand, price, unitAmountInOunces, provider,
+              pricePerOunce and confidence
+    """
+    price = parsePrice(product.get("price"))
+    parsed = parseQuantity(product.get("size")) if product.get("size") else _result()
+    if parsed["ounces"] is None:
+        title_parsed = parseQuantity(product.get("title"))
+        if title_parsed["confidence"] >= parsed["confidence"]:
+            parsed = title_parsed
+
+    # Target reports a unit price like "$0.25" "/ounce"; use it to recover or cross-check the size
+    unit_price = parsePrice(product.get("unit_price"))
+    suffix = str(product.get("unit_price_suffix") or "").lower()
+    if price and unit_price and ("ounce" in suffix or "/oz" in suffix or "fluid ounce" in suffix):
+        derived = price / unit_price
+        if parsed["ounces"] is None:
+            parsed = _result(derived, parsed["count"], "weight", "unit_price", f"{product.get('unit_price')}{suffix}")
+        elif unit_price >= 0.1 and abs(derived - parsed["ounces"]) > max(1.0, 0.15 * parsed["ounces"]):
+            # Unit prices are rounded to cents, so only cross-check when that rounding is small
+            parsed["confidence"] = min(parsed["confidence"], CONFIDENCE["conflict"])
+
+    ounces = parsed["ounces"]
+    confidence = parsed["confidence"] if price else 0.0
+    return {
+        "itemName": str(product.get("title") or "").strip(),
+        "category": query.strip().title(),
+        "brand": str(product.get("brand") or "").strip(),
+        "price": price,
+        "unitAmountInOunces": ounces if ounces is not None else parsed["count"],
+        "provider": product.get("provider"),
+        "pricePerOunce": pricePerOunce(price, ounces),
+        "confidence": confidence,
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    import time
+
+    # Corpus check and benchmark: python -m scrapers.units
+    corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sizeCorpus.json")
+    with open(corpus_path, "r") as f:
+        corpus = json.load(f)
+
+    failures = 0
+    for case in corpus:
+        parsed = parseQuantity(case["text"])
+        expected_ounces = case.get("ounces")
+        ok = (
+            (expected_ounces is None and parsed["ounces"] is None)
+            or (expected_ounces is not None and parsed["ounces"] is not None and abs(parsed["ounces"] - expected_ounces) < 0.05)
+        ) and parsed["count"] == case.get("count", parsed["count"])
+        if not ok:
+            failures += 1
+            print(f"MISMATCH [{case['provider']}] {case['text']!r}: expected {expected_ounces}, got {parsed}")
+    print(f"Corpus: {len(corpus) - failures}/{len(corpus)} size strings parsed as expected")
+
+    iterations = 200
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for case in corpus:
+            parseQuantity(case["text"])
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (iterations * len(corpus))
+    print(f"Benchmark: {per_call * 1e6:.1f} µs per size string ({iterations * len(corpus)} parses in {elapsed:.3f}s)")
@@ -1,19 +1,42 @@
 from fastapi import FastAPI, HTTPException, Request, Query
 from pydantic import BaseModel
 from src.recipe_provider import RecipeProvider
+from src.recipe_cache import RecipeCache
 import uvicorn
+import asyncio
 import json
+import math
+import os
+import threading
+import time
 import traceback
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from db.pydanticTypes import Recipe, Product
 import db.supabaseWrapper as supabaseWrapper
-from scrapers import getProducts
+from scrapers import getProducts, storeProducts
+from scrapers.units import toOunces
+from src.executor import run_blocking, shutdown as shutdown_executors
+from src.llm_cache import get_llm_cache
+from src.llm_capture import CAPTURE_DEBUG_ENDPOINT, get_llm_capture, start_request
+from src.metrics import http_request_seconds, registry as metrics_registry
+from src.llm_client import LLMError, LLMRateLimitError, LLMResponseError, metrics as llm_metrics
+from contextlib import asynccontextmanager
 from enum import Enum
 from typing import Optional
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the saved recipes before serving, so the first request doesn't pay for the table read
+    await run_blocking("db", recipe_provider.recipe_cache.load)
+    yield
+    # Let in-flight blocking calls finish before the worker exits
+    shutdown_executors(wait=True)
+    get_llm_capture().close()
+
 app = FastAPI(title="Recipe Generation API", 
-              description="API for generating recipes based on user queries")
+              description="API for generating recipes based on user queries",
+              lifespan=lifespan)
 
 # Add CORS middleware to allow any origin
 app.add_middleware(
@@ -24,6 +47,24 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+@app.middleware("http")
+async def request_middleware(request: Request, call_next):
+    # LLM captures made while handling this request are filed under its id
+    request_id = start_request(request.headers.get("X-Request-ID"))
+    start = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+    finally:
+        # Label by route template, not the raw path, so ids don't multiply the series
+        route = request.scope.get("route")
+        http_request_seconds.observe(
+            time.perf_counter() - start, request.method, getattr(route, "path", "unmatched"), status
+        )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Add global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -37,7 +78,25 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": error_detail}
     )
 
-recipe_provider = RecipeProvider()
+@app.exception_handler(LLMError)
+async def llm_exception_handler(request: Request, exc: LLMError):
+    # Rate limiting and provider outages are reported as such instead of as a generic 500
+    if isinstance(exc, LLMRateLimitError):
+        status_code = 429
+    elif isinstance(exc, LLMResponseError):
+        status_code = 502
+    else:
+        status_code = 503
+    headers = {}
+    if isinstance(exc, LLMRateLimitError) and exc.retry_after:
+        headers["Retry-After"] = str(max(1, int(exc.retry_after)))
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": {"error": str(exc), "type": type(exc).__name__}},
+        headers=headers
+    )
+
+recipe_provider = RecipeProvider(recipe_cache=RecipeCache(load_recipes=supabaseWrapper.get_recipes_for_cache))
 
 class RecipeQuery(BaseModel):
     query: str
@@ -46,6 +105,62 @@ class RecipeResponse(BaseModel):
     title: str
     content: str
 
+def normalize_recipe_response(recipe_content) -> dict:
+    """
+    Turn the provider's recipe (a JSON string or dict) into a RecipeResponse-shaped dict.
+
+    Raises:
+        HTTPException: If the provider's output can't be used
+    """
+    # Process the response - either parse JSON string or use dict directly
+    if isinstance(recipe_content, str):
+        try:
+            recipe_data = json.loads(recipe_content)
+        except json.JSONDecodeError as e:
+            raise HTTPException(
+                status_code=500, 
+                detail={
+                    "error": "Invalid JSON response from recipe provider",
+                    "raw_content": recipe_content[:500],  # First 500 chars for debugging
+                    "exception": str(e)
+                }
+            )
+    else:
+        recipe_data = recipe_content
+    
+    # Check if the response is a valid JSON object
+    if not isinstance(recipe_data, dict):
+        raise HTTPException(
+            status_code=500, 
+            detail={
+                "error": "Response is not a valid JSON object",
+                "type": type(recipe_data).__name__,
+                "content_preview": str(recipe_data)[:500] if recipe_data else "None"
+            }
+        )
+    
+    # Validate required fields
+    if "title" not in recipe_data or "content" not in recipe_data:
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "Missing required fields in recipe data",
+                "received_fields": list(recipe_data.keys()),
+                "required_fields": ["title", "content"]
+            }
+        )
+    
+    # Format the content to ensure it's a string
+    if isinstance(recipe_data["content"], list):
+        recipe_data["content"] = "\n".join(recipe_data["content"])
+    elif not isinstance(recipe_data["content"], str):
+        recipe_data["content"] = str(recipe_data["content"])
+    # Ensure the title is a string
+    if not isinstance(recipe_data["title"], str):
+        recipe_data["title"] = str(recipe_data["title"])    
+
+    return recipe_data
+
 @app.post("/generate-recipe", response_model=RecipeResponse)
 async def generate_recipe(recipe_query: RecipeQuery):
     """
@@ -55,55 +170,8 @@ async def generate_recipe(recipe_query: RecipeQuery):
     """
     try:
         # Generate recipe based on the query
-        recipe_content = recipe_provider.generate_recipe_for_query(recipe_query.query)
-        # Process the response - either parse JSON string or use dict directly
-        if isinstance(recipe_content, str):
-            try:
-                recipe_data = json.loads(recipe_content)
-            except json.JSONDecodeError as e:
-                raise HTTPException(
-                    status_code=500, 
-                    detail={
-                        "error": "Invalid JSON response from recipe provider",
-                        "raw_content": recipe_content[:500],  # First 500 chars for debugging
-                        "exception": str(e)
-                    }
-                )
-        else:
-            recipe_data = recipe_content
-        
-        # Check if the response is a valid JSON object
-        if not isinstance(recipe_data, dict):
-            raise HTTPException(
-                status_code=500, 
-                detail={
-                    "error": "Response is not a valid JSON object",
-                    "type": type(recipe_data).__name__,
-                    "content_preview": str(recipe_data)[:500] if recipe_data else "None"
-                }
-            )
-        
-        # Validate required fields
-        if "title" not in recipe_data or "content" not in recipe_data:
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    "error": "Missing required fields in recipe data",
-                    "received_fields": list(recipe_data.keys()),
-                    "required_fields": ["title", "content"]
-                }
-            )
-        
-        # Format the content to ensure it's a string
-        if isinstance(recipe_data["content"], list):
-            recipe_data["content"] = "\n".join(recipe_data["content"])
-        elif not isinstance(recipe_data["content"], str):
-            recipe_data["content"] = str(recipe_data["content"])
-        # Ensure the title is a string
-        if not isinstance(recipe_data["title"], str):
-            recipe_data["title"] = str(recipe_data["title"])    
-
-        return recipe_data
+        recipe_content = await run_blocking("llm", recipe_provider.generate_recipe_for_query, recipe_query.query)
+        return normalize_recipe_response(recipe_content)
     
     except json.JSONDecodeError as e:
         raise HTTPException(
@@ -118,6 +186,58 @@ async def generate_recipe(recipe_query: RecipeQuery):
         # Let the global handler catch this
         raise
 
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate-recipe/stream")
+async def generate_recipe_stream(recipe_query: RecipeQuery):
+    """
+    Generate a recipe like /generate-recipe, streamed as Server-Sent Events.
+
+    Emits started, search_query, sources, generation_started, one delta per chunk of
+    recipe text, and finally recipe (a RecipeResponse) or error. A query answered from
+    the recipe cache gets cache_hit followed directly by recipe.
+    """
+    async def events():
+        # Sent before any blocking work so the client gets its first byte immediately
+        yield sse_event("started", {"query": recipe_query.query})
+        stream = recipe_provider.stream_recipe_for_query(recipe_query.query)
+        finished = object()
+        # A cancelled step keeps running on its worker, so closing waits for it to return
+        stream_lock = threading.Lock()
+
+        def step():
+            with stream_lock:
+                return next(stream, finished)
+
+        def close():
+            with stream_lock:
+                stream.close()
+
+        try:
+            while True:
+                # Each step of the provider's generator blocks, so it runs on the LLM pool
+                event = await run_blocking("llm", step)
+                if event is finished:
+                    break
+                if event["event"] == "recipe":
+                    try:
+                        yield sse_event("recipe", normalize_recipe_response(event["data"]))
+                    except HTTPException as e:
+                        yield sse_event("error", e.detail)
+                else:
+                    yield sse_event(event["event"], event["data"])
+        finally:
+            # On a client disconnect, release the Gemini stream and its LLM worker now rather than at garbage collection
+            await run_blocking("llm", close)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 class IngredientsList(BaseModel):
     ingredients: list[str]
 
@@ -129,8 +249,12 @@ async def generate_shopping_list(ingredients_list: IngredientsList):
     Returns a JSON object containing the organized shopping list.
     """
     try:
-        shopping_list = recipe_provider.generate_shopping_list_from_ingredients(ingredients_list.ingredients)
+        shopping_list = await run_blocking(
+            "llm", recipe_provider.generate_shopping_list_from_ingredients, ingredients_list.ingredients
+        )
         return shopping_list
+    except LLMError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error": str(e)})
     
@@ -140,7 +264,7 @@ async def recipe(recipe: Recipe):
     Generate a recipe based on the provided recipe.
     """
     # Use the supabaseWrapper to create the recipe
-    recipeResult = supabaseWrapper.create_recipe(recipe)
+    recipeResult = await run_blocking("db", supabaseWrapper.create_recipe, recipe)
     if "error" in recipeResult:
         raise HTTPException(status_code=500, detail={"error": recipeResult["error"]})
     else:
@@ -151,7 +275,7 @@ async def recipe(recipe_id: str):
     """
     Get a recipe from the database.
     """
-    recipe = supabaseWrapper.get_recipe(recipe_id)
+    recipe = await run_blocking("db", supabaseWrapper.get_recipe, recipe_id)
     if "error" in recipe:
         raise HTTPException(status_code=500, detail={"error": recipe["error"]})
     else:
@@ -162,12 +286,20 @@ class SortType(str, Enum):
     NEWEST = "newest"
     OLDEST = "oldest"
 
+class CommentMode(str, Enum):
+    ALL = "all"
+    COUNT = "count"
+    NONE = "none"
+
 @app.get("/recipes")
 async def recipes(
     sort_type: Optional[SortType] = Query("newest", description="How to sort the recipes (popular, newest, oldest)"),
     limit: Optional[int] = Query(10, description="Maximum number of recipes to return", gt=0),
     page: Optional[int] = Query(1, description="Page number for pagination", gt=0),
-    search: Optional[str] = Query(None, description="Search term to filter recipes by title, tags, or ingredients")
+    search: Optional[str] = Query(None, description="Search term to filter recipes by title, tags, or ingredients"),
+    comments: Optional[CommentMode] = Query("all", description="Attach comments (all), only comment counts (count), or nothing (none)"),
+    comments_limit: Optional[int] = Query(None, description="Only attach the first N comments per recipe", gt=0),
+    cursor: Optional[str] = Query(None, description="Opaque next_cursor from the previous page (takes precedence over page)")
 ):
     """
     Get recipes from the database with optional pagination, sorting, and search.
@@ -176,41 +308,53 @@ async def recipes(
     - sort_type: How to sort the recipes (popular, newest, oldest)
     - limit: Maximum number of recipes to return (default: 10)
     - page: Page number for pagination (default: 1)
-    - search: Optional search term to filter recipes
+    - search: Optional search term; matches title, tags, cuisine and ingredients (typo tolerant),
+      ranked by relevance with sort_type breaking ties
+    - comments: all, count or none (default: all)
+    - comments_limit: Maximum number of comments attached per recipe
+    - cursor: next_cursor from a previous response; fetches the following page in constant time
     
     Returns a JSON object containing the recipes and pagination metadata.
     """
-    # Calculate offset for pagination
-    offset = (page - 1) * limit
+    # Calculate offset for pagination (only used when no cursor is given)
+    offset = 0 if cursor else (page - 1) * limit
     
-    # Get recipes with pagination, sorting, and search
-    recipes_result = supabaseWrapper.get_recipes(
-        sort_type=sort_type.value if sort_type else None,
-        limit=limit,
-        offset=offset,
-        search=search
+    # Get the page and the (cached) total count concurrently
+    recipes_result, total = await asyncio.gather(
+        run_blocking(
+            "db",
+            supabaseWrapper.get_recipes,
+            sort_type=sort_type.value if sort_type else None,
+            limit=limit,
+            offset=offset,
+            search=search,
+            comments=comments.value if comments else "all",
+            comments_limit=comments_limit,
+            cursor=cursor
+        ),
+        run_blocking("db", supabaseWrapper.count_recipes, search)
     )
     
-    # If the supabaseWrapper doesn't return pagination metadata,
-    # we can add it here
-    if isinstance(recipes_result, list):
-        return {
-            "data": recipes_result,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": len(recipes_result)  # This would ideally come from the database
-            }
+    if "error" in recipes_result:
+        raise HTTPException(status_code=400, detail={"error": recipes_result["error"]})
+
+    return {
+        "data": recipes_result["data"],
+        "pagination": {
+            "page": None if cursor else page,
+            "limit": limit,
+            "total": total,
+            "total_pages": math.ceil(total / limit) if total is not None else None,
+            "next_cursor": recipes_result["next_cursor"]
         }
-    
-    return recipes_result
+    }
 
 @app.get("/featuredRecipes")
 async def featuredRecipes():
     """
     Get the featured recipes for today.
     """
-    recipes = supabaseWrapper.get_featured_recipes()
+    recipes = await run_blocking("db", supabaseWrapper.get_featured_recipes)
     if "error" in recipes:
         raise HTTPException(status_code=500, detail={"error": recipes["error"]})
     else:
@@ -227,32 +371,16 @@ async def scrapeIngredients(product_query: ProductQuery):
     
     Accepts a JSON body with product_name and zip_code fields.
     """
-    products = getProducts(product_query.product_name, product_query.zip_code)
-    uploaded_products = []
-    for product in products:
-        try:
-            # unitAmountInOunces must be set to unitAmountOz
-            product["unitAmountOz"] = product["unitAmountInOunces"]
-            del product["unitAmountInOunces"]
-            # make sure the product is formatted correctly
-            product["provider"] = product["provider"].strip()
-            product["itemName"] = product["itemName"].strip()
-            product["category"] = product["category"].strip()
-            product["brand"] = product["brand"].strip()
-            product["unitAmountOz"] = float(product["unitAmountOz"])
-            product["price"] = float(product["price"])
-
-            product = Product(**product)
-
-            # Add the product to the database
-            upload_result = supabaseWrapper.create_product(product)
-            if upload_result["error"]:
-                print(f"Error uploading product! {upload_result['error']}")
-            else:
-                uploaded_products.append(product)
-        except Exception as e:
-            print(f"Error uploading product! {e}")
-    return uploaded_products
+    products = await run_blocking("scrape", getProducts, product_query.product_name, product_query.zip_code)
+    return await store_scraped_products(products)
+
+async def store_scraped_products(products: list) -> list[Product]:
+    """Validate freshly scraped products and save them in one upsert, returning the ones that were stored."""
+    upload_result = await run_blocking("db", storeProducts, products)
+    if upload_result["error"]:
+        print(f"Error uploading products! {upload_result['error']}")
+        return []
+    return [Product(**result["product"]) for result in upload_result["results"]]
 
 class Unit(str, Enum):
     OUNCES = "ounces"
@@ -279,35 +407,127 @@ async def shoppingList(shopping_list_query: ShoppingListQuery):
     """
     Get a shopping list based on the provided ingredients.
     """
-    list_of_ingredients = []
-    for ingredient in shopping_list_query.ingredients:
-        list_of_ingredients.append(f"{ingredient.amount} {ingredient.unit} {ingredient.name}")
-    shopping_list = recipe_provider.generate_shopping_list_from_ingredients(list_of_ingredients)
+    list_of_ingredients = [ingredient.model_dump() for ingredient in shopping_list_query.ingredients]
+    shopping_list = await run_blocking("llm", recipe_provider.generate_shopping_list_from_ingredients, list_of_ingredients)
     return shopping_list
 
+def to_ounces(amount: float, unit: str) -> float:
+    """Convert an ingredient amount to ounces; counts and unknown units match any package size."""
+    ounces = toOunces(amount, unit)
+    return ounces if ounces is not None else 0.0
+
+# Maximum number of ingredients scraped at once by /ingredients/bulk
+BULK_SCRAPE_CONCURRENCY = int(os.getenv("BULK_SCRAPE_CONCURRENCY", "4"))
+
+class BulkIngredientQuery(BaseModel):
+    ingredients: list[Ingredient]
+    zip_code: Optional[str] = None
+
+@app.post("/ingredients/bulk")
+async def ingredients_bulk(bulk_query: BulkIngredientQuery):
+    """
+    Price a whole ingredient list in one request.
+
+    Every ingredient is looked up at once; when a zip_code is given, the ones with no
+    stored product are scraped concurrently and looked up again.
+
+    Returns the cheapest product per provider for each ingredient, plus per-provider
+    basket totals and the ingredients each provider is missing.
+    """
+    # Convert every amount to ounces once; repeated ingredients need their combined amount
+    minimum_amounts = {}
+    for ingredient in bulk_query.ingredients:
+        name = ingredient.name.strip().lower()
+        minimum_amounts[name] = minimum_amounts.get(name, 0.0) + to_ounces(ingredient.amount, ingredient.unit)
+
+    matches = await run_blocking("db", supabaseWrapper.get_products_bulk, minimum_amounts)
+    missing = [name for name, products in matches.items() if not products]
+
+    scraped = []
+    if missing and bulk_query.zip_code:
+        limit = asyncio.Semaphore(BULK_SCRAPE_CONCURRENCY)
+
+        async def scrape(name):
+            async with limit:
+                try:
+                    products = await run_blocking("scrape", getProducts, name, bulk_query.zip_code)
+                except Exception as e:
+                    print(f"Error scraping {name}: {e}")
+                    return
+            await store_scraped_products(products)
+            scraped.append(name)
+
+        await asyncio.gather(*(scrape(name) for name in missing))
+        if scraped:
+            matches.update(await run_blocking(
+                "db", supabaseWrapper.get_products_bulk, {name: minimum_amounts[name] for name in scraped}
+            ))
+        missing = [name for name, products in matches.items() if not products]
+
+    providers = sorted({provider for products in matches.values() for provider in products})
+    totals = {}
+    for provider in providers:
+        found = {name: products[provider] for name, products in matches.items() if provider in products}
+        totals[provider] = {
+            "total": round(sum(product["price"] for product in found.values()), 2),
+            "found": len(found),
+            "missing": [name for name in matches if name not in found],
+        }
+
+    return {
+        "ingredients": [
+            {"name": name, "amountOz": round(minimum_amounts[name], 4), "products": products}
+            for name, products in matches.items()
+        ],
+        "totals": totals,
+        "missing": missing,
+        "scraped": scraped,
+    }
+
 @app.post("/ingredients")
 async def ingredients(ingredient_query: IngredientQuery):
     """
     Get ingredients from the database.
     """
     # Convert all units to ounces
-    match ingredient_query.unit:
-        case Unit.OUNCES:
-            pass
-        case Unit.POUNDS:
-            ingredient_query.amount = ingredient_query.amount * 16
-        case Unit.GRAMS:
-            ingredient_query.amount = ingredient_query.amount / 28.3495
-        case Unit.KILOGRAMS:
-            ingredient_query.amount = ingredient_query.amount * 35.274
+    ingredient_query.amount = to_ounces(ingredient_query.amount, ingredient_query.unit.value)
     
     # Get the product from the database
-    products = supabaseWrapper.get_products(ingredient_query.ingredient, ingredient_query.amount)
+    products = await run_blocking("db", supabaseWrapper.get_products, ingredient_query.ingredient, ingredient_query.amount)
     if "error" in products:
         raise HTTPException(status_code=500, detail={"error": products["error"]})
     else:
         return products
 
+# Counters other modules already keep, read when /metrics is scraped
+metrics_registry.collector(
+    "llm_client_events_total", "Gemini calls, attempts, retries, throttling and failures", "counter", "event",
+    llm_metrics.snapshot,
+)
+metrics_registry.collector(
+    "llm_cache_lookups_total", "Shared LLM response cache lookups", "counter", "result",
+    lambda: {"hit": get_llm_cache().hits, "miss": get_llm_cache().misses},
+)
+metrics_registry.collector(
+    "recipe_cache_lookups_total", "Similar-query recipe cache lookups", "counter", "result",
+    lambda: {"hit": recipe_provider.recipe_cache.hits, "miss": recipe_provider.recipe_cache.misses},
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request and stage latency histograms, cache, retry and error counters."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+if CAPTURE_DEBUG_ENDPOINT:
+    # Captures hold other users' queries, so the route only exists when explicitly enabled
+    @app.get("/debug/llm-captures")
+    async def llm_captures(request_id: str):
+        """
+        Sampled Gemini prompts and responses for the request with the given X-Request-ID.
+        See LLM_CAPTURE_SAMPLE_RATE and LLM_CAPTURE_DEBUG_ENDPOINT in src/llm_capture.py.
+        """
+        return {"captures": get_llm_capture().for_request(request_id)}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
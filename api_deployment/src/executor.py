@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from src.metrics import pool_wait_seconds
+
+# The provider, database wrapper and scrapers are all synchronous. Each kind of
+# work gets its own bounded pool so that a burst of slow Gemini calls can never
+# starve quick database reads (or the event loop itself).
+POOL_SIZES = {
+    "llm": int(os.getenv("LLM_WORKERS", "16")),
+    "db": int(os.getenv("DB_WORKERS", "16")),
+    "scrape": int(os.getenv("SCRAPE_WORKERS", "8")),
+    # Recipe page downloads fanned out from a single /generate-recipe call
+    "fetch": int(os.getenv("FETCH_WORKERS", "16")),
+}
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind: str) -> ThreadPoolExecutor:
+    """Return the thread pool used for the given kind of blocking work."""
+    if kind not in POOL_SIZES:
+        raise ValueError(f"Unknown executor pool: {kind}")
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=POOL_SIZES[kind], thread_name_prefix=f"{kind}-worker")
+            _pools[kind] = pool
+        return pool
+
+
+async def run_blocking(kind: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking callable on the named pool and await its result.
+
+    The caller's context variables are copied into the worker thread so that
+    request-scoped state survives the hop off the event loop.
+
+    Args:
+        kind: Pool name ("llm", "db", "scrape" or "fetch")
+        func: The synchronous function to call
+        *args, **kwargs: Arguments passed through to func
+
+    Returns:
+        Whatever func returns
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def call():
+        pool_wait_seconds.observe(time.perf_counter() - submitted, kind)
+        return context.run(func, *args, **kwargs)
+
+    return await loop.run_in_executor(get_pool(kind), call)
+
+
+def shutdown(wait: bool = True, cancel_futures: bool = False) -> None:
+    """Shut down every pool that has been started."""
+    for pool in _pools.values():
+        pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+    _pools.clear()
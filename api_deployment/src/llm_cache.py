@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_CACHE_PATH = os.path.join(PACKAGE_ROOT, ".cache", "llm_cache.sqlite3")
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM responses stored in SQLite.
+
+    Entries are keyed by model and whitespace-normalized prompt. They expire after
+    ttl_seconds, and the least recently used entries are evicted once the cache holds
+    more than max_entries (checked every max_entries / 100 inserts, so the cache can
+    briefly run that far over). The database runs in WAL mode so several uvicorn
+    workers can share one file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 50000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Counting the entries scans the table, so it's done once per batch of inserts rather than per insert
+        self._evict_every = max(1, max_entries // 100)
+        self._inserts_since_evict = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Collapse whitespace so indentation changes don't defeat the cache."""
+        return re.sub(r"\s+", " ", prompt).strip()
+
+    @classmethod
+    def make_key(cls, model: str, prompt: str) -> str:
+        """Return the content address for a model/prompt combination."""
+        payload = json.dumps({"model": model, "prompt": cls.normalize_prompt(prompt)}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(
+        self,
+        model: str,
+        prompt: str,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> Optional[str]:
+        """
+        Return the cached response text, or None on a miss or expired entry.
+
+        An entry validate() rejects is deleted and reported as a miss, so a reply
+        cached before it was known to be unusable is regenerated instead of being
+        served until it expires.
+        """
+        key = self.make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            if validate is not None and not validate(row[0]):
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, model: str, prompt: str, response: str) -> None:
+        """Store a response, evicting the least recently used entries beyond max_entries every so often."""
+        key = self.make_key(model, prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            self._inserts_since_evict += 1
+            if self._inserts_since_evict >= self._evict_every:
+                self._inserts_since_evict = 0
+                count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self._conn.commit()
+
+    def delete(self, model: str, prompt: str) -> None:
+        key = self.make_key(model, prompt)
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+class _DisabledCache:
+    """Stand-in used when LLM_CACHE_ENABLED=0; never stores anything."""
+
+    hits = 0
+    misses = 0
+
+    def get(self, model, prompt, validate=None):
+        return None
+
+    def set(self, model, prompt, response):
+        pass
+
+    def delete(self, model, prompt):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide LLM cache shared by the scrapers and RecipeProvider."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if os.getenv("LLM_CACHE_ENABLED", "1") == "0":
+                _cache = _DisabledCache()
+            else:
+                _cache = LLMCache(
+                    path=os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000")),
+                )
+        return _cache
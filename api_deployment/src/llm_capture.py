@@ -0,0 +1,145 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fraction of requests whose LLM prompts and responses are captured (off by default; they hold user queries)
+CAPTURE_SAMPLE_RATE = float(os.getenv("LLM_CAPTURE_SAMPLE_RATE", "0"))
+# Serve a request's captures at GET /debug/llm-captures (only where the API isn't publicly reachable)
+CAPTURE_DEBUG_ENDPOINT = os.getenv("LLM_CAPTURE_DEBUG_ENDPOINT", "0") == "1"
+# Captures kept in memory for /debug/llm-captures
+CAPTURE_BUFFER_SIZE = int(os.getenv("LLM_CAPTURE_BUFFER_SIZE", "200"))
+# Prompts and responses are cut to this many characters
+CAPTURE_MAX_CHARS = int(os.getenv("LLM_CAPTURE_MAX_CHARS", "20000"))
+# Also append captures as JSON lines to this rotating log (empty keeps them in memory only)
+CAPTURE_LOG_PATH = os.getenv("LLM_CAPTURE_LOG", "")
+CAPTURE_LOG_MAX_BYTES = int(os.getenv("LLM_CAPTURE_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+CAPTURE_LOG_BACKUPS = int(os.getenv("LLM_CAPTURE_LOG_BACKUPS", "3"))
+
+# Set once per API request by the server middleware; run_blocking carries it into worker threads
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_sampled_var: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("llm_capture_sampled", default=None)
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """Tag the current context with a request id and decide whether its LLM calls are captured."""
+    request_id = request_id or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    _sampled_var.set(CAPTURE_SAMPLE_RATE > 0 and random.random() < CAPTURE_SAMPLE_RATE)
+    return request_id
+
+
+def _truncate(text: Optional[str]) -> Optional[str]:
+    if text is None or len(text) <= CAPTURE_MAX_CHARS:
+        return text
+    return text[:CAPTURE_MAX_CHARS] + f"... [{len(text) - CAPTURE_MAX_CHARS} more characters]"
+
+
+class LLMCapture:
+    """
+    Keeps sampled LLM prompts and responses for debugging.
+
+    Records go into a bounded in-memory ring buffer and, when log_path is set, a
+    rotating JSON-lines log. The calling thread only appends to the deque and puts
+    the record on a queue; a QueueListener thread does the file writes.
+    """
+
+    def __init__(self, buffer_size: int = CAPTURE_BUFFER_SIZE, log_path: str = CAPTURE_LOG_PATH):
+        self._records: deque = deque(maxlen=buffer_size)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._logger: Optional[logging.Logger] = None
+        if log_path:
+            log_path = os.path.join(PACKAGE_ROOT, log_path) if not os.path.isabs(log_path) else log_path
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=CAPTURE_LOG_MAX_BYTES, backupCount=CAPTURE_LOG_BACKUPS
+            )
+            file_handler.setFormatter(logging.Formatter("%(message)s"))
+            records: queue.Queue = queue.Queue(maxsize=10000)
+            self._listener = logging.handlers.QueueListener(records, file_handler)
+            self._listener.start()
+            self._logger = logging.getLogger("llm_capture")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(_DroppingQueueHandler(records))
+
+    def sampled(self) -> bool:
+        sampled = _sampled_var.get()
+        if sampled is None:
+            # Calls outside an API request (CLI scrapes, prewarm) are sampled one by one
+            return CAPTURE_SAMPLE_RATE > 0 and random.random() < CAPTURE_SAMPLE_RATE
+        return sampled
+
+    def record(
+        self,
+        kind: str,
+        model: str,
+        prompt: str,
+        response: Optional[str] = None,
+        error: Optional[BaseException] = None,
+        cached: bool = False,
+        duration_seconds: Optional[float] = None,
+    ) -> None:
+        """Capture one LLM call if the current request is sampled."""
+        if not self.sampled():
+            return
+        entry = {
+            "request_id": request_id_var.get(),
+            "time": time.time(),
+            "kind": kind,
+            "model": model,
+            "cached": cached,
+            "duration_seconds": round(duration_seconds, 3) if duration_seconds is not None else None,
+            "prompt": _truncate(prompt),
+            "response": _truncate(response),
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        }
+        self._records.append(entry)
+        if self._logger is not None:
+            self._logger.info(entry)
+
+    def for_request(self, request_id: str) -> List[Dict[str, Any]]:
+        return [entry for entry in list(self._records) if entry["request_id"] == request_id]
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that serializes records up front and drops them rather than block when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = json.dumps(record.msg, default=str)
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_capture: Optional[LLMCapture] = None
+_capture_lock = threading.Lock()
+
+
+def get_llm_capture() -> LLMCapture:
+    """Return the process-wide LLM capture buffer."""
+    global _capture
+    with _capture_lock:
+        if _capture is None:
+            _capture = LLMCapture()
+        return _capture
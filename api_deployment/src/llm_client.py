@@ -0,0 +1,183 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class LLMError(Exception):
+    """Base class for failures talking to the LLM provider."""
+
+    retryable = False
+
+
+class LLMRateLimitError(LLMError):
+    """The provider (or our own request budget) refused the call because of rate limits."""
+
+    retryable = True
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMUnavailableError(LLMError):
+    """Transient failure: connection problems, timeouts or 5xx responses."""
+
+    retryable = True
+
+
+class LLMResponseError(LLMError):
+    """The provider rejected the request or returned something unusable. Retrying won't help."""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """The call could not finish within its deadline."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that keeps outbound LLM calls within our quota.
+
+    Tokens refill continuously at rate_per_minute up to burst.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate_per_second
+
+    def refund(self) -> None:
+        """Give back a token that was reserved but not used."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class LLMMetrics:
+    """Counters describing how the shared LLM client is being throttled."""
+
+    FIELDS = ("calls", "attempts", "retries", "throttled", "rejected", "rate_limited", "failures", "throttle_wait_seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {field: 0 for field in self.FIELDS}
+
+    def incr(self, field: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[field] += amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            values = dict(self._values)
+        values["throttle_wait_seconds"] = round(values["throttle_wait_seconds"], 3)
+        return values
+
+
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+BURST = int(os.getenv("GEMINI_BURST", "10"))
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "45"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+rate_limiter = TokenBucket(REQUESTS_PER_MINUTE, BURST)
+metrics = LLMMetrics()
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than a provider-supplied Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def call_llm(
+    send: Callable[[float], Any],
+    deadline_seconds: Optional[float] = None,
+    max_attempts: Optional[int] = None,
+) -> Any:
+    """
+    Call the LLM provider through the shared rate limiter with bounded retries.
+
+    Args:
+        send: Performs one attempt. It receives the timeout (seconds) for that attempt and
+              must raise an LLMError subclass on failure.
+        deadline_seconds: Total time budget across all attempts and waits
+        max_attempts: Maximum number of attempts
+
+    Returns:
+        Whatever send returns
+
+    Raises:
+        LLMError: The last failure once attempts or the deadline run out. Non-retryable
+                  errors are raised immediately, and a call that cannot get a request
+                  budget before its deadline fails with LLMRateLimitError without waiting.
+    """
+    deadline = time.monotonic() + (deadline_seconds or CALL_DEADLINE_SECONDS)
+    max_attempts = max_attempts or MAX_ATTEMPTS
+    metrics.incr("calls")
+
+    last_error: Optional[LLMError] = None
+    for attempt in range(max_attempts):
+        wait = rate_limiter.reserve()
+        if wait > 0:
+            if time.monotonic() + wait >= deadline:
+                rate_limiter.refund()
+                metrics.incr("rejected")
+                metrics.incr("failures")
+                raise LLMRateLimitError(
+                    f"Gemini request budget of {REQUESTS_PER_MINUTE:g}/min exhausted", retry_after=wait
+                )
+            metrics.incr("throttled")
+            metrics.incr("throttle_wait_seconds", wait)
+            time.sleep(wait)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            metrics.incr("failures")
+            raise LLMDeadlineExceeded(f"LLM call ran out of time after {attempt} attempt(s): {last_error}")
+        metrics.incr("attempts")
+        try:
+            return send(min(REQUEST_TIMEOUT_SECONDS, remaining))
+        except LLMError as error:
+            last_error = error
+            if isinstance(error, LLMRateLimitError):
+                metrics.incr("rate_limited")
+            if not error.retryable or attempt == max_attempts - 1:
+                break
+            delay = backoff_delay(attempt, getattr(error, "retry_after", None))
+            if time.monotonic() + delay >= deadline:
+                break
+            print(f"LLM call failed ({error}), retrying in {delay:.2f}s")
+            metrics.incr("retries")
+            time.sleep(delay)
+
+    metrics.incr("failures")
+    raise last_error
+
+
+def error_from_status(status_code: int, message: str, retry_after: Optional[float] = None) -> LLMError:
+    """Map an HTTP status from the provider onto the LLMError hierarchy."""
+    if status_code == 429:
+        return LLMRateLimitError(message, retry_after=retry_after)
+    if status_code >= 500 or status_code in (408,):
+        return LLMUnavailableError(message)
+    return LLMResponseError(message)
@@ -0,0 +1,273 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Set METRICS_ENABLED=0 to turn every timer and counter into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Wrap each stage in an OpenTelemetry span too (needs opentelemetry-api and an SDK configured by the deployment)
+OTEL_TRACING = os.getenv("OTEL_TRACING", "0") == "1"
+
+# Seconds; spans quick DB reads up to slow Gemini generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+try:
+    if OTEL_TRACING:
+        from opentelemetry import trace as otel_trace
+        _tracer = otel_trace.get_tracer("kitchen_sink")
+    else:
+        _tracer = None
+except ImportError:
+    print("OTEL_TRACING is set but opentelemetry is not installed; spans are disabled")
+    _tracer = None
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value at full precision ("{:g}" keeps six digits, which freezes busy counters)."""
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in sorted(values.items())]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set, Prometheus style."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total[0]) for labels, (counts, total) in self._series.items()}
+        lines = []
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text format.
+
+    Besides Counter and Histogram instances, collectors can be registered: callables
+    returning {label value: number} read at scrape time, which is how counters that
+    other modules already keep (LLM cache hits, Gemini retries) are exported without
+    touching their hot paths.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Tuple[str, str, str, str, Callable[[], Dict[str, float]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def collector(self, name: str, help: str, kind: str, label: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """Export collect()'s {label value: number} as metric name (kind is "counter" or "gauge")."""
+        with self._lock:
+            self._collectors = [entry for entry in self._collectors if entry[0] != name]
+            self._collectors.append((name, help, kind, label, collect))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        for name, help, kind, label, collect in collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Metrics collector {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels((label,), (key,))} {_format_value(value)}" for key, value in sorted(values.items()))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "API request latency by route, method and status",
+    ("method", "route", "status"),
+)
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Time spent in each stage of handling a request", ("stage",),
+)
+stage_errors = registry.counter(
+    "stage_errors_total", "Stages that ended with an exception, by exception type", ("stage", "error"),
+)
+cache_events = registry.counter(
+    "cache_events_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result"),
+)
+http_client_seconds = registry.histogram(
+    "http_client_request_duration_seconds", "Outbound HTTP requests by upstream (time to response headers)",
+    ("upstream", "status"),
+)
+pool_wait_seconds = registry.histogram(
+    "executor_queue_wait_seconds", "Time blocking work waited for a free worker thread", ("pool",),
+)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block as stage_duration_seconds{stage=name}, count its exceptions, and
+    open an OpenTelemetry span for it when OTEL_TRACING is on.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    span = _tracer.start_as_current_span(name) if _tracer is not None else contextlib.nullcontext()
+    start = time.perf_counter()
+    with span:
+        try:
+            yield
+        except BaseException as e:
+            stage_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator form of stage()."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Hosts reported under their own upstream label; anything else (recipe sites) is "other"
+UPSTREAMS = {
+    "generativelanguage.googleapis.com": "gemini",
+    "api.kroger.com": "kroger",
+    "redsky.target.com": "target",
+    "www.google.com": "google",
+}
+
+
+def upstream_of(host: str) -> str:
+    return UPSTREAMS.get(host.split(":")[0].lower(), "other")
+
+
+if __name__ == "__main__":
+    # Instrumentation overhead: python -m src.metrics
+    runs = 200000
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        with stage("benchmark"):
+            pass
+    staged = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        cache_events.inc("benchmark", "hit")
+    counted = time.perf_counter() - start
+
+    for i in range(50):
+        http_request_seconds.observe(0.01 * i, "GET", f"/route/{i % 10}", "200")
+    start = time.perf_counter()
+    for _ in range(100):
+        text = registry.render()
+    rendered = (time.perf_counter() - start) / 100
+
+    print(f"stage() timer: {(staged - baseline) / runs * 1e6:.2f} us per block")
+    print(f"Counter.inc:   {(counted - baseline) / runs * 1e6:.2f} us per call")
+    print(f"/metrics render: {rendered * 1000:.2f} ms for {len(text.splitlines())} lines")
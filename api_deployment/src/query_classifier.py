@@ -0,0 +1,83 @@
+import re
+from typing import Callable, FrozenSet, Iterable, Optional, Tuple
+
+from src.recipe_cache import normalize_query
+
+# Words that make a query a request for ideas rather than for a particular dish
+VAGUE_WORDS = {
+    "something", "anything", "ideas", "idea", "what", "dinner", "lunch", "breakfast", "brunch", "meal", "meals",
+    "dessert", "desserts", "snack", "snacks", "side", "sides", "leftover", "leftovers", "using", "healthy",
+    "quick", "cheap", "budget", "party", "weeknight", "kids", "some", "random", "surprise", "me",
+}
+
+# Ingredients and broad categories; a query made only of these needs a concrete dish picked for it
+GENERIC_TERMS = {
+    "chicken", "beef", "pork", "lamb", "turkey", "fish", "salmon", "shrimp", "tofu", "eggs", "egg", "vegetable",
+    "vegetables", "veggie", "veggies", "pasta", "noodles", "rice", "soup", "salad", "sandwich", "bread", "cake",
+    "cookies", "pie", "potatoes", "potato", "beans", "cheese", "vegan", "vegetarian", "keto", "spicy", "sweet",
+    "italian", "mexican", "indian", "chinese", "thai", "japanese", "french", "food", "dish", "stuff",
+}
+
+# Dishes that are specific on their own, on top of the titles of our saved recipes
+COMMON_DISHES = {
+    "lasagna", "risotto", "paella", "ratatouille", "shakshuka", "carbonara", "bolognese", "tiramisu", "gumbo",
+    "jambalaya", "biryani", "pho", "ramen", "pad thai", "falafel", "hummus", "guacamole", "moussaka", "goulash",
+    "enchiladas", "quesadilla", "burrito", "chili", "meatloaf", "pancakes", "waffles", "brownies", "cheesecake",
+    "granola", "frittata", "quiche", "gazpacho", "minestrone", "bruschetta", "pesto", "tabbouleh", "dal",
+    "korma", "vindaloo", "tikka masala", "stroganoff", "schnitzel", "kimchi", "bibimbap", "bulgogi", "dumplings",
+    "gyoza", "sushi", "poke", "ceviche", "empanadas", "pierogi", "churros", "baklava", "polenta", "gnocchi",
+    "focaccia", "scones", "banana bread", "mac and cheese", "french toast", "fried rice", "caesar salad",
+    "chicken parmesan", "butter chicken", "beef stew", "pot roast", "clam chowder", "french onion soup",
+}
+
+
+class QueryClassifier:
+    """
+    Decides whether a recipe query is specific enough to search for as typed.
+
+    Queries that name a known dish (COMMON_DISHES or a saved recipe title), or that
+    have at least two words including something beyond generic ingredients and
+    categories, are searched directly. Vague queries ("quick dinner ideas") and bare
+    categories ("chicken pasta") still go through the LLM rewrite.
+    """
+
+    def __init__(self, known_dishes: Optional[Callable[[], Iterable[str]]] = None):
+        """
+        Args:
+            known_dishes: Returns normalized dish names to treat as specific, e.g. the
+                          saved titles held by src.recipe_cache.RecipeCache. The dish set is
+                          only rebuilt when it returns a different object.
+        """
+        self.known_dishes = known_dishes
+        # (object returned by known_dishes, COMMON_DISHES plus those names), swapped as one tuple
+        self._dish_cache: Tuple[object, FrozenSet[str]] = (None, frozenset(COMMON_DISHES))
+
+    def _dishes(self) -> FrozenSet[str]:
+        if self.known_dishes is None:
+            return self._dish_cache[1]
+        known = self.known_dishes()
+        source, dishes = self._dish_cache
+        if known is not source:
+            dishes = frozenset(COMMON_DISHES).union(known)
+            self._dish_cache = (known, dishes)
+        return dishes
+
+    def classify(self, query: str) -> Tuple[bool, str]:
+        """Return (is_specific, reason)."""
+        normalized = normalize_query(query)
+        words = normalized.split()
+        if not words:
+            return False, "empty"
+        if VAGUE_WORDS.intersection(words):
+            return False, "vague"
+        dishes = self._dishes()
+        if normalized in dishes or any(re.search(rf"\b{re.escape(dish)}\b", normalized) for dish in COMMON_DISHES):
+            return True, "known dish"
+        if len(words) == 1:
+            return False, "single word"
+        if all(word in GENERIC_TERMS for word in words):
+            return False, "generic"
+        return True, "specific"
+
+    def needs_rewrite(self, query: str) -> bool:
+        return not self.classify(query)[0]
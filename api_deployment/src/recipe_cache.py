@@ -0,0 +1,307 @@
+import copy
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Minimum cosine similarity between normalized queries for a cached recipe to be served
+SIMILARITY_THRESHOLD = float(os.getenv("RECIPE_CACHE_THRESHOLD", "0.85"))
+# Generated recipes are served for this long; recipes saved in the table don't expire
+MAX_AGE_SECONDS = float(os.getenv("RECIPE_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+# How often the saved recipes are reloaded from the recipes table
+RELOAD_SECONDS = float(os.getenv("RECIPE_CACHE_RELOAD_SECONDS", "600"))
+MAX_ENTRIES = int(os.getenv("RECIPE_CACHE_MAX_ENTRIES", "20000"))
+
+# Words that don't change which dish a query asks for
+FILLER_WORDS = {
+    "a", "an", "the", "my", "for", "of", "to", "how", "make", "making", "recipe", "recipes",
+    "easy", "best", "simple", "homemade", "good", "great", "delicious", "tasty", "classic", "perfect", "please",
+}
+
+
+# Words that change which dish is asked for while barely moving the trigram similarity
+# ("vegan banana bread" is 0.86 from "banana bread"); a match must carry the same ones
+DIETARY_TERMS = {
+    "vegan", "vegetarian", "keto", "paleo", "whole30", "pescatarian", "halal", "kosher", "eggless", "meatless",
+    "sugarless", "gluten free", "dairy free", "lactose free", "egg free", "nut free", "sugar free", "grain free",
+    "low carb", "low fat", "low sodium", "low calorie", "high protein", "plant based",
+}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and filler words, so "Easy Chicken Curry!" becomes "chicken curry"."""
+    words = re.findall(r"[a-z0-9]+", query.lower())
+    kept = [word for word in words if word not in FILLER_WORDS]
+    return " ".join(kept or words)
+
+
+def dietary_terms(words: List[str]) -> Set[str]:
+    """The DIETARY_TERMS in a normalized query's words, including two-word ones like "gluten free"."""
+    found = {word for word in words if word in DIETARY_TERMS}
+    found.update(f"{first} {second}" for first, second in zip(words, words[1:]) if f"{first} {second}" in DIETARY_TERMS)
+    return found
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def _same_word(a: str, b: str) -> bool:
+    """Equal up to a plural "s" or, for words of five letters or more, a single-letter typo."""
+    a, b = _stem(a), _stem(b)
+    if a == b:
+        return True
+    if min(len(a), len(b)) < 5 or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    # One substitution (equal lengths) or one insertion into a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i + 1:] == b[i + 1:] if len(a) == len(b) else a[i:] == b[i + 1:]
+
+
+def covers(query_words: List[str], entry_words: List[str]) -> bool:
+    """
+    True when a stored query can answer this one: every query word appears in it
+    (see _same_word), and both ask for the same dietary variant. Extra words in the
+    stored query ("creamy chicken curry" for "chicken curry") are allowed.
+    """
+    if dietary_terms(query_words) != dietary_terms(entry_words):
+        return False
+    return all(any(_same_word(word, entry_word) for entry_word in entry_words) for word in query_words)
+
+
+def trigram_vector(text: str) -> Dict[str, float]:
+    """L2-normalized character trigram counts, padded so word starts and ends count."""
+    counts: Dict[str, float] = {}
+    for word in text.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            counts[gram] = counts.get(gram, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in counts.values()))
+    return {gram: value / norm for gram, value in counts.items()} if norm else {}
+
+
+class RecipeCache:
+    """
+    Serves recipes for queries that are near-duplicates of ones already answered.
+
+    Queries are normalized and embedded as trigram vectors in an in-process inverted
+    index, so a lookup is a sparse dot product over the postings of the query's
+    trigrams. Similarity alone can't tell "cupcake" from "cake" or notice a "vegan",
+    so a match must also cover every word of the query (see covers). Entries come
+    from two places: recipes generated by this process (expiring after
+    max_age_seconds) and recipes saved in the recipes table (loaded through
+    load_recipes by load() at startup, then reloaded in the background every
+    RELOAD_SECONDS).
+    """
+
+    def __init__(
+        self,
+        load_recipes: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+        enabled: bool = os.getenv("RECIPE_CACHE_ENABLED", "1") != "0",
+    ):
+        self.load_recipes = load_recipes
+        self.threshold = threshold
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._vectors: Dict[int, Dict[str, float]] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._by_query: Dict[str, int] = {}
+        self._saved_titles: FrozenSet[str] = frozenset()
+        self._next_id = 0
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    def _insert(self, normalized: str, response: Dict[str, Any], source: str) -> None:
+        previous = self._by_query.get(normalized)
+        if previous is not None:
+            self._remove(previous)
+        if len(self._entries) >= MAX_ENTRIES:
+            self._remove(next(iter(self._entries)))
+        entry_id = self._next_id
+        self._next_id += 1
+        vector = trigram_vector(normalized)
+        self._entries[entry_id] = {"query": normalized, "response": response, "source": source, "created_at": time.time()}
+        self._vectors[entry_id] = vector
+        self._by_query[normalized] = entry_id
+        for gram, weight in vector.items():
+            self._postings.setdefault(gram, {})[entry_id] = weight
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._by_query.pop(entry["query"], None)
+        for gram in self._vectors.pop(entry_id):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.pop(entry_id, None)
+                if not postings:
+                    del self._postings[gram]
+
+    def _reload(self) -> None:
+        try:
+            rows = self.load_recipes()
+        except Exception as e:
+            print(f"Could not load saved recipes into the recipe cache: {e}")
+            rows = None
+        with self._lock:
+            if rows is not None:
+                for entry_id in [key for key, entry in self._entries.items() if entry["source"] == "table"]:
+                    self._remove(entry_id)
+                for row in rows:
+                    if row.get("title"):
+                        self._insert(normalize_query(row["title"]), recipe_response_from_row(row), "table")
+                self._saved_titles = frozenset(
+                    entry["query"] for entry in self._entries.values() if entry["source"] == "table"
+                )
+                print(f"Recipe cache loaded {len(rows)} saved recipes")
+            # A failed load is retried after the reload interval rather than on every request
+            self._loaded_at = time.monotonic()
+
+    def load(self) -> None:
+        """Load the saved recipes now, e.g. at startup, unless another thread is already loading them."""
+        if self.load_recipes is None:
+            return
+        with self._load_lock:
+            self._reload()
+
+    def _maybe_reload(self) -> None:
+        # Never on the request thread: until the first load finishes, saved recipes simply miss
+        if self.load_recipes is None or time.monotonic() - self._loaded_at < RELOAD_SECONDS:
+            return
+        if self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload_and_release, name="recipe-cache-reload", daemon=True).start()
+
+    def _reload_and_release(self) -> None:
+        try:
+            self._reload()
+        finally:
+            self._load_lock.release()
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return entry["source"] == "table" or time.time() - entry["created_at"] < self.max_age_seconds
+
+    def search(self, query: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return (similarity, entry) for the closest fresh entry that covers the query, whatever its similarity."""
+        normalized = normalize_query(query)
+        words = normalized.split()
+        vector = trigram_vector(normalized)
+        with self._lock:
+            exact = self._by_query.get(normalized)
+            if exact is not None and self._is_fresh(self._entries[exact]):
+                return 1.0, self._entries[exact]
+            scores: Dict[int, float] = {}
+            for gram, weight in vector.items():
+                for entry_id, entry_weight in self._postings.get(gram, {}).items():
+                    scores[entry_id] = scores.get(entry_id, 0.0) + weight * entry_weight
+            while scores:
+                entry_id = max(scores, key=scores.get)
+                entry = self._entries[entry_id]
+                if not self._is_fresh(entry):
+                    self._remove(entry_id)
+                elif covers(words, entry["query"].split()):
+                    return scores[entry_id], entry
+                elif scores[entry_id] < self.threshold:
+                    # Nothing further down the ranking can be served either
+                    return None
+                del scores[entry_id]
+        return None
+
+    def get(self, query: str) -> Optional[Dict[str, Any]]:
+        """Return a stored recipe for a near-duplicate query, or None."""
+        if not self.enabled:
+            return None
+        self._maybe_reload()
+        match = self.search(query)
+        if match is None or match[0] < self.threshold:
+            self.misses += 1
+            return None
+        similarity, entry = match
+        self.hits += 1
+        print(f"Recipe cache hit for {query!r}: {entry['query']!r} ({entry['source']}, similarity {similarity:.2f})")
+        # Callers may reshape the response, so never hand out the stored object
+        return copy.deepcopy(entry["response"])
+
+    def add(self, query: str, response: Dict[str, Any]) -> None:
+        """Remember a freshly generated recipe for its query."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._insert(normalize_query(query), copy.deepcopy(response), "generated")
+
+    def saved_titles(self) -> FrozenSet[str]:
+        """Normalized titles of the recipes loaded from the recipes table (the same object until the next reload)."""
+        self._maybe_reload()
+        return self._saved_titles
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+        }
+
+
+def recipe_response_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a saved recipes row like a generated recipe (see recipe_template.json)."""
+    recipe = {
+        key: row.get(key)
+        for key in (
+            "title", "cuisine", "tags", "ingredients", "steps", "prep_time_minutes",
+            "cook_time_minutes", "servings", "difficulty", "notes",
+        )
+        if row.get(key) is not None
+    }
+    return {"title": row["title"], "content": {"recipe": recipe}}
+
+
+if __name__ == "__main__":
+    # Lookup benchmark and examples: python -m src.recipe_cache
+    cache = RecipeCache()
+    dishes = ["chicken curry", "spaghetti carbonara", "beef stew", "banana bread", "pad thai", "chicken tikka masala",
+              "vegetable lasagna", "french onion soup", "fish tacos", "chocolate chip cookies"]
+    for index in range(5000):
+        cache.add(f"{dishes[index % len(dishes)]} variation {index}", {"title": str(index)})
+    for dish in dishes:
+        cache.add(dish, {"title": dish})
+
+    cache.add("chocolate cake", {"title": "chocolate cake"})
+    for query in ["Chicken Curry!", "easy chicken curry", "chicken curry recipe", "best banana bread",
+                  "chiken curry", "thai green curry", "beef stroganoff"]:
+        match = cache.search(query)
+        if match is None:
+            print(f"miss {query!r:28}")
+            continue
+        similarity, entry = match
+        served = "hit " if similarity >= cache.threshold else "miss"
+        print(f"{served} {query!r:28} -> {entry['query']!r} ({similarity:.2f})")
+
+    # Near-identical strings that ask for a different dish must never be served
+    for query in ["vegan banana bread", "keto banana bread", "vegan chicken curry", "chocolate cupcake",
+                  "gluten-free banana bread", "low carb chicken curry"]:
+        assert cache.get(query) is None, query
+    cache.add("vegan banana bread", {"title": "vegan banana bread"})
+    assert cache.get("banana bread")["title"] == "banana bread"
+    assert cache.get("easy vegan banana bread")["title"] == "vegan banana bread"
+    assert cache.get("chocolate chip cookie")["title"] == "chocolate chip cookies"
+
+    for query in ["easy chicken curry", "chiken curry"]:
+        start = time.perf_counter()
+        for _ in range(1000):
+            cache.search(query)
+        print(f"Lookup of {query!r} over {len(cache._entries)} entries: {time.perf_counter() - start:.3f} ms")
@@ -0,0 +1,237 @@
+import codecs
+import json
+import re
+from html import unescape
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterable, List, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+    FALLBACK_PARSER = "lxml"
+except ImportError:
+    FALLBACK_PARSER = "html.parser"
+
+# Elements that never have a closing tag, so they're never pushed on the microdata stack
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+}
+INGREDIENT_PROPS = {"recipeingredient", "ingredients"}
+INSTRUCTION_PROPS = {"recipeinstructions"}
+
+
+def _clean(text: Any) -> str:
+    text = unescape(re.sub(r"<[^>]+>", " ", str(text or "")))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _types(node: Dict[str, Any]) -> List[str]:
+    node_type = node.get("@type", [])
+    return [str(value).lower() for value in (node_type if isinstance(node_type, list) else [node_type])]
+
+
+def _find_recipe_nodes(data: Any) -> Iterable[Dict[str, Any]]:
+    """Yield every schema.org Recipe object in a JSON-LD document (including @graph and nested lists)."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _find_recipe_nodes(item)
+    elif isinstance(data, dict):
+        if "recipe" in _types(data):
+            yield data
+        for key in ("@graph", "mainEntity", "mainEntityOfPage"):
+            if isinstance(data.get(key), (list, dict)):
+                yield from _find_recipe_nodes(data[key])
+
+
+def _instruction_steps(instructions: Any) -> List[str]:
+    """Flatten recipeInstructions (text, HowToStep, HowToSection or lists of them) into step strings."""
+    if isinstance(instructions, str):
+        steps = [_clean(line) for line in re.split(r"\n+|<br\s*/?>|</p>|</li>", instructions)]
+        return [step for step in steps if step]
+    if isinstance(instructions, list):
+        return [step for item in instructions for step in _instruction_steps(item)]
+    if isinstance(instructions, dict):
+        if "itemListElement" in instructions:
+            return _instruction_steps(instructions["itemListElement"])
+        text = instructions.get("text") or instructions.get("name")
+        return [_clean(text)] if text else []
+    return []
+
+
+def recipe_from_json_ld(node: Dict[str, Any]) -> Dict[str, Any]:
+    ingredients = node.get("recipeIngredient") or node.get("ingredients") or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    return {
+        "title": _clean(node.get("name")),
+        "ingredients": [_clean(ingredient) for ingredient in ingredients if _clean(ingredient)],
+        "steps": _instruction_steps(node.get("recipeInstructions")),
+    }
+
+
+class StructuredDataParser(HTMLParser):
+    """
+    Incremental HTML parser that only looks for structured recipe data.
+
+    It collects application/ld+json scripts and schema.org microdata (itemprop
+    recipeIngredient / recipeInstructions) without building a document tree, so it
+    can be fed the page chunk by chunk while it downloads.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld_recipe: Optional[Dict[str, Any]] = None
+        self.micro_ingredients: List[str] = []
+        self.micro_steps: List[str] = []
+        self._script: Optional[List[str]] = None
+        # Open elements carrying an itemprop we care about: [tag, prop, text parts, nested steps]
+        self._stack: List[list] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script" and (attrs.get("type") or "").lower().strip() == "application/ld+json":
+            self._script = []
+            return
+        prop = (attrs.get("itemprop") or "").lower()
+        in_instructions = any(entry[1] in INSTRUCTION_PROPS for entry in self._stack)
+        if prop in INGREDIENT_PROPS or prop in INSTRUCTION_PROPS or (prop == "text" and in_instructions):
+            if "content" in attrs or tag in VOID_ELEMENTS:
+                self._store(prop, _clean(attrs.get("content")), [])
+            else:
+                self._stack.append([tag, prop, [], []])
+        elif self._stack and tag not in VOID_ELEMENTS:
+            self._stack.append([tag, None, None, None])
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags never get an end tag, so they must not stay on the stack
+        self.handle_starttag(tag, attrs)
+        if tag == "script":
+            self._script = None
+        elif self._stack and self._stack[-1][0] == tag and tag not in VOID_ELEMENTS:
+            self._close(self._stack.pop())
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._script is not None:
+            self._read_json_ld("".join(self._script))
+            self._script = None
+            return
+        # Tolerate unclosed children (e.g. <li> without </li>) by closing up to the matching tag
+        if any(entry[0] == tag for entry in self._stack):
+            while self._stack:
+                entry = self._stack.pop()
+                self._close(entry)
+                if entry[0] == tag:
+                    break
+
+    def handle_data(self, data):
+        if self._script is not None:
+            self._script.append(data)
+            return
+        for entry in self._stack:
+            if entry[2] is not None:
+                entry[2].append(data)
+
+    def _close(self, entry):
+        tag, prop, parts, nested_steps = entry
+        if prop is None:
+            return
+        if prop == "text":
+            # A HowToStep inside recipeInstructions; hand it to the enclosing instructions element
+            for parent in reversed(self._stack):
+                if parent[1] in INSTRUCTION_PROPS:
+                    parent[3].append(_clean("".join(parts)))
+                    return
+        elif prop in INSTRUCTION_PROPS and nested_steps:
+            self.micro_steps.extend(step for step in nested_steps if step)
+        else:
+            self._store(prop, _clean("".join(parts)), parts)
+
+    def _store(self, prop, text, parts):
+        if not text:
+            return
+        if prop in INGREDIENT_PROPS:
+            self.micro_ingredients.append(text)
+        elif prop in INSTRUCTION_PROPS:
+            lines = [_clean(line) for line in "".join(parts).splitlines()] if parts else [text]
+            self.micro_steps.extend(line for line in lines if line)
+
+    def _read_json_ld(self, text):
+        if self.json_ld_recipe is not None:
+            return
+        try:
+            data = json.loads(text.strip())
+        except ValueError:
+            return
+        for node in _find_recipe_nodes(data):
+            recipe = recipe_from_json_ld(node)
+            if recipe["ingredients"] or recipe["steps"]:
+                self.json_ld_recipe = recipe
+                return
+
+
+def extract_with_heuristics(html: str) -> Dict[str, Any]:
+    """The class-name heuristics for pages without structured data (lxml when installed)."""
+    soup = BeautifulSoup(html, FALLBACK_PARSER)
+
+    # Try finding ingredients
+    ingredients = []
+    for ul in soup.find_all(['ul', 'div'], class_=re.compile("ingredient", re.I)):
+        for li in ul.find_all(['li', 'span']):
+            text = li.get_text(strip=True)
+            if text and len(text) > 3:
+                ingredients.append(text)
+        if ingredients:
+            break  # Stop if found
+
+    # Try finding instructions
+    steps = []
+    for ol in soup.find_all(['ol', 'div'], class_=re.compile("instruction|step|direction", re.I)):
+        for li in ol.find_all(['li', 'p']):
+            text = li.get_text(strip=True)
+            if text and len(text) > 5:
+                steps.append(text)
+        if steps:
+            break  # Stop if found
+
+    return {"ingredients": ingredients, "steps": steps}
+
+
+def extract_recipe(chunks: Iterable[bytes], encoding: str = "utf-8") -> Dict[str, Any]:
+    """
+    Extract ingredients and steps from a recipe page as it streams in.
+
+    JSON-LD is tried first and stops the download as soon as a complete Recipe object
+    has been read (it usually sits in <head>). Microdata is used next, and the
+    class-name heuristics only when the page has no structured data at all.
+
+    Args:
+        chunks: The page body, e.g. response.iter_content(...)
+        encoding: Character encoding of the page
+
+    Returns:
+        dict: ingredients, steps, and method ("json-ld", "microdata" or "heuristic")
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    parser = StructuredDataParser()
+    html_parts = []
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        html_parts.append(text)
+        parser.feed(text)
+        if parser.json_ld_recipe is not None:
+            break
+    else:
+        tail = decoder.decode(b"", final=True)
+        html_parts.append(tail)
+        parser.feed(tail)
+        parser.close()
+
+    if parser.json_ld_recipe is not None:
+        recipe = parser.json_ld_recipe
+        return {"ingredients": recipe["ingredients"], "steps": recipe["steps"], "method": "json-ld"}
+    if parser.micro_ingredients or parser.micro_steps:
+        return {"ingredients": parser.micro_ingredients, "steps": parser.micro_steps, "method": "microdata"}
+    recipe = extract_with_heuristics("".join(html_parts))
+    recipe["method"] = "heuristic"
+    return recipe
@@ -2,16 +2,85 @@ import requests
 from bs4 import BeautifulSoup
 import os
 from google import genai
+from google.genai import errors as genai_errors, types
+import httpx
 from dotenv import load_dotenv
-from typing import Dict, Any, List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+import contextvars
 import json
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from src.executor import get_pool
+from src.query_classifier import QueryClassifier
+from src.recipe_cache import RecipeCache, normalize_query
 from src.recipe_scraper import RecipeScraper
+from src.shopping_list import ShoppingListEngine
+from src.templates import get_templates
+from src.llm_cache import get_llm_cache
+from src.llm_capture import get_llm_capture
+from src.metrics import stage
+from src.llm_client import call_llm, error_from_status, LLMError, LLMResponseError, LLMUnavailableError
+
+# Longest we wait for the LLM query rewrite before searching with the raw query instead
+REWRITE_BUDGET_SECONDS = float(os.getenv("QUERY_REWRITE_BUDGET_SECONDS", "1.5"))
+# "local" aggregates shopping lists with src.shopping_list; "llm" sends the whole list to Gemini as before
+SHOPPING_LIST_ENGINE = os.getenv("SHOPPING_LIST_ENGINE", "local")
+
+# Prompt instructions; {fields} are filled per request and the named template file is appended
+RECIPE_PROMPT = """
+        I've found several recipes for "{query}". Here's the scraped information:
+
+        {scraped_recipes_text}
+
+        Based on these recipes, create a new unique recipe for "{query}" that:
+        1. Combines the best elements from these recipes
+        2. Has an accurate yet descriptive title
+        3. Includes a complete ingredient list with measurements
+        4. Provides clear step-by-step instructions
+        5. Suggests a serving size
+        6. Includes prep time and cooking time
+        7. Uses a tone that is easy to understand and descriptive
+        8. Includes appropriate tags (like 'vegetarian', 'quick', etc.)
+        9. Suggests a cuisine type if applicable
+
+        Format the response as a valid JSON object with the following fields:
+        """
+
+SHOPPING_LIST_PROMPT = """
+        I need to create a shopping list based on these ingredients from a recipe:
+        
+        {ingredients_text}
+        
+        Please organize these ingredients into a shopping list that:
+        1. Combines similar ingredients (e.g., if multiple items need milk, show the total amount)
+        2. Groups ingredients by category (produce, dairy, grains, etc.)
+        3. Do not include any extra text or explanations or superlatives - (Eg. Boneless chicken breast should just be Chicken breast)
+        4. Ensures quantities are clear and consistent
+        5. Includes both the ingredient name and total amount needed
+        6. Ingredient quantities must be given in ounces
+        7. You must convert to ounces if needed
+        
+        Format the response as a valid JSON object matching this structure:
+        """
 
 class RecipeProvider:
-    def __init__(self):
+    def __init__(self, recipe_cache: Optional[RecipeCache] = None):
         self.api_key = self._load_api_key()
         self.client = self._initialize_client()
         self.scraper = RecipeScraper(num_results=5)  # Get 3 recipes for better context
+        self.cache = get_llm_cache()
+        # Samples raw prompts and responses for debugging, off the request thread
+        self.capture = get_llm_capture()
+        # Answers near-duplicate queries without scraping or calling Gemini
+        self.recipe_cache = recipe_cache or RecipeCache()
+        # Saved recipe titles double as the dictionary of dishes that need no rewrite
+        self.query_classifier = QueryClassifier(known_dishes=self.recipe_cache.saved_titles)
+        # Template files are read once; the static parts of each prompt are joined ahead of time
+        self.templates = get_templates()
+        self.recipe_prompt = self.templates.prompt(RECIPE_PROMPT, "recipe")
+        self.shopping_list_prompt = self.templates.prompt(SHOPPING_LIST_PROMPT, "shopping_list")
+        # Gemini is only asked about ingredient names the local tables don't know
+        self.shopping_list_engine = ShoppingListEngine(resolve_names=self._resolve_ingredient_names)
 
     def _load_api_key(self) -> str:
         """Load and return the API key from environment variables."""
@@ -25,6 +94,126 @@ class RecipeProvider:
         """Initialize and return a genai client."""
         return genai.Client(api_key=self.api_key)
 
+    def _send_generate_content(self, model: str, prompt: str, timeout: float) -> str:
+        """Make one generate_content attempt, translating SDK errors into LLMError types."""
+        try:
+            response = self.client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    http_options=types.HttpOptions(timeout=int(timeout * 1000))
+                ),
+            )
+        except genai_errors.APIError as e:
+            raise error_from_status(e.code or 500, f"Gemini error {e.code}: {e.message}")
+        except httpx.TimeoutException as e:
+            raise LLMUnavailableError(f"Gemini request timed out: {e}")
+        except httpx.HTTPError as e:
+            raise LLMUnavailableError(f"Gemini request failed: {e}")
+        if not response.text:
+            raise LLMResponseError(f"Empty response from {model}")
+        return response.text
+
+    @staticmethod
+    def _parses(parse: Optional[Callable[[str], Any]]) -> Optional[Callable[[str], bool]]:
+        """Turn a parser into a cache validator that accepts the texts it parses."""
+        if parse is None:
+            return None
+
+        def validate(text: str) -> bool:
+            try:
+                parse(text)
+            except Exception:
+                return False
+            return True
+        return validate
+
+    def _generate_content(self, model: str, prompt: str, parse: Optional[Callable[[str], Any]] = None) -> Any:
+        """
+        Generate text with Gemini, answering repeated prompts from the shared LLM cache.
+
+        Calls go through the shared rate limiter with bounded, jittered retries. With
+        parse, the parsed text is returned and a reply is only cached once it parses,
+        so one malformed reply isn't served for the cache's whole TTL.
+
+        Raises:
+            LLMError: If Gemini can't answer within the retry budget and deadline
+            Exception: Whatever parse raises for an unusable reply
+        """
+        cached = self.cache.get(model, prompt, validate=self._parses(parse))
+        if cached is not None:
+            self.capture.record("generate", model, prompt, cached, cached=True)
+            return parse(cached) if parse else cached
+        start = time.perf_counter()
+        try:
+            with stage("llm.generate"):
+                text = call_llm(lambda timeout: self._send_generate_content(model, prompt, timeout))
+        except LLMError as e:
+            self.capture.record("generate", model, prompt, error=e, duration_seconds=time.perf_counter() - start)
+            raise
+        self.capture.record("generate", model, prompt, text, duration_seconds=time.perf_counter() - start)
+        result = parse(text) if parse else text
+        self.cache.set(model, prompt, text)
+        return result
+
+    def _open_stream(self, model: str, prompt: str, timeout: float):
+        """Start a streaming generation and read its first chunk, so connection errors surface here."""
+        try:
+            stream = iter(self.client.models.generate_content_stream(
+                model=model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    http_options=types.HttpOptions(timeout=int(timeout * 1000))
+                ),
+            ))
+            first = next(stream, None)
+        except genai_errors.APIError as e:
+            raise error_from_status(e.code or 500, f"Gemini error {e.code}: {e.message}")
+        except httpx.TimeoutException as e:
+            raise LLMUnavailableError(f"Gemini request timed out: {e}")
+        except httpx.HTTPError as e:
+            raise LLMUnavailableError(f"Gemini request failed: {e}")
+        return first, stream
+
+    def _stream_content(self, model: str, prompt: str, parse: Optional[Callable[[str], Any]] = None) -> Iterator[str]:
+        """
+        Like _generate_content, but yield the text as Gemini produces it.
+
+        Starting the stream is rate limited and retried like any other call; a failure
+        after text has been yielded is raised as LLMUnavailableError. The complete text
+        is cached if parse accepts it, and a cached response is yielded as a single chunk.
+        """
+        validate = self._parses(parse)
+        cached = self.cache.get(model, prompt, validate=validate)
+        if cached is not None:
+            self.capture.record("stream", model, prompt, cached, cached=True)
+            yield cached
+            return
+        start = time.perf_counter()
+        parts = []
+        try:
+            with stage("llm.stream_open"):
+                first, stream = call_llm(lambda timeout: self._open_stream(model, prompt, timeout))
+            try:
+                chunk = first
+                while chunk is not None:
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+                    chunk = next(stream, None)
+            except (genai_errors.APIError, httpx.HTTPError) as e:
+                raise LLMUnavailableError(f"Gemini stream interrupted: {e}")
+            text = "".join(parts)
+            if not text:
+                raise LLMResponseError(f"Empty response from {model}")
+        except LLMError as e:
+            self.capture.record("stream", model, prompt, "".join(parts) or None, error=e,
+                                duration_seconds=time.perf_counter() - start)
+            raise
+        self.capture.record("stream", model, prompt, text, duration_seconds=time.perf_counter() - start)
+        if validate is None or validate(text):
+            self.cache.set(model, prompt, text)
+
     def _generate_search_query(self, query: str) -> str:
         """Given a query, use an LLM to generate a search query that will yield better results."""
         prompt = f"""
@@ -33,64 +222,67 @@ class RecipeProvider:
         For example, instead of "pasta", use "spaghetti carbonara recipe".
         The output should be a single string, no explanations or extra text.
         """
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash-lite",
-            contents=prompt
-        )
-        return response.text.strip()
-        # For debugging
-        with open('search_query.txt', 'w') as f:
-            f.write(response.text.strip())
-
+        with stage("query_rewrite"):
+            response = self._generate_content("gemini-2.0-flash-lite", prompt)
+        return response.strip()
 
-    def _create_prompt(self, query: str, scraped_recipes_text: str) -> str:
-        """Create a prompt for Gemini based on the scraped recipes."""
-        prompt = f"""
-        I've found several recipes for "{query}". Here's the scraped information:
+    def _plan_search(self, query: str, timings: Dict[str, Any]):
+        """
+        Choose the search query, returning (search_query, links or None).
 
-        {scraped_recipes_text}
+        Specific queries are searched as typed. Otherwise the LLM rewrite runs while the
+        raw query is searched speculatively; if the rewrite doesn't arrive within
+        REWRITE_BUDGET_SECONDS (or fails, or changes nothing) the raw results are used.
+        links is None when the caller still has to search for search_query.
+        """
+        start = time.perf_counter()
+        specific, reason = self.query_classifier.classify(query)
+        timings["classification"] = reason
+        if specific:
+            timings["rewrite"] = "skipped"
+            return query, None
 
-        Based on these recipes, create a new unique recipe for "{query}" that:
-        1. Combines the best elements from these recipes
-        2. Has an accurate yet descriptive title
-        3. Includes a complete ingredient list with measurements
-        4. Provides clear step-by-step instructions
-        5. Suggests a serving size
-        6. Includes prep time and cooking time
-        7. Uses a tone that is easy to understand and descriptive
-        8. Includes appropriate tags (like 'vegetarian', 'quick', etc.)
-        9. Suggests a cuisine type if applicable
+        # Run the rewrite in a copy of this context so it keeps the request id for LLM captures
+        rewrite = get_pool("fetch").submit(contextvars.copy_context().run, self._generate_search_query, query)
+        raw_links = self.scraper._find_recipe_links(query)
+        timings["raw_search"] = round(time.perf_counter() - start, 3)
+        try:
+            search_query = rewrite.result(timeout=max(0.0, REWRITE_BUDGET_SECONDS - (time.perf_counter() - start)))
+        except FutureTimeoutError:
+            timings["rewrite"] = "timed out"
+            return query, raw_links
+        except Exception as e:
+            print(f"Query rewrite failed, using the raw query: {e}")
+            timings["rewrite"] = "failed"
+            return query, raw_links
+        timings["rewrite"] = round(time.perf_counter() - start, 3)
+        if not search_query or normalize_query(search_query) == normalize_query(query):
+            return query, raw_links
+        return search_query, None
 
-        Format the response as a valid JSON object with the following fields:
-        """
-        with open('recipe_template.json', 'r') as f:
-            template = f.read()
-        prompt += template
-        return prompt
+    def _create_prompt(self, query: str, scraped_recipes_text: str) -> str:
+        """Create a prompt for Gemini based on the scraped recipes."""
+        return self.recipe_prompt.render(query=query, scraped_recipes_text=scraped_recipes_text)
     
-    def _generate_recipe_json(self, prompt: str) -> Dict[str, Any]:
-        """Generate a recipe using Gemini and return it as JSON."""
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        response = response.text.strip()
+    def _parse_recipe_json(self, response: str) -> Dict[str, Any]:
+        """Parse Gemini's recipe text (optionally wrapped in a ```json fence) into JSON."""
+        response = response.strip()
         if response.startswith("```json"):
             response = response[7:]
         if response.endswith("```"):
             response = response[:-3]
         response = response.strip()
 
-        # For debugging
-        with open('response.json', 'w') as f:
-            f.write(response)
-            
         # Parse the response to JSON
         try:
             recipe_json = json.loads(response)
         except json.JSONDecodeError:
             raise ValueError(f"Error decoding JSON: {response}")
         return recipe_json
+
+    def _generate_recipe_json(self, prompt: str) -> Dict[str, Any]:
+        """Generate a recipe using Gemini and return it as JSON."""
+        return self._generate_content("gemini-2.0-flash", prompt, parse=self._parse_recipe_json)
     
     def generate_shopping_list(self, recipe: Dict[str, Any]) -> List[str]:
         """Generate a shopping list from the recipe JSON."""
@@ -109,71 +301,96 @@ class RecipeProvider:
         
         return shopping_list
 
-    def generate_shopping_list_from_ingredients(self, ingredients: List[str]) -> Dict[str, Any]:
+    def _resolve_ingredient_names(self, names: List[str]) -> Dict[str, Dict[str, str]]:
         """
-        Generate an organized shopping list from a list of ingredients using Gemini.
-        
+        Ask Gemini for the shopping name and category of ingredients src.shopping_list doesn't know.
+
+        Returns:
+            Dict mapping each name to {"ingredient": ..., "category": ...}
+        """
+        prompt = f"""
+        For each ingredient name below, give the plain product name a shopper would look for
+        (singular, lowercase, no preparation words) and its grocery category
+        (produce, meat & seafood, dairy & eggs, baking, pantry, oils & condiments, spices, frozen, bakery, beverages, other).
+
+        {json.dumps(names)}
+
+        Respond with only a JSON object mapping each given name to {{"ingredient": "...", "category": "..."}}.
+        """
+        def parse(response_text: str) -> Dict[str, Dict[str, str]]:
+            try:
+                resolved = self._parse_recipe_json(response_text)
+            except ValueError:
+                raise LLMResponseError("Gemini returned invalid JSON for ingredient names")
+            if not isinstance(resolved, dict) or not all(
+                isinstance(answer, dict)
+                and isinstance(answer.get("ingredient"), str)
+                and isinstance(answer.get("category"), str)
+                for answer in resolved.values()
+            ):
+                raise LLMResponseError("Gemini returned ingredient names in an unexpected shape")
+            return resolved
+
+        return self._generate_content("gemini-2.0-flash", prompt, parse=parse)
+
+    def generate_shopping_list_from_ingredients(self, ingredients: List[Union[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Generate an organized shopping list from a list of ingredients.
+
+        Duplicates are combined, grouped by category and converted to ounces locally by
+        src.shopping_list; Gemini only sees names it can't resolve. Set
+        SHOPPING_LIST_ENGINE=llm to send the whole list to Gemini instead.
+
         Args:
-            ingredients: List of ingredient strings (e.g., "2 cups butter", "1 cup milk")
-            
+            ingredients: Ingredient strings (e.g., "2 cups butter", "1 cup milk") or
+                         {"name", "amount", "unit"} dicts
+
         Returns:
             Dict containing the organized shopping list
         """
-        # Create prompt for Gemini
-        ingredients_text = "\n".join(ingredients)
-        prompt = f"""
-        I need to create a shopping list based on these ingredients from a recipe:
-        
-        {ingredients_text}
-        
-        Please organize these ingredients into a shopping list that:
-        1. Combines similar ingredients (e.g., if multiple items need milk, show the total amount)
-        2. Groups ingredients by category (produce, dairy, grains, etc.)
-        3. Do not include any extra text or explanations or superlatives - (Eg. Boneless chicken breast should just be Chicken breast)
-        4. Ensures quantities are clear and consistent
-        5. Includes both the ingredient name and total amount needed
-        6. Ingredient quantities must be given in ounces
-        7. You must convert to ounces if needed
-        
-        Format the response as a valid JSON object matching this structure:
+        if SHOPPING_LIST_ENGINE == "llm":
+            return self._generate_shopping_list_with_llm([
+                ingredient if isinstance(ingredient, str)
+                else f"{ingredient.get('amount', '')} {ingredient.get('unit', '')} {ingredient.get('name', '')}"
+                for ingredient in ingredients
+            ])
+        return self.shopping_list_engine.build(ingredients)
+
+    def _generate_shopping_list_with_llm(self, ingredients: List[str]) -> Dict[str, Any]:
         """
-        # Read the shopping list template
-        with open('shopping_list.json', 'r') as f:
-            template = f.read()
-        prompt += template
-        
-        # Generate the shopping list using Gemini
-        response = self.client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt
-        )
-        response_text = response.text.strip()
-        
-        # Clean up the response if needed
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
+        Generate an organized shopping list by sending every ingredient to Gemini.
+
+        Args:
+            ingredients: List of ingredient strings (e.g., "2 cups butter", "1 cup milk")
+
+        Returns:
+            Dict containing the organized shopping list
+        """
+        prompt = self.shopping_list_prompt.render(ingredients_text="\n".join(ingredients))
         
-        # Parse the response to JSON
-        try:
-            shopping_list_json = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If we can't parse the JSON, return a formatted error
-            raise ValueError(f"Error generating shopping list: Invalid JSON response")
-            
-        return shopping_list_json
+        def parse(response_text: str) -> Dict[str, Any]:
+            try:
+                return self._parse_recipe_json(response_text)
+            except ValueError:
+                # If we can't parse the JSON, return a formatted error
+                raise ValueError(f"Error generating shopping list: Invalid JSON response")
+
+        # Generate the shopping list using Gemini; only a reply that parses is cached
+        return self._generate_content("gemini-2.0-flash", prompt, parse=parse)
 
     def generate_recipe_for_query(self, query: str) -> Dict[str, Any]:
         """Generate a recipe for the given query using the scraper for context."""
+        cached = self.recipe_cache.get(query)
+        if cached is not None:
+            return cached
         try:
-            # Generate a more specific search query
-            search_query = self._generate_search_query(query)
-            print(f"Generated search query: {search_query}")
+            # Generate a more specific search query, unless the query already names a dish
+            timings = {}
+            search_query, links = self._plan_search(query, timings)
+            print(f"Search query: {search_query} ({timings})")
 
             # Use the recipe scraper to get detailed recipe information
-            scraped_recipes_text = self.scraper.get_recipe(search_query)
+            scraped_recipes_text = self.scraper.get_recipe(search_query, links=links)
             
             # If no recipes found, return a basic message
             if not scraped_recipes_text or "Failed to extract" in scraped_recipes_text:
@@ -183,8 +400,14 @@ class RecipeProvider:
             prompt = self._create_prompt(query, scraped_recipes_text)
             
             # Generate the recipe using the LLM
-            return self._generate_recipe_json(prompt)
+            with stage("recipe_generation"):
+                recipe_json = self._generate_recipe_json(prompt)
+            self.recipe_cache.add(query, recipe_json)
+            return recipe_json
             
+        except LLMError:
+            # Let the API report rate limits and outages as such
+            raise
         except Exception as e:
             print(f"Error generating recipe: {str(e)}")
             # Return a basic error response
@@ -196,6 +419,43 @@ class RecipeProvider:
                 }
             }
 
+    def stream_recipe_for_query(self, query: str) -> Iterator[Dict[str, Any]]:
+        """
+        Generate a recipe like generate_recipe_for_query, yielding progress events as it goes.
+
+        Events are {"event": name, "data": ...} with names, in order: search_query,
+        sources (URLs with per-URL fetch timings), generation_started, delta (one per
+        chunk of recipe text) and recipe (the parsed JSON). A failure ends the stream
+        with an error event, and a recipe cache hit skips straight to cache_hit and recipe.
+        """
+        cached = self.recipe_cache.get(query)
+        if cached is not None:
+            yield {"event": "cache_hit", "data": {}}
+            yield {"event": "recipe", "data": cached}
+            return
+        try:
+            plan_timings = {}
+            search_query, links = self._plan_search(query, plan_timings)
+            yield {"event": "search_query", "data": {"query": search_query, "timings": plan_timings}}
+
+            timings = {}
+            scraped_recipes_text = self.scraper.get_recipe(search_query, timings, links=links)
+            yield {"event": "sources", "data": {"urls": list(timings), "timings": timings}}
+
+            prompt = self._create_prompt(query, scraped_recipes_text)
+            yield {"event": "generation_started", "data": {}}
+            parts = []
+            for text in self._stream_content("gemini-2.0-flash", prompt, parse=self._parse_recipe_json):
+                parts.append(text)
+                yield {"event": "delta", "data": {"text": text}}
+
+            recipe_json = self._parse_recipe_json("".join(parts))
+            self.recipe_cache.add(query, recipe_json)
+            yield {"event": "recipe", "data": recipe_json}
+        except Exception as e:
+            print(f"Error streaming recipe: {str(e)}")
+            yield {"event": "error", "data": {"error": str(e), "type": type(e).__name__}}
+
 def main() -> None:
     # Test the recipe provider
     query = "chicken curry"
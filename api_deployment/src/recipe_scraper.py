@@ -1,63 +1,142 @@
 from googlesearch import search
-import requests
-from bs4 import BeautifulSoup
-import re
+from cachetools import TTLCache
+from concurrent.futures import wait
+from src.executor import get_pool
+from src.http_session import get_session
+from src.metrics import cache_events, stage, stage_seconds
+from src.recipe_extractor import extract_recipe
+import os
+import threading
+import time
+
+# Per-page timeout, and the overall budget for fetching all result pages of one query
+PAGE_TIMEOUT_SECONDS = float(os.getenv("RECIPE_PAGE_TIMEOUT_SECONDS", "5"))
+FETCH_DEADLINE_SECONDS = float(os.getenv("RECIPE_FETCH_DEADLINE_SECONDS", "6"))
+# Extracted recipe data is kept per URL so popular pages aren't downloaded and parsed again
+PAGE_CACHE_TTL_SECONDS = float(os.getenv("RECIPE_PAGE_CACHE_TTL_SECONDS", str(24 * 3600)))
+PAGE_CACHE_SIZE = int(os.getenv("RECIPE_PAGE_CACHE_SIZE", "1024"))
+
+_page_cache = TTLCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL_SECONDS)
+_page_cache_lock = threading.Lock()
+
+def _timed_chunks(chunks, elapsed):
+    """Yield from chunks, adding the time spent waiting for each one to elapsed[0]."""
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(iterator, None)
+        elapsed[0] += time.perf_counter() - start
+        if chunk is None:
+            return
+        yield chunk
 
 class RecipeScraper:
-    def __init__(self, num_results=5):
+    def __init__(self, num_results=5, deadline_seconds=FETCH_DEADLINE_SECONDS):
         self.num_results = num_results
+        self.deadline_seconds = deadline_seconds
     
     def _find_recipe_links(self, query):
         search_query = f"{query} recipe"
         print(f"Searching for {search_query}")
-        return list(search(search_query, num_results=self.num_results))
+        with stage("google_search"):
+            return list(search(search_query, num_results=self.num_results))
     
     def _extract_recipe_details(self, url):
         headers = {'User-Agent': 'Mozilla/5.0'}
         try:
-            response = requests.get(url, headers=headers, timeout=5)
-            soup = BeautifulSoup(response.content, 'html.parser')
-
-            # Try finding ingredients
-            ingredients = []
-            for ul in soup.find_all(['ul', 'div'], class_=re.compile("ingredient", re.I)):
-                for li in ul.find_all(['li', 'span']):
-                    text = li.get_text(strip=True)
-                    if text and len(text) > 3:
-                        ingredients.append(text)
-                if ingredients:
-                    break  # Stop if found
-
-            # Try finding instructions
-            steps = []
-            for ol in soup.find_all(['ol', 'div'], class_=re.compile("instruction|step|direction", re.I)):
-                for li in ol.find_all(['li', 'p']):
-                    text = li.get_text(strip=True)
-                    if text and len(text) > 5:
-                        steps.append(text)
-                if steps:
-                    break  # Stop if found
+            # Stream the page so parsing overlaps the download and can stop once JSON-LD is found
+            start = time.perf_counter()
+            download = [0.0]
+            with get_session().get(url, headers=headers, timeout=PAGE_TIMEOUT_SECONDS, stream=True) as response:
+                # Bot blocks (403/429) and 404s are errors, not pages without a recipe
+                response.raise_for_status()
+                encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else "utf-8"
+                recipe = extract_recipe(_timed_chunks(response.iter_content(chunk_size=16384), download), encoding or "utf-8")
+            # Parsing is interleaved with the download; report the two separately
+            stage_seconds.observe(download[0], "page_download")
+            stage_seconds.observe(time.perf_counter() - start - download[0], "html_parse")
 
             return {
                 "url": url,
-                "ingredients": ingredients,
-                "steps": steps
+                "ingredients": recipe["ingredients"],
+                "steps": recipe["steps"],
+                "method": recipe["method"]
             }
 
         except Exception as e:
             return {"url": url, "error": str(e)}
     
-    def get_recipe(self, query):
+    def _fetch_recipe_details(self, url):
+        """Return (details, timing) for a URL, from the page cache when possible."""
+        start = time.perf_counter()
+        with _page_cache_lock:
+            cached = _page_cache.get(url)
+        if cached is not None:
+            cache_events.inc("recipe_page", "hit")
+            return cached, {"seconds": round(time.perf_counter() - start, 3), "status": "cached"}
+
+        cache_events.inc("recipe_page", "miss")
+        with stage("page_fetch"):
+            result = self._extract_recipe_details(url)
+        if "error" in result:
+            status = "error"
+        elif not result["ingredients"] and not result["steps"]:
+            # Likely a consent wall or interstitial rather than the recipe itself
+            status = "empty"
+        else:
+            status = "fetched"
+        if status == "fetched":
+            # Failures and empty pages aren't cached so they get another chance on the next query
+            with _page_cache_lock:
+                _page_cache[url] = result
+        return result, {"seconds": round(time.perf_counter() - start, 3), "status": status}
+
+    def fetch_recipes(self, links, timings=None):
+        """
+        Fetch and parse recipe pages concurrently.
+
+        Waits at most deadline_seconds overall. Pages that haven't arrived by then are
+        reported as timed out, but keep downloading in the background and land in the
+        page cache for the next query.
+
+        Args:
+            links (list): Recipe page URLs
+            timings (dict, optional): Filled with {url: {"seconds", "status"}} where status is
+                                      cached, fetched, empty, error or timeout
+
+        Returns:
+            list: One result per link, in the same order
+        """
+        timings = {} if timings is None else timings
+        pool = get_pool("fetch")
+        futures = [pool.submit(self._fetch_recipe_details, link) for link in links]
+        wait(futures, timeout=self.deadline_seconds)
+
+        results = []
+        for link, future in zip(links, futures):
+            if future.done():
+                result, timing = future.result()
+            else:
+                result = {"url": link, "error": f"Timed out after {self.deadline_seconds}s"}
+                timing = {"seconds": self.deadline_seconds, "status": "timeout"}
+            timings[link] = timing
+            results.append(result)
+        return results
+
+    def get_recipe(self, query, timings=None, links=None):
         """
         Takes a recipe query string and returns a formatted string of
         recipe details including ingredients and steps.
+
+        timings, if given, is filled with per-URL fetch timings (see fetch_recipes).
+        links, if given, are the search results for query, so the search is skipped.
         """
+        timings = {} if timings is None else timings
         result_text = f"Results for: {query}\n\n"
-        links = self._find_recipe_links(query)
+        if links is None:
+            links = self._find_recipe_links(query)
         
-        for i, link in enumerate(links, 1):
-            result = self._extract_recipe_details(link)
-            
+        for i, result in enumerate(self.fetch_recipes(links, timings), 1):
             result_text += f"--- Recipe {i} ---\n"
             
             if "error" in result:
@@ -75,7 +154,8 @@ class RecipeScraper:
                 result_text += f"  {idx}. {step}\n"
             
             result_text += "\n"
-            
+        
+        print(f"Recipe page timings for {query}: {timings}")
         return result_text
 
 # # Example usage:
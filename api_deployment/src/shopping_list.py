@@ -0,0 +1,421 @@
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from scrapers.units import (
+    COUNT_UNITS, NUMBER, UNICODE_FRACTIONS, VOLUME_UNITS, WEIGHT_UNITS, normalizeUnit, parseNumber, parseQuantity,
+    toOunces,
+)
+
+# Kitchen units that aren't package sizes: (kind, amount) where volumes are in fl oz and weights in oz
+COOKING_UNITS = {
+    "c": ("volume", 8.0),
+    "pinch": ("volume", 1 / 96),
+    "pinches": ("volume", 1 / 96),
+    "dash": ("volume", 1 / 48),
+    "dashes": ("volume", 1 / 48),
+    "stick": ("weight", 4.0),
+    "sticks": ("weight", 4.0),
+    "clove": ("weight", 0.18),
+    "cloves": ("weight", 0.18),
+    "slice": ("weight", 1.0),
+    "slices": ("weight", 1.0),
+    "sprig": ("weight", 0.03),
+    "sprigs": ("weight", 0.03),
+    "bunch": ("weight", 4.0),
+    "bunches": ("weight", 4.0),
+    "head": ("count", 1),
+    "heads": ("count", 1),
+    "whole": ("count", 1),
+}
+# Containers whose size is given in parentheses, as in "1 (14 ounce) can coconut milk"
+CONTAINER_UNITS = {"can", "cans", "jar", "jars", "package", "packages", "pkg", "bag", "bags", "box", "boxes",
+                   "bottle", "bottles", "carton", "cartons", "container", "containers", "tin", "tins"}
+
+# Words describing preparation or size rather than what to buy
+DESCRIPTORS = {
+    "fresh", "freshly", "chopped", "diced", "minced", "sliced", "grated", "shredded", "crushed", "large", "medium",
+    "small", "boneless", "skinless", "finely", "roughly", "coarsely", "thinly", "organic", "ripe", "softened",
+    "melted", "cold", "warm", "hot", "room", "temperature", "peeled", "packed", "lightly", "divided", "optional",
+    "about", "plus", "more", "serving", "garnish", "taste", "to", "for", "and", "or", "cubed", "trimmed",
+    "halved", "quartered", "juiced", "zested", "rinsed", "drained", "cooked", "uncooked", "raw", "frozen",
+}
+
+# Alternative names -> the name we shop for (all singular, lowercase)
+SYNONYMS = {
+    "all-purpose flour": "flour", "all purpose flour": "flour", "ap flour": "flour", "plain flour": "flour",
+    "granulated sugar": "sugar", "white sugar": "sugar", "caster sugar": "sugar", "cane sugar": "sugar",
+    "light brown sugar": "brown sugar", "dark brown sugar": "brown sugar",
+    "confectioners sugar": "powdered sugar", "icing sugar": "powdered sugar",
+    "unsalted butter": "butter", "salted butter": "butter",
+    "scallion": "green onion", "spring onion": "green onion",
+    "coriander leaf": "cilantro", "garbanzo bean": "chickpea",
+    "kosher salt": "salt", "sea salt": "salt", "table salt": "salt",
+    "black pepper": "black pepper", "ground black pepper": "black pepper", "pepper": "black pepper",
+    "extra virgin olive oil": "olive oil", "extra-virgin olive oil": "olive oil", "evoo": "olive oil",
+    "chicken breast half": "chicken breast", "chicken thigh fillet": "chicken thigh",
+    "egg yolk": "egg", "egg white": "egg", "heavy whipping cream": "heavy cream", "whipping cream": "heavy cream",
+    "garlic clove": "garlic", "clove garlic": "garlic", "ginger root": "ginger", "fresh ginger": "ginger",
+    "lemon juice": "lemon juice", "juice of lemon": "lemon juice", "lime juice": "lime juice",
+    "soy sauce": "soy sauce", "low sodium soy sauce": "soy sauce", "vegetable stock": "vegetable broth",
+    "chicken stock": "chicken broth", "beef stock": "beef broth", "parmesan cheese": "parmesan",
+    "parmigiano reggiano": "parmesan", "shredded cheddar": "cheddar cheese", "cheddar": "cheddar cheese",
+    "baking soda": "baking soda", "bicarbonate of soda": "baking soda", "cornflour": "cornstarch",
+    "corn starch": "cornstarch", "rolled oat": "oats", "old fashioned oat": "oats", "oat": "oats",
+    "ground cinnamon": "cinnamon", "ground nutmeg": "nutmeg", "ground cumin": "cumin", "ground turmeric": "turmeric",
+    "ground white pepper": "white pepper", "crushed red pepper flake": "red pepper flake", "dried oregano": "oregano",
+    "red curry paste": "curry paste", "green curry paste": "curry paste", "jasmine rice": "rice",
+    "basmati rice": "rice", "white rice": "rice", "broccoli floret": "broccoli", "basil leaf": "basil",
+    "red bell pepper": "bell pepper", "green bell pepper": "bell pepper", "half and half": "half-and-half",
+}
+
+# Things recipes list that nobody buys
+NOT_BOUGHT = {"water", "ice water", "ice", "boiling water", "tap water"}
+
+# Shopping category of each canonical name
+CATEGORIES = {
+    "produce": [
+        "onion", "red onion", "yellow onion", "green onion", "shallot", "garlic", "ginger", "carrot", "celery",
+        "potato", "sweet potato", "tomato", "cherry tomato", "bell pepper", "jalapeno", "cucumber", "zucchini",
+        "eggplant", "broccoli", "cauliflower", "spinach", "kale", "lettuce", "cabbage", "mushroom", "corn", "pea",
+        "green bean", "avocado", "lemon", "lime", "orange", "apple", "banana", "strawberry", "blueberry",
+        "raspberry", "pineapple", "mango", "cilantro", "parsley", "basil", "mint", "thyme", "rosemary", "dill",
+        "lemon juice", "lime juice", "orange juice", "orange zest", "lemon zest",
+    ],
+    "meat & seafood": [
+        "chicken breast", "chicken thigh", "chicken", "ground beef", "beef", "beef steak", "pork chop", "pork",
+        "bacon", "sausage", "ground turkey", "turkey", "lamb", "salmon", "shrimp", "tuna", "cod", "tilapia",
+    ],
+    "dairy & eggs": [
+        "milk", "whole milk", "butter", "egg", "heavy cream", "sour cream", "cream cheese", "yogurt",
+        "greek yogurt", "cheddar cheese", "mozzarella", "parmesan", "feta", "ricotta", "buttermilk", "cream",
+        "half-and-half",
+    ],
+    "baking": [
+        "flour", "bread flour", "sugar", "brown sugar", "powdered sugar", "baking soda", "baking powder",
+        "cornstarch", "vanilla extract", "cocoa powder", "chocolate chip", "yeast", "honey", "maple syrup",
+    ],
+    "pantry": [
+        "rice", "pasta", "spaghetti", "noodle", "quinoa", "couscous", "lentil", "chickpea", "black bean",
+        "white bean", "kidney bean", "oats", "bread", "tortilla", "breadcrumb", "coconut milk", "tomato paste",
+        "diced tomato", "crushed tomato", "tomato sauce", "chicken broth", "beef broth", "vegetable broth",
+        "peanut butter", "tofu", "sesame seed", "almond", "walnut", "pecan",
+    ],
+    "oils & condiments": [
+        "olive oil", "vegetable oil", "canola oil", "sesame oil", "coconut oil", "soy sauce", "fish sauce",
+        "rice vinegar", "vinegar", "apple cider vinegar", "balsamic vinegar", "mustard", "dijon mustard",
+        "ketchup", "mayonnaise", "hot sauce", "curry paste", "worcestershire sauce", "sriracha",
+    ],
+    "spices": [
+        "salt", "black pepper", "white pepper", "red pepper flake", "cumin", "paprika", "smoked paprika",
+        "chili powder", "cinnamon", "nutmeg", "oregano", "turmeric", "curry powder", "garam masala",
+        "garlic powder", "onion powder", "cayenne pepper", "bay leaf", "ground ginger", "italian seasoning",
+    ],
+}
+CATEGORY_OF = {name: category for category, names in CATEGORIES.items() for name in names}
+# Fallback on the last word for names not listed above ("pepper jack cheese" -> dairy & eggs)
+KEYWORD_CATEGORIES = {
+    "cheese": "dairy & eggs", "milk": "dairy & eggs", "oil": "oils & condiments", "vinegar": "oils & condiments",
+    "sauce": "oils & condiments", "bean": "pantry", "broth": "pantry", "stock": "pantry", "pasta": "pantry",
+    "rice": "pantry", "flour": "baking", "sugar": "baking", "extract": "baking", "powder": "spices",
+    "seasoning": "spices", "steak": "meat & seafood", "fillet": "meat & seafood", "pepper": "produce",
+    "berry": "produce", "lettuce": "produce", "squash": "produce", "juice": "produce", "seed": "pantry",
+    "nut": "pantry", "noodle": "pantry",
+}
+
+# Weight in ounces of one cup, for converting recipe volumes to the weights products are sold by.
+# Anything missing is treated like water (8.3 oz per cup).
+OUNCES_PER_CUP = {
+    "flour": 4.25, "bread flour": 4.5, "sugar": 7.05, "brown sugar": 7.5, "powdered sugar": 4.0,
+    "butter": 8.0, "milk": 8.6, "whole milk": 8.6, "heavy cream": 8.2, "sour cream": 8.5, "yogurt": 8.6,
+    "greek yogurt": 8.8, "water": 8.3, "olive oil": 7.6, "vegetable oil": 7.7, "canola oil": 7.7,
+    "sesame oil": 7.6, "coconut oil": 7.7, "honey": 12.0, "maple syrup": 11.0, "rice": 6.5, "oats": 3.2,
+    "quinoa": 6.0, "couscous": 6.1, "lentil": 6.7, "salt": 10.2, "black pepper": 4.1, "white pepper": 4.2,
+    "cornstarch": 4.5, "baking soda": 7.6, "baking powder": 6.8, "cocoa powder": 3.0, "cinnamon": 4.6,
+    "nutmeg": 4.0, "paprika": 4.1, "cumin": 3.4, "curry powder": 3.5, "chili powder": 4.2,
+    "red pepper flake": 3.2, "soy sauce": 9.0, "rice vinegar": 8.4, "vinegar": 8.4, "chocolate chip": 6.0,
+    "cheddar cheese": 4.0, "mozzarella": 4.0, "parmesan": 3.5, "sesame seed": 5.1, "breadcrumb": 3.8,
+    "peanut butter": 9.5, "ketchup": 9.5, "mayonnaise": 8.1, "lemon juice": 8.6, "lime juice": 8.6,
+    "orange juice": 8.8, "chicken broth": 8.5, "beef broth": 8.5, "vegetable broth": 8.5,
+    "cilantro": 0.6, "parsley": 0.6, "basil": 0.8, "spinach": 1.1, "green onion": 3.5, "orange zest": 3.4,
+    "ginger": 3.4, "garlic": 4.8, "broccoli": 3.2, "blueberry": 5.2, "fish sauce": 9.4, "curry paste": 9.0,
+}
+WATER_OUNCES_PER_CUP = 8.3
+
+# Typical weight in ounces of one item, for recipes that count things ("2 eggs", "1 onion")
+OUNCES_PER_ITEM = {
+    "egg": 1.76, "onion": 7.0, "red onion": 7.0, "yellow onion": 7.0, "shallot": 1.5, "garlic": 0.18,
+    "carrot": 2.5, "celery": 1.4, "potato": 7.5, "sweet potato": 7.0, "tomato": 4.3, "bell pepper": 6.0,
+    "jalapeno": 0.5, "cucumber": 10.0, "zucchini": 7.0, "lemon": 3.5, "lime": 2.4, "orange": 5.0,
+    "apple": 6.5, "banana": 4.2, "avocado": 7.0, "green onion": 0.5, "chicken breast": 8.0,
+    "chicken thigh": 4.5, "pork chop": 7.0, "tortilla": 1.5, "bay leaf": 0.005,
+}
+
+_NUMBER_PATTERN = re.compile(rf"^\s*(?P<amount>{NUMBER})(?:\s*(?:-|to)\s*{NUMBER})?\s*")
+# "Juice of 2 limes" and "zest of a lemon" mean buying the fruit
+_JUICE_OF_PATTERN = re.compile(
+    rf"^(?:the\s+)?(?:juice|zest)(?:\s+and\s+(?:juice|zest))?\s+of\s+(?:(?P<amount>{NUMBER})|(?P<one>an?|one))\s+"
+)
+_PAREN_PATTERN = re.compile(r"^\((?P<size>[^)]*)\)\s*")
+_unit_names = sorted(
+    set(WEIGHT_UNITS) | set(VOLUME_UNITS) | set(COUNT_UNITS) | set(COOKING_UNITS) | CONTAINER_UNITS,
+    key=len, reverse=True,
+)
+_UNIT_PATTERN = re.compile(
+    r"^(?P<unit>" + "|".join(re.escape(name).replace(r"\ ", r"\s*") for name in _unit_names) + r")\.?(?![a-z])\s*"
+)
+
+
+def parse_ingredient_line(line: str) -> Dict[str, Any]:
+    """Split "1 1/2 cups all-purpose flour, sifted" into amount, unit, name and container size (oz)."""
+    text = line.strip().lower()
+    for fraction, replacement in UNICODE_FRACTIONS.items():
+        text = text.replace(fraction, replacement)
+    amount, unit, container_ounces = None, "", None
+
+    juice_of = _JUICE_OF_PATTERN.match(text)
+    if juice_of:
+        amount = parseNumber(juice_of.group("amount")) if juice_of.group("amount") else 1.0
+        return {"name": text[juice_of.end():], "amount": amount, "unit": "", "container_ounces": None}
+
+    number = _NUMBER_PATTERN.match(text)
+    if number:
+        amount = parseNumber(number.group("amount"))
+        text = text[number.end():]
+    paren = _PAREN_PATTERN.match(text)
+    if paren:
+        container_ounces = parseQuantity(paren.group("size"))["ounces"]
+        text = text[paren.end():]
+    unit_match = _UNIT_PATTERN.match(text)
+    if unit_match and text[unit_match.end():].strip():
+        unit = normalizeUnit(unit_match.group("unit"))
+        text = text[unit_match.end():]
+        # The size can also follow the container: "2 cans (15 oz) black beans"
+        paren = _PAREN_PATTERN.match(text) if unit in CONTAINER_UNITS and container_ounces is None else None
+        if paren:
+            container_ounces = parseQuantity(paren.group("size"))["ounces"]
+            text = text[paren.end():]
+    return {"name": text, "amount": amount, "unit": unit, "container_ounces": container_ounces}
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("leaves", "loaves", "halves")):
+        return word[:-3] + "f"
+    if word.endswith("oes") or word.endswith("ches") or word.endswith("shes") or word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "oats")) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _known_name(words: List[str]) -> Optional[str]:
+    """The canonical name for a phrase listed in SYNONYMS or CATEGORY_OF (last word singularized), or None."""
+    phrase = " ".join(words[:-1] + [_singular(words[-1])])
+    if phrase in SYNONYMS:
+        return SYNONYMS[phrase]
+    return phrase if phrase in CATEGORY_OF else None
+
+
+def _name_words(name: str) -> List[str]:
+    name = re.sub(r"\([^)]*\)", " ", name.lower())
+    return re.findall(r"[a-z][a-z'-]*", name.split(",")[0])
+
+
+def canonical_name(name: str) -> str:
+    """Reduce an ingredient name to the product we shop for: "2 large Eggs, beaten" -> "egg"."""
+    all_words = _name_words(name)
+    # Known multi-word names ending the phrase win before descriptors are dropped, since
+    # some descriptors are part of the product ("diced tomato", "juice of lemon")
+    for start in range(max(0, len(all_words) - 2) + 1):
+        known = _known_name(all_words[start:])
+        if known is not None:
+            return known
+    words = [word for word in all_words if word not in DESCRIPTORS]
+    # "of" only goes when it joins a quantity to the name ("a pinch of salt"), not in "cream of mushroom soup"
+    while words and words[0] == "of":
+        words.pop(0)
+    if not words:
+        return ""
+    words[-1] = _singular(words[-1])
+    name = " ".join(words)
+    return SYNONYMS.get(name, name)
+
+
+def split_ingredient(name: str) -> List[str]:
+    """
+    Split "salt and pepper" into the items to buy, ["salt", "pepper"].
+
+    Only splits when every part is a known ingredient, so "half and half" and
+    "sweet and sour sauce" stay whole.
+    """
+    words = _name_words(name)
+    if "and" not in words or _known_name(words) is not None:
+        return [name]
+    parts, current = [], []
+    for word in words:
+        if word == "and":
+            parts.append(current)
+            current = []
+        else:
+            current.append(word)
+    parts.append(current)
+    names = [" ".join(part) for part in parts]
+    if all(part and canonical_name(part) in CATEGORY_OF for part in names):
+        return names
+    return [name]
+
+
+def category_of(name: str) -> Optional[str]:
+    category = CATEGORY_OF.get(name)
+    if category is None and name:
+        category = KEYWORD_CATEGORIES.get(name.split()[-1])
+    return category
+
+
+def ounces_for(name: str, amount: Optional[float], unit: str, container_ounces: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+    """
+    Convert a recipe amount to ounces by weight.
+
+    Returns:
+        tuple: (ounces or None, leftover item count or None when it couldn't be weighed)
+    """
+    unit = normalizeUnit(unit or "")
+    if amount is None and not container_ounces:
+        # "Salt to taste": keep the item on the list without adding to its total
+        return None, None
+    amount = 1.0 if amount is None else amount
+    if container_ounces and (unit in CONTAINER_UNITS or not unit):
+        return amount * container_ounces, None
+    if unit in WEIGHT_UNITS:
+        return toOunces(amount, unit), None
+    kind, size = COOKING_UNITS.get(unit, (None, None))
+    if unit in VOLUME_UNITS or kind == "volume":
+        fluid_ounces = toOunces(amount, unit) if unit in VOLUME_UNITS else amount * size
+        return fluid_ounces / 8 * OUNCES_PER_CUP.get(name, WATER_OUNCES_PER_CUP), None
+    if kind == "weight":
+        return amount * size, None
+    count = amount * COUNT_UNITS.get(unit, 1)
+    if name in OUNCES_PER_ITEM:
+        return count * OUNCES_PER_ITEM[name], None
+    return None, count
+
+
+def _format_quantity(ounces: float, count: float) -> str:
+    parts = []
+    if ounces:
+        parts.append(f"{round(ounces, 2):g} oz")
+    if count:
+        parts.append(f"{round(count, 2):g} count")
+    return " + ".join(parts) or "to taste"
+
+
+class ShoppingListEngine:
+    """
+    Builds the shopping list locally: parse quantities, canonicalize names through
+    SYNONYMS, convert to ounces (OUNCES_PER_CUP / OUNCES_PER_ITEM) and sum duplicates.
+
+    Only names with no known category are passed to resolve_names (Gemini, in
+    RecipeProvider), and its answers are remembered for the life of the process.
+    """
+
+    def __init__(self, resolve_names: Optional[Callable[[List[str]], Dict[str, Dict[str, str]]]] = None):
+        """
+        Args:
+            resolve_names: Maps unknown names to {"ingredient": canonical name, "category": category}
+        """
+        self.resolve_names = resolve_names
+        self._resolved: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, names: Iterable[str]) -> None:
+        with self._lock:
+            missing = sorted({name for name in names if name not in self._resolved})
+        if not missing or self.resolve_names is None:
+            return
+        try:
+            resolved = self.resolve_names(missing)
+        except Exception as e:
+            print(f"Could not resolve ingredient names {missing}: {e}")
+            return
+        with self._lock:
+            for name in missing:
+                answer = resolved.get(name)
+                if not isinstance(answer, dict):
+                    answer = {}
+                canonical = canonical_name(str(answer.get("ingredient") or name)) or name
+                self._resolved[name] = {
+                    "ingredient": canonical,
+                    "category": category_of(canonical) or str(answer.get("category") or "other").lower(),
+                }
+
+    def build(self, ingredients: Iterable[Union[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Aggregate ingredient lines or {"name", "amount", "unit"} dicts into a shopping list.
+
+        Returns:
+            dict: {"shopping_list": [{"ingredient", "quantity", "category", "ounces"}]} in the
+                  shape of shopping_list.json, grouped by category
+        """
+        parsed = []
+        for ingredient in ingredients:
+            if isinstance(ingredient, str):
+                item = parse_ingredient_line(ingredient)
+            else:
+                item = {"name": ingredient.get("name", ""), "amount": ingredient.get("amount"),
+                        "unit": ingredient.get("unit") or "", "container_ounces": None}
+                if isinstance(item["amount"], str):
+                    item.update({key: value for key, value in parse_ingredient_line(f"{item['amount']} {item['unit']} x").items()
+                                 if key in ("amount", "container_ounces")})
+            for name in split_ingredient(item["name"]):
+                part = dict(item, name=name, canonical=canonical_name(name))
+                if part["canonical"] and part["canonical"] not in NOT_BOUGHT:
+                    parsed.append(part)
+
+        self._resolve(item["canonical"] for item in parsed if category_of(item["canonical"]) is None)
+
+        totals: Dict[str, Dict[str, Any]] = {}
+        for item in parsed:
+            name, category = item["canonical"], category_of(item["canonical"])
+            if category is None:
+                resolved = self._resolved.get(name, {"ingredient": name, "category": "other"})
+                name, category = resolved["ingredient"], resolved["category"]
+            ounces, count = ounces_for(name, item["amount"], item["unit"], item["container_ounces"])
+            total = totals.setdefault(name, {"category": category, "ounces": 0.0, "count": 0.0})
+            total["ounces"] += ounces or 0.0
+            total["count"] += count or 0.0
+
+        shopping_list = [
+            {
+                "ingredient": name[:1].upper() + name[1:],
+                "quantity": _format_quantity(total["ounces"], total["count"]),
+                "category": total["category"].title(),
+                "ounces": round(total["ounces"], 2) if total["ounces"] else None,
+            }
+            for name, total in sorted(totals.items(), key=lambda item: (item[1]["category"], item[0]))
+        ]
+        return {"shopping_list": shopping_list}
+
+
+
+if __name__ == "__main__":
+    import json
+    import os
+
+    # Regression corpus of recipe lines: python -m src.shopping_list
+    corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shopping_list_corpus.json")
+    with open(corpus_path, "r") as f:
+        corpus = json.load(f)
+
+    engine = ShoppingListEngine()
+    failures = 0
+    for case in corpus:
+        items = [
+            {key: item[key] for key in ("ingredient", "category", "quantity")}
+            for item in engine.build([case["text"]])["shopping_list"]
+        ]
+        if items != case["items"]:
+            failures += 1
+            print(f"MISMATCH {case['text']!r}: expected {case['items']}, got {items}")
+    print(f"Corpus: {len(corpus) - failures}/{len(corpus)} ingredient lines aggregated as expected")
@@ -0,0 +1,186 @@
+import os
+import string
+import threading
+import time
+from typing import Any, Dict, Optional
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Re-read template files when they change on disk (for development; templates are read once otherwise)
+TEMPLATE_RELOAD = os.getenv("TEMPLATE_RELOAD", "0") == "1"
+# How often, at most, a template file is stat'ed for changes when TEMPLATE_RELOAD is on
+RELOAD_CHECK_SECONDS = float(os.getenv("TEMPLATE_RELOAD_CHECK_SECONDS", "1"))
+# Rough characters per token for Gemini models, for prompt budgets without a network call
+CHARS_PER_TOKEN = 4
+
+# Template files, relative to the package root, so imports and requests work from any working directory
+TEMPLATE_FILES = {
+    "recipe": "recipe_template.json",
+    "shopping_list": "shopping_list.json",
+    "scraping_interface": os.path.join("scrapers", "scrapingInterface.json"),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of tokens Gemini will count for text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class TemplateFile:
+    """The contents of one template file, with its modification time and token estimate."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.text = ""
+        self.mtime = 0.0
+        self.tokens = 0
+        self.checked_at = 0.0
+        self.version = 0
+        self.load()
+
+    def load(self) -> None:
+        with open(self.path, "r") as f:
+            self.text = f.read()
+        self.mtime = os.stat(self.path).st_mtime
+        self.tokens = estimate_tokens(self.text)
+        self.checked_at = time.monotonic()
+        self.version += 1
+
+    def changed(self) -> bool:
+        self.checked_at = time.monotonic()
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            # Keep serving the last good copy while an editor replaces the file
+            return False
+
+
+class Prompt:
+    """
+    A prompt made of per-request instructions followed by a template file.
+
+    The instructions are parsed into literal text and {fields} once, and the text
+    after the last field is joined with the template ahead of time, so rendering a
+    request only fills in its fields. static_tokens is the estimated size of
+    everything but the fields.
+    """
+
+    def __init__(self, registry: "TemplateRegistry", instructions: str, template: str):
+        self.registry = registry
+        self.instructions = instructions
+        self.template = template
+        self._parts = list(string.Formatter().parse(instructions))
+        for _, field, spec, conversion in self._parts:
+            if field is not None and (spec or conversion or not field.isidentifier()):
+                raise ValueError(f"Prompt fields must be plain names, got {{{field}}}")
+        self._compiled_version = None
+        self._compile()
+
+    def _compile(self) -> None:
+        template = self.registry.get(self.template)
+        pieces = []
+        for literal, field, _, _ in self._parts:
+            if field is None:
+                pieces.append(literal)
+            else:
+                pieces.extend([literal, field])
+        # Odd positions are field names; the trailing literal absorbs the template text
+        if len(pieces) % 2:
+            pieces[-1] += template.text
+        else:
+            pieces.append(template.text)
+        self._pieces = pieces
+        self.static_tokens = estimate_tokens("".join(pieces[::2]))
+        self._compiled_version = template.version
+
+    def render(self, **values: Any) -> str:
+        if self.registry.get(self.template).version != self._compiled_version:
+            self._compile()
+        pieces = self._pieces
+        return "".join(
+            piece if index % 2 == 0 else str(values[piece]) for index, piece in enumerate(pieces)
+        )
+
+
+class TemplateRegistry:
+    """
+    Loads the prompt template files once and keeps them in memory.
+
+    Paths are resolved against the package root. With reload on (TEMPLATE_RELOAD=1),
+    a file whose modification time changed is re-read, checking at most every
+    RELOAD_CHECK_SECONDS; otherwise nothing touches the disk after the first load.
+    """
+
+    def __init__(self, files: Dict[str, str] = TEMPLATE_FILES, root: str = PACKAGE_ROOT, reload: bool = TEMPLATE_RELOAD):
+        self.files = {name: os.path.join(root, path) for name, path in files.items()}
+        self.reload = reload
+        self._templates: Dict[str, TemplateFile] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> TemplateFile:
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = self._templates[name] = TemplateFile(self.files[name])
+        elif self.reload and time.monotonic() - template.checked_at >= RELOAD_CHECK_SECONDS:
+            with self._lock:
+                if template.changed():
+                    print(f"Reloading prompt template {name} from {template.path}")
+                    template.load()
+        return template
+
+    def text(self, name: str) -> str:
+        return self.get(name).text
+
+    def prompt(self, instructions: str, template: str) -> Prompt:
+        """Compile instructions that end with the named template file into a Prompt."""
+        return Prompt(self, instructions, template)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"path": template.path, "tokens": template.tokens, "version": template.version}
+            for name, template in self._templates.items()
+        }
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_templates() -> TemplateRegistry:
+    """Return the process-wide template registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry()
+        return _registry
+
+
+if __name__ == "__main__":
+    # Prompt token budgets and render cost: python -m src.templates
+    from src.recipe_provider import RECIPE_PROMPT, SHOPPING_LIST_PROMPT
+
+    registry = get_templates()
+    prompts = {
+        "recipe": registry.prompt(RECIPE_PROMPT, "recipe"),
+        "shopping_list": registry.prompt(SHOPPING_LIST_PROMPT, "shopping_list"),
+    }
+    for name, stats in registry.stats().items():
+        print(f"{name:20} {stats['tokens']:6} tokens  {stats['path']}")
+    for name, prompt in prompts.items():
+        print(f"{name + ' prompt':20} {prompt.static_tokens:6} static tokens")
+
+    values = {"query": "chicken curry", "scraped_recipes_text": "x" * 4000}
+    runs = 10000
+    start = time.perf_counter()
+    for _ in range(runs):
+        with open(registry.files["recipe"], "r") as f:
+            RECIPE_PROMPT.format(**values) + f.read()
+    opened = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(runs):
+        prompts["recipe"].render(**values)
+    rendered = (time.perf_counter() - start) / runs
+    print(f"Recipe prompt: open per request {opened * 1e6:.1f} us, registry {rendered * 1e6:.1f} us")
@@ -33,27 +33,24 @@ ingredients = [
     "Sesame Seeds"
 ]
 
+# Price every ingredient in one request; anything not stored yet is scraped for this zip code
+response = requests.post(
+    "http://localhost:8001/ingredients/bulk",
+    json={
+        "ingredients": [{"name": ingredient, "amount": 1.0, "unit": "ounces"} for ingredient in ingredients],
+        "zip_code": "47906"
+    }
+)
+result = response.json()
+
 final_ingredients = {
     "kroger": {},
     "target": {}
 }
 
-for ingredient in ingredients:
-    response = requests.get(
-        "http://localhost:8001/ingredients", 
-        json={
-            "ingredient": ingredient,
-            "amount": 1.0,
-            "unit": "ounces"
-        }
-    )
-    result = response.json()
-    
-    # Store Target data if available
-    if "Target" in result:
-        final_ingredients["target"][ingredient] = result["Target"]
-        print(f"Item found in Target: {ingredient}")
-        pass
-    else:
-        response = requests.post("http://localhost:8001/scrapeIngredients", json={"product_name": ingredient, "zip_code": "47906"})
-        print(response.json())
\ No newline at end of file
+for item in result["ingredients"]:
+    for provider, product in item["products"].items():
+        final_ingredients.setdefault(provider.lower(), {})[item["name"]] = product
+
+print(f"Basket totals: {result['totals']}")
+print(f"Not found: {result['missing']}")